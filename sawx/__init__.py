@@ -1,3 +1,7 @@
+# must be first so all other imports can be timed
+from .utils import importreport
+importreport.install_from_environment()
+
 from ._metadata import __author__, __author_email__, __url__, __download_url__, __bug_report_url__
 
 try:
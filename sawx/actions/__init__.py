@@ -1,13 +1,10 @@
 import time
 
 import wx
-import wx.lib.inspection
 
 from ..action import SawxAction, SawxNameChangeAction, SawxListAction
 from ..persistence import iter_templates
 from ..ui.dialogs import prompt_for_dec, get_file_dialog_wildcard
-from ..ui.prefs_dialog import PreferencesDialog
-from ..ui.error_logger import show_logging_frame
 from .. import errors
 
 import logging
@@ -307,6 +304,7 @@ class show_debug_log(SawxAction):
         return "View Error Log"
 
     def perform(self, action_key):
+        from ..ui.error_logger import show_logging_frame
         show_logging_frame()
 
 class widget_inspector(SawxAction):
@@ -314,6 +312,7 @@ class widget_inspector(SawxAction):
         return "View Widget Inspector"
 
     def perform(self, action_key):
+        import wx.lib.inspection
         wx.lib.inspection.InspectionTool().Show()
 
 class show_focus(SawxAction):
@@ -1,11 +1,11 @@
 """ Simple menubar & tabbed window framework
 """
+import sys
 import time
 import argparse
 import collections
 
 import wx
-import wx.adv
 
 from .frame import SawxFrame
 from .editor import get_editors, find_editor_class_by_id
@@ -13,10 +13,8 @@ from .filesystem import init_filesystems
 from .filesystem import fsopen as open
 from . import persistence
 from .events import EventHandler
-from .ui import error_logger
-from .ui.prefs_dialog import PreferencesDialog
-from .utils.background_http import BackgroundHttpDownloader
 from . import errors
+from .utils import importreport
 from .preferences import find_application_preferences
 
 import logging
@@ -101,8 +99,8 @@ class SawxApp(wx.App):
         self.keybindings_changed_event = EventHandler(self)
         self.init_subprocesses()
 
-        # Initialize dialog-based exception handler
-        from .ui import exception_handler
+        # Dialog-based exception handler, imported on the first exception
+        sys.excepthook = deferred_exception_hook
 
         # Initialize dialog-based progress logger
         from .ui import progress_dialog
@@ -121,6 +119,7 @@ class SawxApp(wx.App):
 
     def OnExit(self):
         persistence.remember_for_next_time(self.remember)
+        persistence.close_config_store()
         self.shutdown_subprocesses()
         return wx.App.OnExit(self)
 
@@ -137,6 +136,7 @@ class SawxApp(wx.App):
             for e in get_editors:
                 print(f"{e.editor_id}: {e.ui_name}")
         if options.debug_loggers:
+            from .ui import error_logger
             for logger_name in options.debug_loggers:
                 error_logger.enable_loggers(logger_name[0])
         task_arguments = collections.OrderedDict()
@@ -174,6 +174,7 @@ class SawxApp(wx.App):
     def done_with_bootup(cls):
         log.debug("done_with_bootup")
         cls.in_bootup_process = False
+        importreport.report_startup()
 
     def MacOpenFiles(self, filenames):
         """OSX specific routine to handle files that are dropped on the icon
@@ -353,6 +354,7 @@ class SawxApp(wx.App):
         SawxAboutDialog.show_or_raise()
 
     def show_preferences_dialog(self, parent, page_name=None):
+        from .ui.prefs_dialog import PreferencesDialog
         dialog = PreferencesDialog(parent, page_name)
         dialog.ShowModal()
 
@@ -391,10 +393,17 @@ class SawxApp(wx.App):
 
     def get_downloader(self):
         if self.downloader is None:
+            from .utils.background_http import BackgroundHttpDownloader
             self.downloader = BackgroundHttpDownloader()
         return self.downloader
 
 
+def deferred_exception_hook(exctype, value, trace):
+    # importing the module replaces sys.excepthook with its own handler
+    from .ui import exception_handler
+    exception_handler.ExceptionHook(exctype, value, trace)
+
+
 def restore_from_last_time():
     log.debug("Restoring window sizes")
     cls = wx.GetApp().__class__
@@ -2,17 +2,24 @@ import os
 import types
 import io as BytesIO
 import uuid
+import shutil
+import weakref
+import tempfile
 
 import numpy as np
-import jsonpickle
 
 # Enthought library imports.
 from .events import EventHandler
 from .utils.command import UndoStack
-from .utils import jsonutil
+from .utils import sessionfile
+from .utils.sessionfile import SessionFile
 from .utils.nputil import to_numpy
+from .utils.sortutil import RangeSet
 from .utils.pyutil import get_plugins
-from .persistence import get_template
+from .utils.jobs import start_thread_job
+from .utils.savefile import SaveSnapshot, SaveJob, PatchSnapshot, PatchSaveJob, CompressedSaveJob, write_atomic, recover_journal
+from .utils.compressedfs import compression_of_path
+from .persistence import get_default_session
 from . import filesystem
 from .filesystem import fsopen as open
 from . import errors
@@ -55,6 +62,19 @@ class SawxDocument:
 
     session_save_file_extension = ""
 
+    # Files on the local filesystem at least this size are memory mapped
+    # (copy-on-write, so the file itself is never modified by editing) rather
+    # than being read into memory. None (the default) disables memory mapping;
+    # document classes that can work with a mapped file opt in by setting it.
+    memory_map_threshold = None
+
+    # Saving back to the same file when its size hasn't changed only writes
+    # the modified ranges (the index_range of each command that changed byte
+    # values, or those marked by prepare_to_change), as long as they are no
+    # more than this fraction of the file. None always writes the whole file,
+    # which documents whose saved bytes aren't the same as raw_data must use.
+    max_patch_fraction = 0.25
+
     def __init__(self, file_metadata):
         self.undo_stack = UndoStack()
         self.extra_metadata = {}
@@ -63,6 +83,8 @@ class SawxDocument:
         self.change_count = 0
         self.permute = None
         self.baseline_document = None
+        self.save_job = None
+        self.save_snapshots = []
 
         # events
         self.recalc_event = EventHandler(self)
@@ -71,18 +93,66 @@ class SawxDocument:
 
         self.byte_style_changed_event = EventHandler(self)  # only styling info may have changed, not any of the data byte values
 
+        self._line_stats = None
+        self.structure_changed_event += self.invalidate_line_stats
+        self.byte_values_changed_event += self.invalidate_line_stats
+        self.structure_changed_event += self.invalidate_saved_file_info
+
     def load(self, file_metadata):
         if file_metadata is None:
             self.create_empty()
         else:
             self.file_metadata = file_metadata
+            self.recover_interrupted_save()
             raw = self.load_raw_data()
             self.raw_data = self.calc_raw_data(raw)
+            self.modified_ranges = RangeSet()
+            self.record_saved_file_info(self.raw_data)
             self.load_session()
 
     def load_raw_data(self):
-        fh = open(self.uri, 'rb')
-        return fh.read()
+        if self.file_metadata.get('compression'):
+            fh = open(self.uri, 'rb', decompress=True)
+        else:
+            data = self.memory_map_raw_data()
+            if data is not None:
+                return data
+            fh = open(self.uri, 'rb')
+        return self.read_raw_data(fh)
+
+    def memory_map_raw_data(self):
+        if self.memory_map_threshold is None:
+            return None
+        try:
+            path = self.filesystem_path()
+            size = os.path.getsize(path)
+        except OSError:
+            return None
+        if size == 0 or size < self.memory_map_threshold:
+            return None
+        log.debug(f"memory mapping {path}, {size} bytes")
+        return np.memmap(path, dtype=np.uint8, mode="c")
+
+    def read_raw_data(self, fh):
+        """Read the data from a file that can't be memory mapped directly
+        (e.g. compressed or remote files), into an (unlinked) temporary file
+        that's memory mapped if it's at least memory_map_threshold bytes.
+
+        The size isn't found by seeking to the end first because that would
+        decompress a compressed file twice.
+        """
+        if self.memory_map_threshold is None:
+            return fh.read()
+        head = fh.read(max(self.memory_map_threshold, 1))
+        if not head or len(head) < self.memory_map_threshold:
+            return head
+        with tempfile.TemporaryFile() as temp:
+            temp.write(head)
+            shutil.copyfileobj(fh, temp, 1024 * 1024)
+            temp.flush()
+            size = temp.tell()
+            log.debug(f"copied {self.uri} to memory mapped file, {size} bytes")
+            return np.memmap(temp, dtype=np.uint8, mode="c", shape=(size,))
 
     def calc_raw_data(self, raw):
         return to_numpy(raw)
@@ -90,6 +160,8 @@ class SawxDocument:
     def create_empty(self):
         self.raw_data = np.zeros(0, dtype=np.uint8)
         self.file_metadata = {'uri': '', 'mime': "application/octet-stream"}
+        self.modified_ranges = RangeSet()
+        self.record_saved_file_info(None)
 
     @property
     def can_revert(self):
@@ -162,6 +234,55 @@ class SawxDocument:
     def bytestream(self):
         return BytesIO.BytesIO(self.raw_data)
 
+    #### expression search
+
+    def iter_expression_matches(self, expression, chunk_size=None, num_threads=None):
+        """Generator yielding RangeSets of the indexes of bytes where the
+        expression is true, in order, one for each chunk of the document.
+
+        The byte values are available to the expression as the variable `a`,
+        e.g. "(a & 7) > 3". Chunks are evaluated in parallel on a pool of
+        threads (`num_threads` of None uses one per CPU) so large documents,
+        including memory mapped ones, are processed without creating
+        document-sized temporary arrays.
+        """
+        from .utils.parseutil import compile_expression, NumpyIntExpression
+
+        compiled = compile_expression(NumpyIntExpression, expression)
+        vars_ = {"a": self.raw_data}
+        yield from compiled.iter_match_ranges(vars_, chunk_size, num_threads)
+
+    def calc_expression_matches(self, expression, chunk_size=None, num_threads=None):
+        """Return a RangeSet of all the indexes where the expression is true,
+        suitable for HexTable.set_selected_ranges.
+        """
+        starts = []
+        ends = []
+        for ranges in self.iter_expression_matches(expression, chunk_size, num_threads):
+            starts.append(ranges.starts)
+            ends.append(ranges.ends)
+        if not starts:
+            return RangeSet()
+        # ranges from adjacent chunks may touch, so these must be normalized
+        return RangeSet.from_arrays(np.concatenate(starts), np.concatenate(ends))
+
+    #### line statistics
+
+    @property
+    def line_stats(self):
+        """LineStats (line offsets, indentation) of the document data,
+        calculated on first use and kept until the data is changed
+        """
+        cached = self._line_stats
+        if cached is None or cached[0] is not self.raw_data:
+            from .utils.textutil import LineStats
+            cached = (self.raw_data, LineStats(self.raw_data))
+            self._line_stats = cached
+        return cached[1]
+
+    def invalidate_line_stats(self, evt=None):
+        self._line_stats = None
+
     # serialization
 
     def load_session(self):
@@ -172,17 +293,8 @@ class SawxDocument:
         self.restore_session(d)
 
     def calc_default_session(self):
-        mime = self.mime
-        log.debug(f"calc_default_session: looking for {mime}")
-        try:
-            text = get_template(mime)
-            log.debug(f"calc_default_template: found template for {mime}")
-        except OSError:
-            log.debug(f"calc_default_template: no template for {mime}")
-            e = {}
-        else:
-            e = jsonutil.unserialize(mime, text)
-        return e
+        # the template is only found and decoded the first time it's needed
+        return get_default_session(self.mime)
 
     def load_last_session(self):
         session_info = {}
@@ -197,7 +309,12 @@ class SawxDocument:
                 pass
             else:
                 try:
-                    session_info = jsonutil.unserialize(uri, text)
+                    # arrays are in the sidecar directory next to the local file
+                    path = self.filesystem_path() + ext
+                except FileNotFoundError:
+                    path = uri
+                try:
+                    session_info = sessionfile.unserialize(path, text)
                 except ValueError as e:
                     log.error(f"invalid data in {uri}: {e}")
         return session_info
@@ -250,13 +367,199 @@ class SawxDocument:
     def save(self, uri=None):
         if uri is None:
             uri = self.uri
+        job = self.create_save_job(uri)
+        if job is not None:
+            job._start(None)
+            self.save_finished(job)
+            if not job.success():
+                raise errors.DocumentError(job.error)
+
+    def save_in_background(self, uri=None, editor_id=None, editor_session=None, callback=None):
+        """Save the document (and optionally the session) in a background
+        thread, returning the SaveJob or None if the document can't be saved.
+
+        The data is captured at the time of the call; changes made while the
+        save is in progress are not included in the saved file. The callback
+        is called from the save thread with the job as its argument as the
+        save progresses and when it has finished, at which point save_finished
+        must be called (from the main thread).
+        """
+        if uri is None:
+            uri = self.uri
+        job = self.create_save_job(uri, editor_id, editor_session, callback)
+        if job is not None:
+            if self.save_job is not None and not self.save_job.is_finished:
+                self.save_job.cancel()
+            self.save_job = job
+            start_thread_job(job, "SaveJob")
+        return job
+
+    def create_save_job(self, uri, editor_id=None, editor_session=None, callback=None):
         if not self.verify_writeable_uri(uri):
             raise errors.ReadOnlyFilesystemError(uri)
-        if self.verify_ok_to_save():
-            raw_data = self.calc_raw_data_to_save()
-            self.save_raw_data(uri, raw_data)
-            self.file_metadata['uri'] = uri
-            self.undo_stack.set_save_point()
+        if not self.verify_ok_to_save():
+            return None
+        try:
+            path = filesystem.filesystem_path(uri)
+            open_func = None
+        except FileNotFoundError:
+            path = uri
+            open_func = open
+        compression = self.calc_save_compression(uri)
+        if compression is None and open_func is None and self.can_save_patches(path):
+            snapshot = PatchSnapshot(self.raw_data, self.modified_ranges)
+            job_class = PatchSaveJob
+        else:
+            snapshot = self.create_save_snapshot()
+            job_class = SaveJob
+        session_file = None
+        if editor_id is not None and open_func is None:
+            session_file = self.calc_session_file(path, editor_id, editor_session)
+        if compression is not None:
+            job = CompressedSaveJob(snapshot, path, session_file, callback, open_func, compression)
+        else:
+            job = job_class(snapshot, path, session_file, callback, open_func)
+        job.uri = uri
+        job.save_point_index = self.undo_stack.insert_index
+        job.raw_data = self.raw_data
+        job.modified_ranges = self.modified_ranges
+        self.modified_ranges = RangeSet()
+        self.save_snapshots.append(snapshot)
+        log.debug(f"saving {uri} from {snapshot}")
+        return job
+
+    def calc_save_compression(self, uri):
+        """Compression format to use when saving to the uri: the format the
+        document was loaded with if it's saved back to the same file,
+        otherwise the format implied by the extension (e.g. ".gz")
+        """
+        if uri == self.uri and 'compression' in self.file_metadata:
+            return self.file_metadata['compression']
+        return compression_of_path(uri)
+
+    def save_finished(self, job):
+        """Update the document after the SaveJob has finished, returning True
+        if it was successful
+        """
+        if job.snapshot in self.save_snapshots:
+            self.save_snapshots.remove(job.snapshot)
+        if job is self.save_job:
+            self.save_job = None
+        if not job.success():
+            # still needs to be written next time
+            self.modified_ranges = self.modified_ranges | job.modified_ranges
+            return False
+        self.file_metadata['uri'] = job.uri
+        self.file_metadata['compression'] = job.compression
+        self.undo_stack.save_point_index = job.save_point_index
+        if job.open_func is None:
+            self.record_saved_file_info(job.raw_data, job.path)
+        else:
+            self.record_saved_file_info(None)
+        return True
+
+    def prepare_to_change(self, start=0, end=None):
+        """Must be called before changing raw_data in place between the byte
+        offsets start and end (the end of the data if None), so that saves in
+        progress still write the original data and the next save knows which
+        bytes have changed.
+        """
+        for snapshot in self.save_snapshots:
+            snapshot.preserve(start, snapshot.size if end is None else end)
+        if end is None:
+            end = self.raw_data.nbytes if isinstance(self.raw_data, np.ndarray) else len(self.raw_data)
+        self.modified_ranges = self.modified_ranges | [(start, end)]
+
+    def prepare_for_command(self, command, editor):
+        """Called by the editor before a command is performed, undone or
+        redone, any of which may change raw_data in place.
+
+        Saves in progress only preserve the range that the command says it
+        will change. If the range isn't known, the edit waits until the saves
+        have finished reading the data instead of copying everything they
+        haven't written yet.
+        """
+        if command is None or not self.save_snapshots:
+            return
+        index_range = command.calc_change_range(editor)
+        for snapshot in self.save_snapshots:
+            if index_range is None:
+                log.debug(f"waiting for {snapshot} before changing data")
+                snapshot.wait_until_written()
+            else:
+                snapshot.preserve(*index_range)
+
+    def command_finished(self, flags):
+        """Called by the editor after a command has been performed, undone or
+        redone to record the bytes it changed, which are given by the
+        index_range of its flags (or are all of them if it has none).
+        """
+        if not flags.byte_values_changed:
+            return
+        if flags.index_range is None:
+            start, end = 0, self.raw_data.nbytes if isinstance(self.raw_data, np.ndarray) else len(self.raw_data)
+        else:
+            start, end = flags.index_range
+        self.modified_ranges = self.modified_ranges | [(start, end)]
+
+    #### in-place saving
+
+    def record_saved_file_info(self, raw_data, path=None):
+        """Remember the file that raw_data was loaded from or saved to, so
+        that a later save to the same file can write only the changed bytes.
+        """
+        self.saved_file_info = None
+        if raw_data is None or not isinstance(raw_data, np.ndarray):
+            return
+        try:
+            if path is None:
+                path = self.filesystem_path()
+            stat = os.stat(path)
+        except OSError:
+            return
+        self.saved_file_info = (weakref.ref(raw_data), path, stat.st_size, stat.st_mtime_ns)
+
+    def invalidate_saved_file_info(self, evt=None):
+        # the size or layout may have changed, so the whole file must be
+        # written by the next save
+        self.saved_file_info = None
+
+    def can_save_patches(self, path):
+        """Can the changes be saved by only writing the modified ranges in
+        place? Only if raw_data is the same array that was loaded from or
+        last saved to the same file, the file hasn't changed on disk since
+        then, and the size of the data is the same.
+        """
+        if self.max_patch_fraction is None or self.saved_file_info is None:
+            return False
+        if self.file_metadata.get('compression'):
+            return False
+        raw_data_ref, saved_path, size, mtime = self.saved_file_info
+        if raw_data_ref() is not self.raw_data or saved_path != path:
+            return False
+        if self.raw_data.nbytes != size:
+            return False
+        if not self.modified_ranges and self.is_dirty:
+            # changed without calling prepare_to_change
+            return False
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        if stat.st_size != size or stat.st_mtime_ns != mtime:
+            log.debug(f"{path} changed on disk since loaded or saved")
+            return False
+        return self.modified_ranges.num_indexes <= size * self.max_patch_fraction
+
+    def recover_interrupted_save(self):
+        try:
+            path = self.filesystem_path()
+        except FileNotFoundError:
+            return
+        try:
+            recover_journal(path)
+        except OSError as e:
+            log.error(f"failed restoring {path} from its journal: {e}")
 
     def verify_writeable_uri(self, uri):
         return filesystem.is_user_writeable_uri(uri)
@@ -265,15 +568,15 @@ class SawxDocument:
         return True
 
     def calc_raw_data_to_save(self):
-        return self.raw_data.tostring()
+        return self.raw_data
 
-    def save_raw_data(self, uri, raw_data):
-        fh = open(uri, 'wb')
-        log.debug("saving to %s" % uri)
-        fh.write(raw_data)
-        fh.close()
+    def create_save_snapshot(self):
+        return SaveSnapshot(self.calc_raw_data_to_save())
 
-    def save_session(self, editor_id, editor_session):
+    def calc_session_file(self, path, editor_id, editor_session):
+        """Return the SessionFile for the session data of the document saved
+        at path, or None if there's nothing to save
+        """
         if not self.session_save_file_extension:
             log.debug("no filename extension for session data; not saving")
         else:
@@ -281,18 +584,19 @@ class SawxDocument:
             self.serialize_session(s)
             if s and editor_session:
                 s[editor_id] = editor_session
-                jsonpickle.set_encoder_options("json", sort_keys=True, indent=4)
-                text = jsonpickle.dumps(s)
-                text = jsonutil.collapse_json(text, 8, self.json_expand_keywords)
-                path = self.save_adjacent(self.session_save_file_extension, text)
-                log.debug("saved session to {path}")
-                return path
+                return SessionFile(path + self.session_save_file_extension, s, self.json_expand_keywords)
+
+    def save_session(self, editor_id, editor_session):
+        session_file = self.calc_session_file(self.filesystem_path(), editor_id, editor_session)
+        if session_file is not None:
+            session_file.write()
+            log.debug(f"saved session to {session_file.path}")
+            return session_file.path
 
     def save_adjacent(self, ext, data, mode="w"):
         if ext:
             path = self.filesystem_path() + ext
-            with open(path, mode) as fh:
-                fh.write(data)
+            write_atomic(path, [data])
         else:
             raise RuntimeError(f"Must specify non-blank extension to write a file adjacent to the data file")
         return path
@@ -1,28 +1,45 @@
 import os
 
 from ..document import SawxDocument
+from .. import filesystem
 from ..filesystem import fsopen as open
+from ..utils.jobs import start_thread_job
+from ..utils.lineindex import LineIndex, LineIndexJob
+from ..utils.savefile import TextSaveSnapshot
+from ..utils.textutil import guessEncoding, detectBOM, decode_text
 
 import logging
 log = logging.getLogger(__name__)
 
 
 class TextDocument(SawxDocument):
-    def load_raw_data(self):
-        fh = open(self.uri, 'r')
-        return fh.read()
+    # encoding and byte order mark of the file, determined when loading and
+    # used again when saving
+    encoding = "utf-8"
 
-    def calc_raw_data(self, raw):
-        return str(raw)
+    bom = None
+
+    # raw_data is the decoded str, so its indexes aren't file offsets
+    max_patch_fraction = None
 
-    def calc_raw_data_to_save(self):
-        return self.raw_data
+    def calc_raw_data(self, raw):
+        # the bytes are decoded a chunk at a time so large (memory mapped)
+        # files aren't copied into memory before decoding
+        self.encoding, self.bom = guessEncoding(raw)
+        log.debug(f"decoding {self.uri} as {self.encoding}, bom={self.bom}")
+        try:
+            return decode_text(raw, self.encoding, self.bom)
+        except UnicodeDecodeError as e:
+            # the encoding was guessed from the start of the file only.
+            # Latin-1 decodes any bytes and encodes back to the same bytes,
+            # so the file is saved unchanged.
+            log.warning(f"{self.uri} isn't valid {self.encoding} ({e}), decoding as latin-1")
+            self.encoding, self.bom = "latin-1", None
+            return decode_text(raw, self.encoding)
 
-    def save_raw_data(self, uri, raw_data):
-        fh = open(uri, 'w')
-        log.debug("saving to %s" % uri)
-        fh.write(raw_data)
-        fh.close()
+    def create_save_snapshot(self):
+        # encoded a chunk at a time while saving rather than all at once
+        return TextSaveSnapshot(self.raw_data, self.encoding, self.bom)
 
     # won't automatically match anything; must force this editor with the -t
     # command line flag
@@ -33,3 +50,68 @@ class TextDocument(SawxDocument):
     @classmethod
     def can_load_file_generic(cls, file_metadata):
         return file_metadata['mime'].startswith("text/")
+
+
+class LargeTextDocument(SawxDocument):
+    """Text document for files too large to hold as a single string.
+
+    The text stays as bytes in a memory mapped file, and the LineIndex of the
+    start of each line is built in the background, so opening the file is
+    immediate and only the lines being displayed are ever decoded.
+    """
+    # text files on the local filesystem at least this size use this document
+    large_file_threshold = 32 * 1024 * 1024
+
+    memory_map_threshold = 1
+
+    encoding = "utf-8"
+
+    def __init__(self, file_metadata):
+        self.line_index_job = None
+        SawxDocument.__init__(self, file_metadata)
+        self.encoding, bom = guessEncoding(self.raw_data)
+        if bom and self.encoding == "utf-8":
+            # only the first line can start with the BOM
+            self.encoding = "utf-8-sig"
+        self.line_index = LineIndex(self.raw_data, self.encoding)
+
+    def start_line_index(self, callback=None):
+        """Start scanning for lines in the background. The callback is called
+        from the scanning thread with the job as its argument each time more
+        lines are found.
+        """
+        if self.line_index_job is not None:
+            self.line_index_job.callback = callback
+            return
+        if self.line_index.is_complete:
+            return
+        self.line_index_job = LineIndexJob(self.line_index, callback)
+        start_thread_job(self.line_index_job, "LineIndexJob")
+
+    def global_resource_cleanup(self):
+        if self.line_index_job is not None:
+            self.line_index_job.cancel()
+        SawxDocument.global_resource_cleanup(self)
+
+    @classmethod
+    def can_load_file_exact(cls, file_metadata):
+        if not file_metadata['mime'].startswith("text/"):
+            return False
+        if file_metadata.get('compression'):
+            # the decompressed size isn't known without decompressing it
+            return False
+        try:
+            path = filesystem.filesystem_path(file_metadata['uri'])
+            if os.path.getsize(path) < cls.large_file_threshold:
+                return False
+            with open(path, 'rb') as fh:
+                encoding, bom = detectBOM(fh.read(4))
+        except OSError:
+            return False
+        # lines are found by searching for newline bytes, so encodings with
+        # more than one byte per newline aren't supported
+        return encoding is None or encoding == "utf-8"
+
+    @classmethod
+    def can_load_file_generic(cls, file_metadata):
+        return False
@@ -319,10 +319,28 @@ class SawxEditor:
         self.frame.status_message(f"loaded {path}", True)
 
     def save_to_uri(self, uri=None, save_session=True):
-        self.document.save(uri)
+        """Save the document in the background; save_success is called once
+        the file has been written.
+        """
+        s = None
         if save_session:
-            self.save_session()
-        self.save_success()
+            s = {}
+            self.serialize_session(s)
+        job = self.document.save_in_background(uri, self.editor_id, s, self.save_progress)
+        if job is not None:
+            self.frame.status_message(f"saving {job.uri}...")
+
+    def save_progress(self, job):
+        # called from the save thread
+        wx.CallAfter(self.process_save_progress, job)
+
+    def process_save_progress(self, job):
+        if not job.is_finished:
+            self.frame.status_message(f"saving {job.uri}: {int(job.progress * 100)}%")
+        elif self.document.save_finished(job):
+            self.save_success(job.uri)
+        elif not job.is_cancelled:
+            self.frame.error(f"Failed saving {job.uri}: {job.error}")
 
     def save_as_image(self, uri, raw_data=None):
         """ Saves the contents of the editor in a maproom project file
@@ -379,6 +397,58 @@ class SawxEditor:
         """
         return 0
 
+    @property
+    def search_engine(self):
+        try:
+            return self._search_engine
+        except AttributeError:
+            from .utils.search import SearchEngine
+            self._search_engine = SearchEngine(callback=self.search_progress_callback)
+        return self._search_engine
+
+    def start_search(self, searcher):
+        """Search the document data in the background using one of the
+        searchers from sawx.utils.search, starting at search_start.
+
+        Matches are reported to search_results_changed as they are found.
+        Starting another search cancels any search in progress.
+        """
+        self.search_engine.start(self.document.raw_data, searcher, self.search_start)
+
+    def cancel_search(self):
+        self.search_engine.cancel()
+
+    def build_search_index(self):
+        """Build an n-gram index of the document data in the background (or
+        load it from the cache if the data hasn't changed since it was last
+        indexed) so that literal searches don't have to scan all the data.
+        """
+        from .persistence import get_cache_dir
+        self.search_engine.build_index(self.document.raw_data, get_cache_dir("ngram"))
+
+    def search_data_changed(self, start=None, end=None):
+        """Editors that build a search index must call this after modifying
+        the bytes from start to end, or with no range if the size of the data
+        has changed.
+        """
+        self.search_engine.data_changed(start, end)
+
+    def search_progress_callback(self, job):
+        # called from the search thread
+        wx.CallAfter(self.process_search_results)
+
+    def process_search_results(self):
+        if self.search_engine.poll():
+            self.search_results_changed(self.search_engine)
+
+    def search_results_changed(self, engine):
+        """Called in the main thread when new matches have been found.
+
+        Editors using a CompactGrid can pass engine.matches to the table's
+        set_match_ranges so that only the visible rows are styled.
+        """
+        pass
+
     #### popup menu utilities
 
     def show_popup(self, popup_menu_desc, popup_data=None):
@@ -452,12 +522,16 @@ class SawxEditor:
         return StatusFlags()
 
     def undo(self):
+        self.document.prepare_for_command(self.document.undo_stack.get_undo_command(), self)
         undo = self.document.undo_stack.undo(self)
+        self.document.command_finished(undo.flags)
         self.process_flags(undo.flags)
         self.frame.sync_active_tab()
 
     def redo(self):
+        self.document.prepare_for_command(self.document.undo_stack.get_redo_command(), self)
         undo = self.document.undo_stack.redo(self)
+        self.document.command_finished(undo.flags)
         self.process_flags(undo.flags)
         self.frame.sync_active_tab()
 
@@ -482,7 +556,9 @@ class SawxEditor:
         the UI.
         
         """
+        self.document.prepare_for_command(command, self)
         undo = self.document.undo_stack.perform(command, self, batch)
+        self.document.command_finished(undo.flags)
         f.add_flags(undo.flags, command)
         return undo
 
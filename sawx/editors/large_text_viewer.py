@@ -0,0 +1,160 @@
+import time
+
+import numpy as np
+import wx
+
+from ..editor import SawxEditor
+from ..documents.text import LargeTextDocument
+from ..ui.compactgrid import CompactGrid, VirtualTable, VirtualTableLineRenderer, TableViewParams
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class LineTable(VirtualTable):
+    """Table with one row per line of a LineIndex, displayed in a single
+    column. Indexes in the table are line numbers, so the carets and
+    selections refer to whole lines.
+    """
+    tab_size = 8
+
+    def __init__(self, line_index):
+        self.line_index = line_index
+        VirtualTable.__init__(self, 1)
+
+    def calc_num_rows(self):
+        return self.line_index.num_lines
+
+    def calc_last_valid_index(self):
+        return self.line_index.num_lines
+
+    def create_row_labels(self):
+        self.label_start_addr = 0
+        self.label_char_width = 8
+
+    def get_row_label_text(self, start_line, num_lines, step=1):
+        last_line = min(start_line + num_lines, self.num_rows)
+        for line in range(start_line, last_line, step):
+            yield str(line + 1)
+
+    def get_base_style_range(self, index, last_index):
+        return np.zeros(max(last_index - index, 0), dtype=np.uint8)
+
+    def get_base_style_at(self, index):
+        return np.uint8(0)
+
+    def calc_row_text(self, row):
+        return [self.line_index.get_line_text(row).expandtabs(self.tab_size)]
+
+    def get_value_style(self, row, col):
+        return self.get_row_text(row)[0], self.get_style_at(row)
+
+    def get_row_values_styles(self, row, first_col, last_col):
+        return self.get_row_text(row)[first_col:last_col], self.get_style_range(row, row + 1)
+
+    def lines_added(self):
+        """Update the size of the table after the LineIndex has found more
+        lines, returning True if the number of rows changed.
+        """
+        num_rows = self.num_rows
+        self.init_boundaries()
+        return num_rows != self.num_rows
+
+
+class LineGrid(CompactGrid):
+    """Virtual text viewer that only decodes the lines being drawn"""
+    chars_per_line = 256
+
+    def calc_line_renderer(self):
+        return VirtualTableLineRenderer(self, self.chars_per_line)
+
+    def set_view_param_defaults(self):
+        super().set_view_param_defaults()
+        self.want_col_header = False
+
+
+class LargeTextViewer(SawxEditor):
+    editor_id = "large_text_viewer"
+
+    ui_name = "Large Text Viewer"
+
+    toolbar_desc = [
+        "open_file", None, "copy"
+    ]
+
+    # minimum time between updates of the grid while lines are being found
+    refresh_interval = 0.25
+
+    @property
+    def is_dirty(self):
+        return False
+
+    @property
+    def can_copy(self):
+        return True
+
+    @property
+    def can_paste(self):
+        return False
+
+    @property
+    def line_index(self):
+        return self.document.line_index
+
+    def create_control(self, parent):
+        self.last_refresh = 0
+        self.table = LineTable(self.line_index)
+        return LineGrid(self.table, TableViewParams(), None, None, parent)
+
+    def show(self, args=None):
+        self.document.start_line_index(self.line_index_progress)
+        self.process_lines_added()
+
+    def prepare_destroy(self):
+        job = self.document.line_index_job
+        if job is not None and job.callback == self.line_index_progress:
+            job.callback = None
+
+    def line_index_progress(self, job):
+        # called from the line index thread
+        now = time.time()
+        if now - self.last_refresh > self.refresh_interval or self.line_index.is_complete:
+            self.last_refresh = now
+            wx.CallAfter(self.process_lines_added)
+
+    def process_lines_added(self):
+        if self.table.lines_added():
+            self.control.recalc_view()
+            self.control.refresh_view()
+
+    def go_to_line(self, line):
+        """Move the caret to the start of the line (counting from zero) and
+        scroll it into view
+        """
+        line = max(0, min(line, self.table.num_rows - 1))
+        self.control.caret_handler.move_carets_to(line, 0)
+        self.control.keep_index_on_screen(line, None)
+        self.control.refresh_view()
+
+    def go_to_offset(self, offset):
+        """Move the caret to the line containing the byte offset"""
+        self.go_to_line(self.line_index.line_of_index(offset))
+
+    def get_selected_text(self):
+        lines = []
+        for start, end in self.control.get_selected_ranges_including_carets():
+            lines.extend(self.line_index.get_lines_text(start, end))
+        return "\n".join(lines)
+
+    def calc_clipboard_data_from(self, focused):
+        d = wx.TextDataObject()
+        d.SetText(self.get_selected_text())
+        return [d]
+
+    @classmethod
+    def can_edit_document_exact(cls, document):
+        return isinstance(document, LargeTextDocument)
+
+    @classmethod
+    def can_edit_document_generic(cls, document):
+        return False
@@ -3,6 +3,7 @@ import os
 import wx
 
 from ..editor import SawxEditor
+from ..documents.text import LargeTextDocument
 from ..filesystem import fsopen as open
 from ..keybindings import KeyBindingControlMixin
 from ..preferences import SawxEditorPreferences
@@ -94,11 +95,11 @@ class TextEditor(SawxEditor):
 
     @classmethod
     def can_edit_document_exact(cls, document):
-        return document.mime == "text/plain"
+        return document.mime == "text/plain" and not isinstance(document, LargeTextDocument)
 
     @classmethod
     def can_edit_document_generic(cls, document):
-        return document.mime.startswith("text/")
+        return document.mime.startswith("text/") and not isinstance(document, LargeTextDocument)
 
     def on_popup(self, evt):
         popup_menu_desc = [
@@ -7,6 +7,10 @@ from io import BytesIO, StringIO
 import wx
 import numpy as np
 
+from .utils.pathindex import PathIndex
+from .utils.zipfs import open_zip_uri
+from .utils.compressedfs import detect_file_compression, open_compressed
+
 import logging
 log = logging.getLogger(__name__)
 
@@ -24,6 +28,20 @@ template_paths = [None]
 
 help_paths = []
 
+# the resource directories are scanned once rather than on every lookup
+template_index = PathIndex(template_paths)
+
+image_index = PathIndex(image_paths)
+
+help_index = PathIndex(help_paths)
+
+resource_indexes = [template_index, image_index, help_index]
+
+# resource URIs already resolved to local paths, cleared when any of the
+# resource directories change
+local_path_cache = {}
+
+local_path_cache_key = None
 
 
 def open_about(path, mode):
@@ -39,6 +57,23 @@ def open_about(path, mode):
         else:
             raise ValueError(f"invalid mode for about filesystem: '{mode}'")
 
+# blocks of http URLs are cached on disk here if it's not None (set by
+# persistence at startup and passed on to httpfs once it's imported)
+http_block_cache_dir = None
+
+# the http support (and urllib) is only imported when a URL is opened
+def get_httpfs():
+    from .utils import httpfs
+    if httpfs.block_cache_dir is None:
+        httpfs.block_cache_dir = http_block_cache_dir
+    return httpfs
+
+def open_http(path, mode):
+    return get_httpfs().open_http(path, mode)
+
+def open_https(path, mode):
+    return get_httpfs().open_https(path, mode)
+
 def open_blank(path, mode):
     try:
         size = int(path)
@@ -55,6 +90,9 @@ def open_blank(path, mode):
 computed_filesystems = {
     "about://": open_about,
     "blank://": open_blank,
+    "zip://": open_zip_uri,
+    "http://": open_http,
+    "https://": open_https,
 }
 
 
@@ -71,14 +109,17 @@ def calc_template_paths(include_user_defined):
 
 def find_template_path(name, include_user_defined=True):
     paths = calc_template_paths(include_user_defined)
-    return find_first_in_paths(paths, name)
+    return template_index.find_first(name, paths)
 
 def find_latest_template_path(name, include_user_defined=True):
     paths = calc_template_paths(include_user_defined)
     return find_latest_in_paths(paths, name)
 
 def find_image_path(name):
-    return find_first_in_paths(image_paths, name)
+    return image_index.find_first(name)
+
+def find_help_path(name):
+    return help_index.find_first(name)
 
 filesystems_to_local_file = {
     "template://": find_template_path,
@@ -86,7 +127,21 @@ filesystems_to_local_file = {
     "file://": lambda path: path,
 }
 
+def get_cached_local_path(uri):
+    global local_path_cache, local_path_cache_key
+
+    for index in resource_indexes:
+        index.refresh()
+    key = tuple(index.generation for index in resource_indexes)
+    if key != local_path_cache_key:
+        local_path_cache = {}
+        local_path_cache_key = key
+    return local_path_cache.get(uri, None)
+
 def filesystem_path(uri):
+    local_path = get_cached_local_path(uri)
+    if local_path is not None:
+        return local_path
     for prefix, path_finder in filesystems_to_local_file.items():
         if uri.startswith(prefix):
             try:
@@ -94,6 +149,7 @@ def filesystem_path(uri):
             except OSError as e:
                 raise FileNotFoundError(str(e))
             else:
+                local_path_cache[uri] = local_path
                 break
     else:
         if "://" in uri:
@@ -111,9 +167,20 @@ def is_user_writeable_uri(uri):
     for prefix, path_finder in filesystems_to_local_file.items():
         if uri.startswith(prefix):
             return False
+    for prefix in computed_filesystems:
+        if uri.startswith(prefix):
+            return False
     return True
 
-def fsopen(uri, mode="r"):
+def fsopen(uri, mode="r", decompress=False):
+    """Open the URI, which may be a local path or use any of the supported
+    filesystem prefixes.
+
+    If decompress is True, gzip, bz2 and xz compressed files on the local
+    filesystem are opened (read-only) as seekable files of the decompressed
+    data. A file that starts with the magic bytes of a compression format but
+    can't be decompressed is opened as a normal file.
+    """
     try:
         local_path = filesystem_path(uri)
     except FileNotFoundError:
@@ -122,6 +189,10 @@ def fsopen(uri, mode="r"):
                 return opener(uri[len(prefix):], mode)
         else:
             raise FileNotFoundError(f"Unsupported URI scheme for {uri}")
+    if decompress and mode in ("r", "rb"):
+        compression = detect_file_compression(local_path)
+        if compression is not None:
+            return open_compressed(local_path, mode, compression)
     return open(local_path, mode)
 
 
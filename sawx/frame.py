@@ -1,5 +1,4 @@
 import wx
-import wx.adv
 import wx.aui as aui
 # import wx.lib.agw.aui as aui
 
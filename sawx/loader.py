@@ -10,6 +10,8 @@ from .filesystem import fsopen as open
 from .filesystem import filesystem_path
 from .utils.textutil import guessBinary
 from .utils.pyutil import get_plugins
+from .utils.zipfs import get_zip_index
+from .utils.compressedfs import get_compression
 
 import logging
 log = logging.getLogger(__name__)
@@ -18,13 +20,17 @@ log = logging.getLogger(__name__)
 class FileGuess:
     def __init__(self, uri):
         self.uri = uri
-        self.fh = open(uri, 'rb')
+        # compressed local files are sniffed (and loaded) as their
+        # decompressed data
+        self.fh = open(uri, 'rb', decompress=True)
+        self.compression = get_compression(self.fh)
         self._sample_data = None
         self._sample_lines = None
         self._all_data = None
         self._is_binary = None
         self._is_zipfile = None
         self._zipfile = None
+        self._zip_index = None
         self._filesystem_path = None
 
     @property
@@ -60,8 +66,13 @@ class FileGuess:
     @property
     def is_zipfile(self):
         if self._is_zipfile is None:
-            self.fh.seek(0)
-            self._is_zipfile = zipfile.is_zipfile(self.fh)
+            if self.compression is not None:
+                # finding the central directory would need the whole file to
+                # be decompressed
+                self._is_zipfile = False
+            else:
+                self.fh.seek(0)
+                self._is_zipfile = zipfile.is_zipfile(self.fh)
         return self._is_zipfile
 
     @property
@@ -71,6 +82,18 @@ class FileGuess:
             self._zipfile = zipfile.ZipFile(self.fh)
         return self._zipfile
 
+    @property
+    def zip_index(self):
+        """ZipIndex of the file if it's a zip archive on the local
+        filesystem, or None
+        """
+        if self._zip_index is None and self.is_zipfile:
+            try:
+                self._zip_index = get_zip_index(self.filesystem_path)
+            except OSError:
+                self._zip_index = False
+        return self._zip_index or None
+
     @property
     def filesystem_path(self):
         if self._filesystem_path is None:
@@ -80,6 +103,8 @@ class FileGuess:
     def zipfile_contains(self, filename):
         if not self.is_zipfile:
             return False
+        if self.zip_index is not None:
+            return filename in self.zip_index
         try:
             info = self.zipfile.getinfo(filename)
             log.debug(f"zipfile_contains: {filename}: {info}")
@@ -90,10 +115,12 @@ class FileGuess:
     def zipfile_contains_extension(self, ext):
         if not self.is_zipfile:
             return False
+        if self.zip_index is not None:
+            return self.zip_index.contains_extension(ext)
         for item in self.zipfile.infolist():
             if item.filename.endswith(ext):
                 return True
-        return True
+        return False
 
 
 def identify_file(uri, match_multiple=False):
@@ -119,6 +146,8 @@ def identify_file(uri, match_multiple=False):
         file_metadata = loader.identify_loader(file_guess)
         if file_metadata:
             file_metadata['uri'] = uri
+            if file_guess.compression is not None:
+                file_metadata['compression'] = file_guess.compression
             mime_type = file_metadata['mime']
             if mime_type == "application/octet-stream":
                 log.debug(f"identify_file: identified as generic type {mime_type}")
@@ -142,5 +171,7 @@ def identify_file(uri, match_multiple=False):
         fallback = text_fallback or binary_fallback  # prefer text match over binary
         if not fallback:
             fallback = dict(mime="application/octet-stream", uri=uri)
+            if file_guess.compression is not None:
+                fallback['compression'] = file_guess.compression
         log.debug(f"identify_file: identified only as the generic {fallback}")
         return fallback
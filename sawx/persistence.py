@@ -1,8 +1,8 @@
 import os
 import sys
+import copy
 import glob
 import json
-import pkg_resources
 
 import jsonpickle
 import jsonpickle.ext.numpy as jsonpickle_numpy
@@ -13,6 +13,10 @@ from datetime import datetime
 
 import appdirs
 from . import filesystem
+from .utils.configstore import ConfigStore
+from .utils import jsonutil
+from .utils import compressedfs
+from .utils import entrypoints
 
 import logging
 log = logging.getLogger(__name__)
@@ -42,9 +46,10 @@ log_file_ext = None
 cache_dir = None
 user_data_dir = None
 template_dir = None
+config_store = None
 
 def setup_file_persistence(app_name):
-    global config_base_dir, log_dir, log_file_ext, cache_dir, user_data_dir, template_dir
+    global config_base_dir, log_dir, log_file_ext, cache_dir, user_data_dir, template_dir, config_store
 
     dirname = appdirs.user_config_dir(app_name)
     config_base_dir = dirname
@@ -55,6 +60,10 @@ def setup_file_persistence(app_name):
     if not os.path.exists(config_base_dir):
         os.makedirs(config_base_dir)
 
+    # all configuration data is read here, in one read of the database
+    close_config_store()
+    config_store = ConfigStore(os.path.join(config_base_dir, "config.sqlite"))
+
     dirname = appdirs.user_log_dir(app_name)
     if not os.path.exists(dirname):
         os.makedirs(dirname)
@@ -66,6 +75,9 @@ def setup_file_persistence(app_name):
     if not os.path.exists(dirname):
         os.makedirs(dirname)
     cache_dir = dirname
+    entrypoints.index_cache_path = os.path.join(cache_dir, "entry_points.json")
+    compressedfs.index_cache_dir = get_cache_dir("compressed")
+    filesystem.http_block_cache_dir = get_cache_dir("http")
 
     dirname = appdirs.user_data_dir(app_name)
     if not os.path.exists(dirname):
@@ -143,8 +155,38 @@ def save_file_config_data(subdir, filename, data, mode='w'):
         fh.write(data)
     return file_path
 
+def close_config_store():
+    """Write any unsaved configuration data and close the store"""
+    global config_store
+
+    if config_store is not None:
+        config_store.close()
+        config_store = None
+
+def get_config_store_data(storage_type, name):
+    """Return the stored text for the name, importing it from the individual
+    file used by earlier versions if it isn't in the config store yet.
+    """
+    key = name + "." + storage_type
+    if config_store is None:
+        return get_file_config_data(storage_type, name)
+    raw = config_store.get(key)
+    if raw is None:
+        raw = get_file_config_data(storage_type, name)
+        if raw is not None:
+            log.debug(f"importing {key} into {config_store}")
+            config_store.set(key, raw)
+    return raw
+
+def save_config_store_data(storage_type, name, data):
+    key = name + "." + storage_type
+    if config_store is None:
+        return save_file_config_data(storage_type, name, data)
+    config_store.set(key, data)
+    return f"{config_store.path}:{key}"
+
 def get_json_data(json_name, default_on_error=None):
-    raw = get_file_config_data("json", json_name)
+    raw = get_config_store_data("json", json_name)
     if raw is None:
         return default_on_error
     try:
@@ -164,7 +206,7 @@ def get_json_data(json_name, default_on_error=None):
 
 def save_json_data(json_name, data):
     encoded = jsonpickle.encode(data)
-    return save_file_config_data("json", json_name, encoded)
+    return save_config_store_data("json", json_name, encoded)
 
 def get_bson_data(bson_name):
     import bson
@@ -256,6 +298,9 @@ def save_template(name, contents, binary=True):
         mode = "w"
     fh = filesystem.fsopen(pathname, mode)
     fh.write(contents)
+    fh.close()
+    # the directory mtime doesn't change when an existing file is replaced
+    template_cache.invalidate()
 
 class TemplateItem(dict):
     def __init__(self, data_file_path, keyword, inf_type, json_dict):
@@ -291,56 +336,108 @@ def iter_templates(inf_type=None):
       and user templates with the same name
     * uri
     * task  - editor name
+
+    The items are cached until the template directories change.
     """
-    templates = {}
-    for template_path in filesystem.glob_in_paths(filesystem.template_paths):
-        if template_path.endswith(".inf"):
+    yield from template_cache.get_items(inf_type)
+
+def calc_templates(inf_type=None):
+    index = filesystem.template_index
+    for toplevel, name in index.iter_toplevel_files():
+        if name.endswith(".inf"):
             # skip loading inf files
             continue
+        template_path = os.path.join(toplevel, name)
         inf_path = template_path + ".inf"
         j = None
-        if os.path.exists(template_path) and os.path.isfile(template_path):
-            log.debug(f"checking template {template_path} for {inf_type}")
-            keyword = os.path.basename(template_path)
-            keyword2, ext = os.path.splitext(keyword)
-            if ext and ext[1:] == inf_type:
-                keyword = keyword2
-                ext = inf_type
-            if os.path.exists(inf_path):
-                try:
-                    log.debug("Loading json file %s" % inf_path)
-                    with open(inf_path, "r") as fh:
-                        j = json.loads(fh.read())
-                except ValueError as e:
-                    log.error(f"Template properties error in {inf_path}: {e}")
+        log.debug(f"checking template {template_path} for {inf_type}")
+        keyword = name
+        keyword2, ext = os.path.splitext(keyword)
+        if ext and ext[1:] == inf_type:
+            keyword = keyword2
+            ext = inf_type
+        if index.contains(toplevel, name + ".inf"):
+            try:
+                log.debug("Loading json file %s" % inf_path)
+                with open(inf_path, "r") as fh:
+                    j = json.loads(fh.read())
+            except ValueError as e:
+                log.error(f"Template properties error in {inf_path}: {e}")
+                continue
+            if inf_type:
+                if "type" not in j and ext and ext != inf_type:
+                    continue
+                elif "type" in j and j["type"] != inf_type:
                     continue
-                if inf_type:
-                    if "type" not in j and ext and ext != inf_type:
-                        continue
-                    elif "type" in j and j["type"] != inf_type:
-                        continue
-                j["pathname"] = template_path
-                j["uri"] = "template://" + template_path
-                if "task" in j and j["task"] == "hex_edit":
-                    j["task"] = "byte_edit"
-            elif ext == inf_type:
-                j = {}
-                j["type"] = inf_type
-                j["pathname"] = template_path
-                j["uri"] = "template://" + template_path
-            if j is not None:
-                item = TemplateItem(template_path, keyword, inf_type, j)
-                log.debug(f"template: {item}")
-                yield item
+            j["pathname"] = template_path
+            j["uri"] = "template://" + template_path
+            if "task" in j and j["task"] == "hex_edit":
+                j["task"] = "byte_edit"
+        elif ext == inf_type:
+            j = {}
+            j["type"] = inf_type
+            j["pathname"] = template_path
+            j["uri"] = "template://" + template_path
+        if j is not None:
+            item = TemplateItem(template_path, keyword, inf_type, j)
+            log.debug(f"template: {item}")
+            yield item
+
+class TemplateCache:
+    """Template metadata and default sessions, parsed once and kept until the
+    template directories change
+    """
+    def __init__(self, path_index):
+        self.path_index = path_index
+        self.generation = None
+
+    def check(self):
+        self.path_index.refresh()
+        if self.generation != self.path_index.generation:
+            self.items = {}
+            self.sessions = {}
+            self.generation = self.path_index.generation
+
+    def invalidate(self):
+        self.path_index.invalidate()
+
+    def get_items(self, inf_type):
+        self.check()
+        if inf_type not in self.items:
+            self.items[inf_type] = list(calc_templates(inf_type))
+        return self.items[inf_type]
+
+    def get_default_session(self, mime):
+        """Return a copy of the decoded session template for the MIME type,
+        or an empty dict if there's no template.
+        """
+        self.check()
+        if mime not in self.sessions:
+            try:
+                text = get_template(mime)
+                log.debug(f"get_default_session: found template for {mime}")
+            except OSError:
+                log.debug(f"get_default_session: no template for {mime}")
+                e = {}
+            else:
+                e = jsonutil.unserialize(mime, text)
+            self.sessions[mime] = e
+        # callers add to the session, so they get their own copy
+        return copy.deepcopy(self.sessions[mime])
+
+template_cache = TemplateCache(filesystem.template_index)
+
+def get_default_session(mime):
+    return template_cache.get_default_session(mime)
 
 
 # Remember hooks
 
 def restore_from_last_time():
     modules = []
-    for entry_point in pkg_resources.iter_entry_points('sawx.remember'):
+    for entry_point in entrypoints.iter_entry_points('sawx.remember'):
         try:
-            mod = entry_point.load()
+            mod = entrypoints.load_entry_point(entry_point)
         except Exception as e:
             log.error(f"Failed importing remember entry point {entry_point.name}: {e}")
             import traceback
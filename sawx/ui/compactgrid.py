@@ -12,6 +12,11 @@ except ImportError:
     comment_bit_mask = 0x40
     selected_bit_mask = 0x80
 
+try:
+    from ..utils.sortutil import RangeSet
+except ImportError:
+    from sawx.utils.sortutil import RangeSet
+
 import logging
 logging.basicConfig()
 logger = logging.getLogger()
@@ -32,6 +37,45 @@ def ForceBetween(min, val, max):
     return val
 
 
+def make_byte_text_table(charset):
+    """Create a 256 entry lookup table of display text for byte values.
+
+    The charset may be a format string (e.g. "%02x"), a sequence of 256
+    strings (or a 256 character string), or a function taking the byte value
+    and returning its text.
+    """
+    if isinstance(charset, str) and len(charset) != 256:
+        text = [charset % i for i in range(256)]
+    elif callable(charset):
+        text = [charset(i) for i in range(256)]
+    else:
+        text = list(charset)
+        if len(text) != 256:
+            raise ValueError("byte lookup table must have 256 entries")
+    table = np.empty(256, dtype=object)
+    table[:] = text
+    return table
+
+
+hex_byte_text = make_byte_text_table("%02x")
+decimal_byte_text = make_byte_text_table("%d")
+ascii_byte_text = make_byte_text_table(lambda i: chr(i) if 32 <= i < 127 else ".")
+
+
+def format_bytes(data, text_table=hex_byte_text):
+    """Return a list of the display text of each byte using a lookup table
+    from make_byte_text_table
+    """
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = np.frombuffer(data, dtype=np.uint8)
+    return text_table[np.asarray(data, dtype=np.uint8)].tolist()
+
+
+def uses_base_method(obj, base, name):
+    """True if the named method of obj is the one defined in base"""
+    return getattr(type(obj), name) is getattr(base, name)
+
+
 def NiceFontForPlatform():
     point_size = 10
     family = wx.DEFAULT
@@ -156,9 +200,9 @@ class DrawTextImageCache(object):
 
 class DrawTableCellImageCache(DrawTextImageCache):
     def draw_item(self, parent, dc, rect, items, style, col_widths, col):
-        for i, item in enumerate(items):
+        texts = parent.table.calc_display_texts(col, items)
+        for i, text in enumerate(texts):
             s = style[i]
-            text = parent.table.calc_display_text(col + i, item)
             w = col_widths[col + i]
             rect.width = w
             self.draw_text(parent, dc, rect, text, s)
@@ -166,6 +210,8 @@ class DrawTableCellImageCache(DrawTextImageCache):
 
 
 class HexByteImageCache(DrawTextImageCache):
+    text_table = hex_byte_text
+
     def draw_cached_text(self, parent, dc, rect, text, style):
         k = (text, style, rect.width, rect.height)
         try:
@@ -174,20 +220,20 @@ class HexByteImageCache(DrawTextImageCache):
             bmp = wx.Bitmap(rect.width, rect.height)
             mdc = wx.MemoryDC()
             mdc.SelectObject(bmp)
-            t = "%02x" % text
             padding = parent.view_params.cell_padding_width
             r = wx.Rect(padding, 0, rect.width - (padding * 2), rect.height)
             bg_rect = wx.Rect(0, 0, rect.width, rect.height)
-            self.draw_text_to_dc(parent, mdc, bg_rect, r, t, style)
+            self.draw_text_to_dc(parent, mdc, bg_rect, r, text, style)
             del mdc  # force the bitmap painting by deleting the gc
             self.cache[k] = bmp
         dc.DrawBitmap(bmp, rect.x, rect.y)
 
     def draw_item(self, parent, dc, rect, data, style, col_widths, col):
         # draw_log.debug(str((rect, data)))
-        for i, c in enumerate(data):
-            # draw_log.debug(str((i, c, rect)))
-            self.draw_text(parent, dc, rect, c, style[i])
+        texts = format_bytes(data, self.text_table)
+        for i, t in enumerate(texts):
+            # draw_log.debug(str((i, t, rect)))
+            self.draw_text(parent, dc, rect, t, style[i])
             rect.x += col_widths[col + i]
 
 
@@ -372,7 +418,7 @@ class LineRenderer(object):
         t = parent.table
         rect = self.col_to_rect(line_num, col)
         data = t.data[index:last_index]
-        style = t.style[index:last_index]
+        style = t.get_style_range(index, last_index)
         self.image_cache.draw_item(parent, dc, rect, data, style, self.pixel_widths, col)
 
     def draw_grid(self, parent, dc, start_row, visible_rows, start_cell, visible_cells):
@@ -467,19 +513,18 @@ class HexLineRenderer(TableLineRenderer):
         t = parent.table
         rect = self.col_to_rect(line_num, col)
         data = t.data[index:last_index]
-        style = t.style[index:last_index]
+        style = t.get_style_range(index, last_index)
         self.image_cache.draw_item(parent, dc, rect, data, style, self.pixel_widths, col)
 
 
 class VirtualTableImageCache(DrawTableCellImageCache):
     def draw_item_at(self, parent, dc, rect, row, col, last_col, widths):
-        for c in range(col, last_col):
-            text, style = parent.table.get_value_style(row, col)
+        texts, styles = parent.table.get_row_values_styles(row, col, last_col)
+        for c, text, style in zip(range(col, last_col), texts, styles):
             w = widths[c]
             rect.width = w
             self.draw_text_to_dc(parent, dc, rect, rect, text, style)
             rect.x += w
-            col += 1
 
 
 class VirtualTableLineRenderer(TableLineRenderer):
@@ -509,11 +554,10 @@ class VirtualTableLineRenderer(TableLineRenderer):
 class ConstantWidthImageCache(VirtualTableImageCache):
     def draw_item_at(self, parent, dc, rect, row, col, last_col, width):
         rect.width = width
-        for c in range(col, last_col):
-            text, style = parent.table.get_value_style(row, col)
+        texts, styles = parent.table.get_row_values_styles(row, col, last_col)
+        for text, style in zip(texts, styles):
             self.draw_text_to_dc(parent, dc, rect, rect, text, style)
             rect.x += width
-            col += 1
 
 
 class VariableWidthLineRenderer(VirtualTableLineRenderer):
@@ -999,6 +1043,9 @@ class HexTable(object):
         self.start_addr = start_addr
         self.items_per_row = items_per_row
         self.start_offset = start_addr % items_per_row if row_labels_in_multiples else 0
+        self.selected_ranges = RangeSet()
+        self.match_ranges = RangeSet()
+        self.row_text_cache = {}
         self.init_boundaries()
         # print(self.data, self.num_rows, self.start_offset, self.start_addr)
         self.create_row_labels()
@@ -1108,11 +1155,186 @@ class HexTable(object):
         """
         pass
 
+    ##### array versions of row/col methods
+
+    # These operate on numpy arrays of rows and columns so that many carets
+    # can be moved at once. If a subclass overrides the scalar method, the
+    # scalar method is called for each item so the results always agree.
+
+    def get_items_in_rows(self, rows):
+        rows = np.asarray(rows, dtype=np.int64)
+        if not uses_base_method(self, HexTable, "get_items_in_row"):
+            return np.array([self.get_items_in_row(r) for r in rows.tolist()], dtype=np.int64)
+        return np.full(len(rows), self.items_per_row, dtype=np.int64)
+
+    def are_rows_cols_inside(self, rows, cols):
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        if not uses_base_method(self, HexTable, "is_row_col_inside"):
+            return np.array([self.is_row_col_inside(r, c) for r, c in zip(rows.tolist(), cols.tolist())], dtype=np.bool_)
+        valid_rows = (rows >= 0) & (rows < self.num_rows)
+        return valid_rows & (cols >= 0) & (cols < self.get_items_in_rows(np.clip(rows, 0, self.num_rows - 1)))
+
+    def enforce_valid_rows_cols(self, rows, cols):
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        if not uses_base_method(self, HexTable, "enforce_valid_row_col"):
+            rc = [self.enforce_valid_row_col(r, c) for r, c in zip(rows.tolist(), cols.tolist())]
+            rc = np.asarray(rc, dtype=np.int64).reshape(-1, 2)
+            return rc[:, 0], rc[:, 1]
+        rows = np.clip(rows, 0, self.num_rows - 1)
+        cols = np.clip(cols, 0, self.items_per_row - 1)
+        return rows, cols
+
+    def get_index_of_rows_cols(self, rows, cols):
+        """Array version of the first index returned by get_index_range"""
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        if not uses_base_method(self, HexTable, "get_index_range"):
+            return np.array([self.get_index_range(r, c)[0] for r, c in zip(rows.tolist(), cols.tolist())], dtype=np.int64)
+        index = rows * self.indexes_per_row + (cols // self.items_per_index) - self.start_offset
+        return np.clip(index, 0, max(self.last_valid_index - 1, 0))
+
+    def index_to_rows_cols(self, indexes):
+        indexes = np.asarray(indexes, dtype=np.int64)
+        if not uses_base_method(self, HexTable, "index_to_row_col"):
+            rc = [self.index_to_row_col(i) for i in indexes.tolist()]
+            rc = np.asarray(rc, dtype=np.int64).reshape(-1, 2)
+            return rc[:, 0], rc[:, 1]
+        rows, index_of_col = np.divmod(indexes + self.start_offset, self.indexes_per_row)
+        return rows, index_of_col * self.items_per_index
+
+    ##### display text
+
+    # If set to a lookup table from make_byte_text_table, byte data is
+    # formatted with a single array operation rather than by calling
+    # calc_display_text for every item.
+    display_text_table = None
+
+    def calc_display_text(self, col, item):
+        return str(item)
+
+    def calc_display_texts(self, col, items):
+        """Return the list of display text for consecutive items starting at
+        column col.
+        """
+        if self.display_text_table is not None:
+            return format_bytes(items, self.display_text_table)
+        return [self.calc_display_text(col + i, item) for i, item in enumerate(items)]
+
+    ##### row batched values
+
+    # Virtual table renderers ask for the values of a whole row at once. The
+    # default calls get_value_style for each column; tables that can produce
+    # a row more efficiently override get_row_values_styles, and may use the
+    # row text cache by implementing calc_row_text.
+
+    max_cached_text_rows = 512
+
+    def get_row_values_styles(self, row, first_col, last_col):
+        """Return a list of display text and a sequence of styles for the
+        columns first_col up to (but not including) last_col of the row.
+        """
+        texts = []
+        styles = []
+        for col in range(first_col, last_col):
+            text, style = self.get_value_style(row, col)
+            texts.append(text)
+            styles.append(style)
+        return texts, styles
+
+    def calc_row_text(self, row):
+        raise NotImplementedError("override to produce the display text of every column in the row")
+
+    def get_row_text(self, row):
+        try:
+            return self.row_text_cache[row]
+        except KeyError:
+            if len(self.row_text_cache) >= self.max_cached_text_rows:
+                self.row_text_cache = {}
+            text = self.calc_row_text(row)
+            self.row_text_cache[row] = text
+            return text
+
+    def invalidate_row_text(self, start_index=None, end_index=None):
+        """Discard cached row text for the rows containing the indexes
+        start_index up to (but not including) end_index, or all cached text
+        if no range is given.
+        """
+        if start_index is None or end_index is None:
+            self.row_text_cache = {}
+            return
+        if not self.row_text_cache or end_index <= start_index:
+            return
+        rows, _ = self.index_to_rows_cols([start_index, end_index - 1])
+        first, last = int(rows[0]), int(rows[1])
+        for row in [r for r in self.row_text_cache if first <= r <= last]:
+            del self.row_text_cache[row]
+
+    ##### selection and search match overlays
+
+    # The selection and search matches are not written into the style array.
+    # They are kept as RangeSets and merged into the style only for the
+    # indexes being drawn, so changing them doesn't touch every byte of the
+    # document.
+
+    def get_base_style_range(self, index, last_index):
+        return self.style[index:last_index]
+
+    def get_base_style_at(self, index):
+        return self.style[index]
+
+    def get_style_range(self, index, last_index):
+        style = self.get_base_style_range(index, last_index)
+        copied = False
+        for ranges, mask in [(self.selected_ranges, selected_bit_mask), (self.match_ranges, match_bit_mask)]:
+            visible = ranges.clip(index, last_index)
+            if visible:
+                if not copied:
+                    style = style.copy()
+                    copied = True
+                for start, end in visible:
+                    style[start - index:end - index] |= mask
+        return style
+
+    def get_style_at(self, index):
+        style = self.get_base_style_at(index)
+        if index in self.selected_ranges:
+            style |= selected_bit_mask
+        if index in self.match_ranges:
+            style |= match_bit_mask
+        return style
+
+    def is_index_selected(self, index):
+        return index in self.selected_ranges
+
+    def set_selected_ranges(self, ranges):
+        """Replace the selection overlay.
+
+        Returns a RangeSet of the indexes whose selection state changed, so
+        callers can limit any refreshing to that area.
+        """
+        if not isinstance(ranges, RangeSet):
+            ranges = RangeSet(ranges)
+        old = self.selected_ranges
+        self.selected_ranges = ranges
+        return (old - ranges) | (ranges - old)
+
     def clear_selected_style(self):
-        self.style[:] &= (0xff ^ selected_bit_mask)
+        self.selected_ranges = RangeSet()
 
     def set_selected_index_range(self, index1, index2):
-        self.style[index1:index2] |= selected_bit_mask
+        self.selected_ranges = self.selected_ranges | [(index1, index2)]
+
+    def set_match_ranges(self, ranges):
+        """Replace the search match overlay, returning the RangeSet of indexes
+        whose match state changed.
+        """
+        if not isinstance(ranges, RangeSet):
+            ranges = RangeSet(ranges)
+        old = self.match_ranges
+        self.match_ranges = ranges
+        return (old - ranges) | (ranges - old)
 
 
 class VariableWidthHexTable(HexTable):
@@ -1120,12 +1342,20 @@ class VariableWidthHexTable(HexTable):
 
     Each row may contain any number of columns, but all columns in each row
     must be the same data type (and therefore the same width in the display).
+
+    The row sizes are stored in the numpy array `items_per_row` and the index
+    of the start of each row in `index_of_row`, so memory use is proportional
+    to the number of rows rather than the number of items. Finding the row of
+    an index is a binary search on `index_of_row`.
     """
     def __init__(self, data, style, table_description, start_addr=0, row_labels_in_multiples=False):
         self.data = data
         self.style = style
         self.start_addr = start_addr
         self.start_offset = 0
+        self.selected_ranges = RangeSet()
+        self.match_ranges = RangeSet()
+        self.row_text_cache = {}
         self.init_table_description(table_description)
 
     def init_boundaries(self):
@@ -1142,28 +1372,35 @@ class VariableWidthHexTable(HexTable):
         self.create_row_labels()
 
     def get_items_in_row(self, row):
-        return self.items_per_row[row]
+        return int(self.items_per_row[row])
+
+    def get_items_in_rows(self, rows):
+        return np.take(self.items_per_row, rows, mode="clip")
 
     def parse_table_description(self, desc):
-        items_per_row = []
-        index_of_row = []
-        row_of_index = []
-        index = 0
-        row = 0
-        for d in desc:
-            s = self.size_of_entry(d)
-            if s > 0:
-                items_per_row.append(s)
-                index_of_row.append(index)
-                row_of_index.extend([row] * s)
-                # print(f"row_of_index: index={index}, s={s}: {row_of_index}")
-                # print(f"index_of_row: {index_of_row}")
-                index += s
-                row += 1
-        self.index_of_row = index_of_row
-        self.row_of_index = row_of_index
-        self.items_per_row = items_per_row
-        self.last_valid_index = index
+        sizes = np.fromiter((self.size_of_entry(d) for d in desc), dtype=np.int64)
+        self.set_row_sizes(sizes[sizes > 0])
+
+    def set_row_sizes(self, items_per_row):
+        self.items_per_row = np.asarray(items_per_row, dtype=np.int64)
+        self.index_of_row = np.zeros(len(self.items_per_row), dtype=np.int64)
+        np.cumsum(self.items_per_row[:-1], out=self.index_of_row[1:])
+        self.num_rows = self.calc_num_rows()
+        self.last_valid_index = int(self.items_per_row.sum())
+        self.invalidate_row_text()
+
+    def set_row_size(self, row, size):
+        """Change the number of items in a single row, shifting the start
+        index of all the following rows.
+        """
+        if size <= 0:
+            raise ValueError("Rows must contain at least one item")
+        delta = size - self.items_per_row[row]
+        if delta:
+            self.items_per_row[row] = size
+            self.index_of_row[row + 1:] += delta
+            self.last_valid_index += int(delta)
+            self.invalidate_row_text()
 
     def size_of_entry(self, d):
         return d
@@ -1173,7 +1410,17 @@ class VariableWidthHexTable(HexTable):
 
     def get_value_style(self, row, col):
         index, _ = self.get_index_range(row, col)
-        return str(self.data[index]), self.style[index]
+        return str(self.data[index]), self.get_style_at(index)
+
+    def calc_row_text(self, row):
+        index = int(self.index_of_row[row])
+        return [str(v) for v in self.data[index:index + self.items_per_row[row]]]
+
+    def get_row_values_styles(self, row, first_col, last_col):
+        index = int(self.index_of_row[row])
+        last_col = min(last_col, int(self.items_per_row[row]))
+        texts = self.get_row_text(row)[first_col:last_col]
+        return texts, self.get_style_range(index + first_col, index + last_col)
 
     def is_row_col_inside(self, row, col):
         if row >= 0 and row < self.num_rows:
@@ -1188,9 +1435,14 @@ class VariableWidthHexTable(HexTable):
         if col < 0:
             col = 0
         elif col >= self.items_per_row[row]:
-            col = self.items_per_row[row] - 1
+            col = int(self.items_per_row[row]) - 1
         return row, col
 
+    def enforce_valid_rows_cols(self, rows, cols):
+        rows = np.clip(rows, 0, self.num_rows - 1)
+        cols = np.clip(cols, 0, self.get_items_in_rows(rows) - 1)
+        return rows, cols
+
     def get_index_range(self, row, col):
         """Get the byte offset from start of file given row, col
         position.
@@ -1203,35 +1455,46 @@ class VariableWidthHexTable(HexTable):
             elif row > self.num_rows:
                 row = -1
             index = self.index_of_row[row]
-        index = min(index + col, index + self.items_per_row[row])
+        index = int(min(index + col, index + self.items_per_row[row]))
         return index, index + 1
 
+    def get_index_of_rows_cols(self, rows, cols):
+        rows = np.clip(rows, 0, self.num_rows - 1)
+        return self.index_of_row[rows] + np.minimum(cols, self.items_per_row[rows])
+
     def get_index_of_row(self, line):
-        return self.index_of_row[line]
+        return int(self.index_of_row[line])
 
     def get_start_end_index_of_row(self, row):
         index1, _ = self.get_index_range(row, 0)
-        index2 = index1 + self.items_per_row[row] - 1
+        index2 = index1 + int(self.items_per_row[row]) - 1
         return index1, index2
 
     def index_to_row_col(self, index):
-        try:
-            row = self.row_of_index[index]
-        except IndexError:
-            if index < 0:
-                row = 0
-                col = 0
-            else:
-                row = self.num_rows - 1
-                col = self.items_per_row[row] - 1
+        if index < 0:
+            row = 0
+            col = 0
+        elif index >= self.last_valid_index:
+            row = self.num_rows - 1
+            col = int(self.items_per_row[row]) - 1
         else:
-            start = self.index_of_row[row]
-            col = index - start
+            row = int(np.searchsorted(self.index_of_row, index, side="right")) - 1
+            col = index - int(self.index_of_row[row])
         # print(f"index_to_row_col: index={index} row={row} col={col}")
         return row, col
 
+    def index_to_rows_cols(self, indexes):
+        indexes = np.asarray(indexes, dtype=np.int64)
+        rows = np.searchsorted(self.index_of_row, indexes, side="right") - 1
+        rows = np.clip(rows, 0, self.num_rows - 1)
+        cols = indexes - self.index_of_row[rows]
+        cols[indexes < 0] = 0
+        after = indexes >= self.last_valid_index
+        cols[after] = self.items_per_row[rows[after]] - 1
+        return rows, cols
+
     def clamp_right_column(self, r, c):
-        c = self.items_per_row[r] - 1
+        c = int(self.items_per_row[r]) - 1
         return r, c
 
 
@@ -1694,6 +1957,7 @@ class CompactGrid(wx.ScrolledWindow, MouseEventMixin):
         #     self.table = table
         # if line_renderer is not None:
         #     self.line_renderer = line_renderer
+        self.table.invalidate_row_text()
         self.main.recalc_view(*args, **kwargs)
         self.calc_header_sizes()
         self.calc_scrolling()
@@ -1702,10 +1966,22 @@ class CompactGrid(wx.ScrolledWindow, MouseEventMixin):
         self.top.recalc_view()
 
     def refresh_view(self, *args, **kwargs):
+        """Redraw everything, assuming any of the data may have changed"""
+        self.table.invalidate_row_text()
+        self.redraw_view()
+
+    def redraw_view(self):
         self.Refresh()
         self.top.Refresh()
         self.left.Refresh()
 
+    def refresh_data_range(self, start_index=None, end_index=None):
+        """Redraw after the data in the range of indexes has changed, or
+        after any change if no range is given.
+        """
+        self.table.invalidate_row_text(start_index, end_index)
+        self.redraw_view()
+
     def refresh_headers(self):
         self.top.Refresh()
         self.left.Refresh()
@@ -1767,51 +2043,31 @@ class CompactGrid(wx.ScrolledWindow, MouseEventMixin):
         return self.keep_caret_on_screen(caret, flags)
 
     def draw_carets(self, dc, start_row, visible_rows):
-        caret_log.debug(f"draw_carets: using caret_handler {self.caret_handler}")
-        for caret in self.caret_handler.carets:
-            r, c = caret.rc
-            if r >= start_row and r < start_row + visible_rows:
-                if self.edit_source is not None:
-                    caret_log.debug("drawing edit cell at r,c=%d,%d" % (r, c))
-                    self.line_renderer.draw_edit_cell(self, dc, r, c, self.edit_source)
-                else:
-                    caret_log.debug(f"drawing caret at r,c={r},{c} for {self}")
-                    self.line_renderer.draw_caret(self, dc, r, c)
+        caret_log.debug("draw_carets: using caret_handler %s", self.caret_handler)
+        for r, c in self.caret_handler.get_visible_carets(start_row, visible_rows):
+            if self.edit_source is not None:
+                caret_log.debug("drawing edit cell at r,c=%d,%d" % (r, c))
+                self.line_renderer.draw_edit_cell(self, dc, r, c, self.edit_source)
             else:
-                caret_log.debug("skipping offscreen caret at r,c=%d,%d" % (r, c))
+                caret_log.debug(f"drawing caret at r,c={r},{c} for {self}")
+                self.line_renderer.draw_caret(self, dc, r, c)
 
     def calc_primary_caret_visible_info(self):
         start_row = self.main.first_visible_row
-        last_row = start_row + self.main.visible_rows
-        for caret in self.caret_handler.carets:
-            r, c = caret.rc
-            if r >= start_row and r < last_row:
-                row_info = index, r, r - start_row, c
-                break
-        else:
-            row_info = index, start_row, 0, 0
-        return row_info
+        rc = self.caret_handler.get_first_visible_caret(start_row, self.main.visible_rows)
+        if rc is None:
+            rc = (start_row, 0)
+        r, c = rc
+        index, _ = self.table.get_index_range(r, c)
+        return index, r, r - start_row, c
 
     def get_selected_ranges(self):
-        table = self.table
-        ch = self.caret_handler
-        ranges = []
-        for r in [c.range for c in ch.carets]:
-            start, _ = table.get_index_range(*r[0])
-            _, end = table.get_index_range(*r[1])
-            ranges.append((start, end))
-        return ranges
+        return self.caret_handler.get_selected_ranges(self.table)
 
     def get_selected_ranges_including_carets(self, ch=None):
-        table = self.table
         if ch is None:
             ch = self.caret_handler
-        ranges = []
-        for r in [c.range_including_caret for c in ch.carets]:
-            start, _ = table.get_index_range(*r[0])
-            _, end = table.get_index_range(*r[1])
-            ranges.append((start, end))
-        return ranges
+        return ch.get_selected_ranges_including_carets(self.table)
 
     def get_current_caret_index(self):
         c = self.caret_handler.current
@@ -1853,7 +2109,7 @@ class CompactGrid(wx.ScrolledWindow, MouseEventMixin):
         self.caret_handler.move_carets_to(0, 0)
 
     def caret_move_end_of_file(self, evt, flags):
-        self.caret_handler.move_carets_to_index(self.table.last_valid_index)
+        self.caret_handler.move_carets_to_index(self.table, self.table.last_valid_index)
 
     def caret_move_start_of_line(self, evt, flags):
         self.caret_handler.move_carets_process_function(self.table.clamp_left_column)
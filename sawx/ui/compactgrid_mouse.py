@@ -1,8 +1,10 @@
 import sys
 import functools
+import itertools
 import weakref
 
 import wx
+import numpy as np
 
 try:
     from atrcopy import match_bit_mask, comment_bit_mask, user_bit_mask, selected_bit_mask, diff_bit_mask
@@ -13,6 +15,11 @@ except ImportError:
     comment_bit_mask = 0x40
     selected_bit_mask = 0x80
 
+try:
+    from ..utils.sortutil import RangeSet
+except ImportError:
+    from sawx.utils.sortutil import RangeSet
+
 import logging
 logging.basicConfig()
 log = logging.getLogger(__name__)
@@ -158,126 +165,279 @@ class Caret:
                 table.set_selected_index_range(index1, index2)
 
 
+# Storage for the carets that aren't the current caret. Fields are in the same
+# order as Caret.serialize so records and caret states convert directly.
+caret_dtype = np.dtype([
+    ("rc", np.int64, 2),
+    ("anchor_start", np.int64, 2),
+    ("anchor_initial_start", np.int64, 2),
+    ("anchor_end", np.int64, 2),
+    ("anchor_initial_end", np.int64, 2),
+    ("rectangular", np.bool_),
+])
+
+
+def carets_to_store(carets):
+    return np.array([c.serialize() for c in carets], dtype=caret_dtype)
+
+
+def store_to_states(store):
+    """List of Caret.serialize states of the carets in the store"""
+    fields = [[tuple(p) for p in store[name].tolist()] for name in caret_dtype.names[:-1]]
+    fields.append(store["rectangular"].tolist())
+    return list(zip(*fields))
+
+
+def store_to_carets(store):
+    return [Caret(state=state) for state in store_to_states(store)]
+
+
+def calc_store_order(store):
+    """Sort order of the carets: by selection start if the caret has a
+    selection, otherwise by caret position. Same ordering as Caret.__lt__
+    """
+    has_sel = store["anchor_start"][:, 0] >= 0
+    key = np.where(has_sel[:, np.newaxis], store["anchor_start"], store["rc"])
+    return np.lexsort((key[:, 1], key[:, 0]))
+
+
+def calc_store_ranges(store):
+    """Selection start and end positions with the anchors swapped where
+    necessary so the start comes first, like Caret.range
+    """
+    s = store["anchor_start"]
+    e = store["anchor_end"]
+    swap = (e[:, 0] < s[:, 0]) | ((e[:, 0] == s[:, 0]) & (e[:, 1] < s[:, 1]))
+    swap = swap[:, np.newaxis]
+    return np.where(swap, e, s), np.where(swap, s, e)
+
+
+# versions are unique across handlers, so a state from one handler never
+# matches a different set of carets in another
+store_versions = itertools.count(1)
+
+
+def clear_store_selection(store):
+    for name in ("anchor_start", "anchor_initial_start", "anchor_end", "anchor_initial_end"):
+        store[name] = -1
+
+
 class MultiCaretHandler:
+    """Collection of carets, where the most recently added caret is the
+    current caret.
+
+    The current caret is a regular Caret object that may be modified in place
+    (the mouse handlers change it while dragging). All other carets are kept in
+    a structured numpy array, sorted in Caret order, so that operations on tens
+    of thousands of carets (e.g. from selecting all search matches) are
+    vectorized rather than looping over Caret objects.
+
+    Because the other carets aren't objects, `copy_carets` returns copies;
+    changes to them must be stored back using `set_carets`.
+
+    Every change to the store gets a new version number, so checking whether
+    the carets have changed only needs the version and the current caret
+    rather than serializing every caret.
+    """
     def __init__(self):
-        self.carets = []
+        self.store = np.zeros(0, dtype=caret_dtype)
+        self.version = next(store_versions)
+        self._current = None
 
     def __str__(self):
-        return "MultiCaretHandler: carets=" + " ".join([str(c) for c in self.carets])
+        num = len(self)
+        if num > 10:
+            return f"MultiCaretHandler: {num} carets, current={self._current}"
+        return "MultiCaretHandler: carets=" + " ".join([str(c) for c in self.copy_carets()])
 
     def __len__(self):
-        return len(self.carets)
+        return len(self.store) + (0 if self._current is None else 1)
+
+    def set_store(self, store, current=None, sort=True):
+        if sort and len(store) > 1:
+            store = store[calc_store_order(store)]
+        self.store = store
+        self.version = next(store_versions)
+        self._current = current
+
+    def copy_carets(self):
+        """List of copies of all the carets, the current caret last"""
+        return store_to_carets(self.calc_all_store())
+
+    def set_carets(self, carets):
+        """Replace all the carets; the last becomes the current caret"""
+        carets = list(carets)
+        current = carets.pop() if carets else None
+        self.set_store(carets_to_store(carets), current)
 
     @property
     def current(self):
-        return self.carets[-1]  # last one is the most recent
+        if self._current is None:
+            raise IndexError("No carets")
+        return self._current  # last one is the most recent
 
     @property
     def has_carets(self):
-        return len(self.carets) > 0
+        return len(self) > 0
 
     @property
     def has_selection(self):
-        for caret in self.carets:
-            if caret.has_selection:
-                return True
-        return False
+        if self._current is not None and self._current.has_selection:
+            return True
+        return bool((self.store["anchor_start"][:, 0] >= 0).any())
 
     @property
     def carets_with_selection(self):
-        for caret in self.carets:
-            if caret.has_selection:
-                yield caret
+        store = self.store[self.store["anchor_start"][:, 0] >= 0]
+        yield from store_to_carets(store)
+        if self._current is not None and self._current.has_selection:
+            yield self._current
 
     @property
     def selected_ranges(self):
-        return [c.range for c in self.carets if c.has_selection]
+        return [c.range for c in self.carets_with_selection]
+
+    def calc_all_store(self):
+        """Store containing all carets, with the current caret last"""
+        if self._current is None:
+            return self.store
+        return np.concatenate((self.store, carets_to_store([self._current])))
+
+    def set_all_store(self, store):
+        """Inverse of calc_all_store: the last caret is the current caret,
+        which is updated in place so references to it remain valid.
+        """
+        if len(store) == 0:
+            self.set_store(store)
+            return
+        current = self._current
+        state = store_to_carets(store[-1:])[0].serialize()
+        if current is None:
+            current = Caret(state=state)
+        else:
+            current.restore(state)
+        self.set_store(store[:-1], current)
 
     def copy(self):
         handler = MultiCaretHandler()
-        handler.carets = [c.copy() for c in self.carets]
+        current = None if self._current is None else self._current.copy()
+        handler.set_store(self.store.copy(), current, False)
+        handler.version = self.version
         return handler
 
+    def serialize(self):
+        return store_to_states(self.calc_all_store())
+
     def new_carets(self, caret_state):
-        self.carets = [Caret(state=s) for s in caret_state]
+        self.set_carets([Caret(state=s) for s in caret_state])
 
     def calc_state(self):
-        return [caret.serialize() for caret in self.carets]
+        """Cheap snapshot for change detection, not for restoring carets; use
+        `serialize` for that.
+        """
+        current = None if self._current is None else self._current.serialize()
+        return (self.version, current)
 
     def has_changed_state(self, other_state):
         current = self.calc_state()
         return current == other_state
 
     def convert_to_indexes(self, table):
-        index_list = []
-        for caret in self.carets:
-            index, _ = table.get_index_range(*caret.rc)
-            if caret.anchor_start[0] < 0:
-                anchor_start = -1
-            else:
-                anchor_start, _ = table.get_index_range(*caret.anchor_start)
-            if caret.anchor_end[0] < 0:
-                anchor_end = -1
-            else:
-                anchor_end, _ = table.get_index_range(*caret.anchor_end)
-            index_list.append((index, anchor_start, anchor_end))
-        return index_list
+        store = self.calc_all_store()
+        rc = store["rc"]
+        index = table.get_index_of_rows_cols(rc[:, 0], rc[:, 1])
+        anchors = []
+        for name in ("anchor_start", "anchor_end"):
+            a = store[name]
+            anchor_index = table.get_index_of_rows_cols(a[:, 0], a[:, 1])
+            anchors.append(np.where(a[:, 0] < 0, -1, anchor_index))
+        return list(zip(index.tolist(), anchors[0].tolist(), anchors[1].tolist()))
 
     def convert_from_indexes(self, table, indexes):
-        self.carets = []
-        for index, anchor_start, anchor_end in indexes:
-            r, c = table.index_to_row_col(index)
-            caret = Caret(r, c)
-            r, c = table.index_to_row_col(anchor_start)
-            caret.anchor_start = self.anchor_initial_start = (r, c)
-            r, c = table.index_to_row_col(anchor_end)
-            caret.anchor_end = self.anchor_initial_end = (r, c)
-            self.carets.append(caret)
+        indexes = np.asarray(indexes, dtype=np.int64).reshape(-1, 3)
+        store = np.zeros(len(indexes), dtype=caret_dtype)
+        store["rc"] = np.column_stack(table.index_to_rows_cols(indexes[:, 0]))
+        for i, name in [(1, "anchor_start"), (2, "anchor_end")]:
+            anchor = np.column_stack(table.index_to_rows_cols(indexes[:, i]))
+            anchor[indexes[:, i] < 0] = -1
+            store[name] = anchor
+            store[name.replace("anchor_", "anchor_initial_")] = anchor
+        self.set_all_store(store)
+
+    def set_selected_index_ranges(self, table, ranges):
+        """Replace the carets with one caret per range of selected indexes,
+        the caret placed at the end of each selection.
+        """
+        ranges = np.asarray(ranges, dtype=np.int64).reshape(-1, 2)
+        ranges = ranges[ranges[:, 1] > ranges[:, 0]]
+        store = np.zeros(len(ranges), dtype=caret_dtype)
+        start = np.column_stack(table.index_to_rows_cols(ranges[:, 0]))
+        end = np.column_stack(table.index_to_rows_cols(ranges[:, 1] - 1))
+        store["rc"] = end
+        store["anchor_start"] = store["anchor_initial_start"] = start
+        store["anchor_end"] = store["anchor_initial_end"] = end
+        self.set_all_store(store)
 
     def add_caret(self, caret):
-        self.carets.append(caret)
+        if self._current is None:
+            store = self.store
+        else:
+            store = np.concatenate((self.store, carets_to_store([self._current])))
+        self.set_store(store, caret)
+
+    def force_single_caret(self, caret):
+        self.set_store(np.zeros(0, dtype=caret_dtype), caret)
 
     def move_carets_vertically(self, table, delta_r):
         caret_log.debug(f"moving vertically: {delta_r}")
-        for caret in self.carets:
-            caret.rc = table.enforce_valid_row_col(caret.rc[0] + delta_r, caret.rc[1])
-            caret.clear_selection()
+        store = self.calc_all_store().copy()
+        rc = store["rc"]
+        rc[:, 0], rc[:, 1] = table.enforce_valid_rows_cols(rc[:, 0] + delta_r, rc[:, 1])
+        clear_store_selection(store)
+        self.set_all_store(store)
         self.validate_carets()
 
     def move_carets_horizontally(self, table, delta_c, wrap=False):
         caret_log.debug(f"moving horizontally: {delta_c}")
-        for caret in self.carets:
-            r = caret.rc[0]
-            c = caret.rc[1] + delta_c
-            if wrap and not table.is_row_col_inside(r, c):
-                if c < 0:
-                    r -= 1
-                    c += table.get_items_in_row(r)
-                else:
-                    r += 1
-                    c -= table.get_items_in_row(r)
-            caret.rc = table.enforce_valid_row_col(r, c)
-            caret.clear_selection()
+        store = self.calc_all_store().copy()
+        rc = store["rc"]
+        r = rc[:, 0].copy()
+        c = rc[:, 1] + delta_c
+        if wrap:
+            outside = ~table.are_rows_cols_inside(r, c)
+            before = outside & (c < 0)
+            after = outside & (c >= 0)
+            r[before] -= 1
+            c[before] += table.get_items_in_rows(r[before])
+            c[after] -= table.get_items_in_rows(r[after])
+            r[after] += 1
+        rc[:, 0], rc[:, 1] = table.enforce_valid_rows_cols(r, c)
+        clear_store_selection(store)
+        self.set_all_store(store)
         self.validate_carets()
 
     def move_carets_to(self, r, c):
-        self.carets = [Caret(r, c)]
+        self.force_single_caret(Caret(r, c))
 
     def move_current_caret_to(self, r, c):
         try:
-            caret = self.carets[-1]
+            caret = self.current
             caret.rc = r, c
         except IndexError:
             self.move_carets_to(r, c)
 
     def move_current_caret_to_index(self, table, index):
         r, c = table.index_to_row_col(index)
-        self.carets = [Caret(r, c)]
+        self.move_carets_to(r, c)
+
+    move_carets_to_index = move_current_caret_to_index
 
     def move_carets_process_function(self, func):
-        for caret in self.carets:
-            caret.rc = func(*caret.rc)
-            caret.clear_selection()
+        store = self.calc_all_store().copy()
+        rc = [func(r, c) for r, c in store["rc"].tolist()]
+        store["rc"] = np.asarray(rc, dtype=np.int64).reshape(-1, 2)
+        clear_store_selection(store)
+        self.set_all_store(store)
 
     def validate_carets(self):
         # new_carets = []
@@ -290,67 +450,155 @@ class MultiCaretHandler:
     def validate_caret_position(self, table, index):
         return table.enforce_valid_index(index)
 
+    def get_first_visible_caret(self, start_row, visible_rows):
+        """Return the (row, col) of the first caret in the visible rows, in the
+        same order as copy_carets, or None if none are visible
+        """
+        last_row = start_row + visible_rows
+        rows = self.store["rc"][:, 0]
+        visible = np.nonzero((rows >= start_row) & (rows < last_row))[0]
+        if len(visible) > 0:
+            return tuple(self.store["rc"][visible[0]].tolist())
+        if self._current is not None and start_row <= self._current.rc[0] < last_row:
+            return self._current.rc
+        return None
+
+    def get_visible_carets(self, start_row, visible_rows):
+        """Return a list of (row, col) of the carets in the visible rows"""
+        rc = self.calc_all_store()["rc"]
+        visible = (rc[:, 0] >= start_row) & (rc[:, 0] < start_row + visible_rows)
+        return [tuple(p) for p in rc[visible].tolist()]
+
     def refresh_style_from_selection(self, table):
-        table.clear_selected_style()
-        for caret in self.carets:
-            caret.add_selection_to_style(table)
+        """Update the table's selection overlay from the carets.
+
+        Returns the RangeSet of indexes whose selection state changed.
+        """
+        return table.set_selected_ranges(self.get_selected_range_set(table))
 
     def collapse_overlapping(self):
         """Check if the current caret selection overlaps any existing caret and
         merge any overlaps into the current caret.
+
+        The result is the same as checking each of the other carets in sorted
+        order with Caret.contains and Caret.merge: selections wholly within the
+        current selection are removed, overlapping selections are merged into
+        it, and standalone carets are kept. If the current caret has no
+        selection, only duplicates of it are removed. The current caret object
+        remains the current caret.
         """
-        caret_log.debug("before collapsed carets: {str(self.carets)}")
-        try:
-            current = self.carets.pop()
-        except IndexError:
-            # No carets! Can't be an overlap
+        caret_log.debug(f"before collapsed carets: {self}")
+        current = self._current
+        if current is None or len(self.store) == 0:
+            # Nothing to overlap
             return
-        if self.carets:
-            if current.has_selection:
-                collapsed = []
-                for c in self.carets:
-                    if current.contains(c):
-                        # gets rid of any selections wholly contained within
-                        # the current selection, or any standalone carets
-                        # inside the selection
-                        continue
-                    elif current.intersects(c):
-                        current.merge(c)
-                    else:
-                        collapsed.append(c)
-                self.carets = collapsed
-            else:
-                # Merge caret into selection
-                collapsed = []
-                for c in self.carets:
-                    if current.has_selection:
-                        # if caret has been merged into a selection, don't do
-                        # any further checking.
-                        collapsed.append(c)
-                    else:
-                        if not c.has_selection and c.rc == current.rc:
-                            # gets rid of any duplicate carets
-                            continue
-                        elif c.contains(current):
-                            # if caret inside a selection, make the that the
-                            # current caret
-                            current = c
-                        else:
-                            collapsed.append(c)
-                self.carets = collapsed
-        self.carets.append(current)
-        caret_log.debug(f"collapsed carets {str(self.carets)}")
+        store = self.store
+        has_sel = store["anchor_start"][:, 0] >= 0
+        rc = store["rc"]
+
+        # compare positions as single integers rather than (row, col) tuples
+        cols = [int(np.abs(store[name][:, 1]).max()) for name in ("rc", "anchor_start", "anchor_end")]
+        cols.extend([abs(current.rc[1]), abs(current.anchor_start[1]), abs(current.anchor_end[1])])
+        width = max(cols) + 2
+
+        def flat(pos):
+            pos = np.asarray(pos, dtype=np.int64)
+            return pos[..., 0] * width + pos[..., 1]
+
+        remove = np.zeros(len(store), dtype=np.bool_)
+        if current.has_selection:
+            # selections are in order of their start, so the ones merged are a
+            # run beginning with the first selection that reaches the current
+            # selection, each starting before the end of the current selection
+            # as extended by the ones before it
+            sel_index = np.nonzero(has_sel)[0]
+            s = flat(store["anchor_start"][sel_index])
+            e = flat(store["anchor_end"][sel_index])
+            cs = flat(current.anchor_start)
+            ce = flat(current.anchor_end)
+            reaching = np.nonzero(e >= cs)[0]
+            if len(reaching) > 0:
+                first = reaching[0]
+                sel_index = sel_index[first:]
+                s = s[first:]
+                e = e[first:]
+                end_before = np.maximum.accumulate(np.append(ce, e))[:-1]
+                absorbed = s <= end_before
+                count = len(absorbed) if absorbed.all() else np.argmin(absorbed)
+                sel_index = sel_index[:count]
+                remove[sel_index] = True
+                if count > 0:
+                    new_rc = current.rc
+                    i = sel_index[0]
+                    if s[0] < cs:
+                        current.anchor_start = tuple(store["anchor_start"][i].tolist())
+                        current.anchor_initial_start = tuple(store["anchor_initial_start"][i].tolist())
+                        new_rc = min(new_rc, tuple(rc[i].tolist()))
+                    extends = np.nonzero(e[:count] > end_before[:count])[0]
+                    if len(extends) > 0:
+                        i = sel_index[extends[np.argmax(e[extends])]]
+                        current.anchor_end = tuple(store["anchor_end"][i].tolist())
+                        current.anchor_initial_end = tuple(store["anchor_initial_end"][i].tolist())
+                        i = sel_index[extends[np.argmax(flat(rc[sel_index[extends]]))]]
+                        new_rc = max(new_rc, tuple(rc[i].tolist()))
+                    current.rc = new_rc
+        else:
+            # gets rid of any duplicate carets
+            remove = ~has_sel & (flat(rc) == flat(current.rc))
+        self.set_store(store[~remove], current, False)
+        caret_log.debug(f"collapsed carets {self}")
 
     def collapse_selections_to_carets(self):
-        for caret in self.carets:
-            caret.clear_selection()
+        store = self.store.copy()
+        clear_store_selection(store)
+        if self._current is not None:
+            self._current.clear_selection()
+        self.set_store(store, self._current)
+
+    def calc_index_ranges(self, table, include_carets=False):
+        """Arrays of start and end indexes of the selections of each caret.
+
+        Carets without a selection are skipped unless include_carets is True,
+        in which case they produce a range containing only the caret index.
+        """
+        store = self.calc_all_store()
+        has_sel = store["anchor_start"][:, 0] >= 0
+        if include_carets:
+            store = store.copy()
+            no_sel = ~has_sel
+            for name in ("anchor_start", "anchor_end"):
+                store[name][no_sel] = store["rc"][no_sel]
+        else:
+            store = store[has_sel]
+        s, e = calc_store_ranges(store)
+        starts = table.get_index_of_rows_cols(s[:, 0], s[:, 1])
+        ends = table.get_index_of_rows_cols(e[:, 0], e[:, 1]) + 1
+        return starts, ends
+
+    def get_selected_ranges(self, table):
+        starts, ends = self.calc_index_ranges(table)
+        return list(zip(starts.tolist(), ends.tolist()))
+
+    def get_selected_ranges_including_carets(self, table):
+        starts, ends = self.calc_index_ranges(table, True)
+        return list(zip(starts.tolist(), ends.tolist()))
+
+    def get_selected_range_set(self, table):
+        starts, ends = self.calc_index_ranges(table)
+        return RangeSet.from_arrays(starts, ends)
 
     def get_selected_ranges_and_indexes(self, table):
-        opt = self.get_selected_ranges(table)
-        return opt, ranges_to_indexes(opt)
+        """Return the collapsed list of selected ranges and an array of every
+        selected index.
+
+        Use `get_selected_range_set` instead if the individual indexes aren't
+        needed, since it doesn't create an entry for every selected byte.
+        """
+        selected = self.get_selected_range_set(table)
+        return selected.to_list(), selected.to_indexes()
 
     def invert_selection_ranges(self, table, ranges):
-        return invert_ranges(ranges, caret_handler.document_length)
+        return RangeSet(ranges).invert(table.last_valid_index).to_list()
 
     def process_char_flags(self, flags):
         """Perform the UI updates given the StatusFlags or BatchFlags flags
@@ -605,20 +853,15 @@ class MouseMode(object):
     def select_ranges(self, caret_handler, ranges, refresh=True):
         """ Selects the specified ranges
         """
-        caret_handler.carets.selected_ranges = ranges
-        try:
-            start, end = caret_handler.carets.selected_ranges[-1]
-        except IndexError:
-            start, end = 0, 0
-        caret_handler.anchor_start_index = caret_handler.anchor_initial_start_index = start
-        caret_handler.anchor_end_index = caret_handler.anchor_initial_end_index = end
+        caret_handler.set_selected_index_ranges(self.control.table, ranges)
         self.highlight_selected_ranges(caret_handler)
         self.control.update_ui_for_selection_change()
 
     def select_invert(self, caret_handler, refresh=True):
         """ Selects the entire document
         """
-        ranges = self.invert_selection_ranges(caret_handler, caret_handler.carets.selected_ranges)
+        t = self.control.table
+        ranges = caret_handler.invert_selection_ranges(t, caret_handler.get_selected_ranges(t))
         self.select_ranges(caret_handler, ranges, refresh)
 
     def select_range(self, caret_handler, start, end, add=False, extend=False):
@@ -634,11 +877,11 @@ class MouseMode(object):
         else:
             caret = Caret(end)
             caret.set_initial_selection(start, end)
-            caret_handler.carets.force_single_caret(caret)
+            caret_handler.force_single_caret(caret)
         self.refresh_ranges(caret_handler)
 
     def refresh_ranges(self, caret_handler):
-        log.debug("refreshing ranges: %s" % str(caret_handler.carets))
+        log.debug("refreshing ranges: %s", caret_handler)
         self.highlight_selected_ranges(caret_handler)
         self.control.update_ui_for_selection_change()
 
@@ -727,13 +970,14 @@ class NormalSelectMode(MouseMode):
         row, col, inside = cg.get_row_col_from_event(evt)
         if inside:
             index, _ = cg.table.get_index_range(row, col)
-            style = cg.table.segment.style[index]
+            in_selection = cg.table.is_index_selected(index)
         else:
-            style = 0
+            index = None
+            in_selection = False
         popup_data = {
             'control': cg,
             'index': index,
-            'in_selection': style&0x80,
+            'in_selection': in_selection,
             'row': row,
             'col': col,
             'inside': inside,
@@ -1240,7 +1484,7 @@ class MouseEventMixin:
         elif evt.ShiftDown():
             self.multi_select_mode = False
             self.select_extend_mode = True
-        mode_log.debug(f"start before: {ch.carets}, multi {self.multi_select_mode}, extend {self.select_extend_mode}")
+        mode_log.debug(f"start before: {ch}, multi {self.multi_select_mode}, extend {self.select_extend_mode}")
         if self.select_extend_mode:
             caret = ch.current
             if mouse_at < caret.anchor_start:
@@ -1277,7 +1521,7 @@ class MouseEventMixin:
                 self.pending_select_awaiting_drag = mouse_at
                 mode_log.debug("handle_select_start placing cursor: flags: %s, rc=%s" % (flags, mouse_at))
         self.commit_change(flags)
-        mode_log.debug(f"start after: {ch.carets}")
+        mode_log.debug(f"start after: {ch}")
 
     def handle_select_motion(self, evt, row, col, flags=None):
         if not self.mouse_drag_started:
@@ -1294,7 +1538,7 @@ class MouseEventMixin:
         mouse_at = (r, c)
         mode_log.debug("handle_select_motion: r=%d c=%d pending: %s, flags: %s" % (r, c, str(self.pending_select_awaiting_drag), flags))
         # mode_log.debug("handle_select_motion: r=%d c=%d index1: %s, index2: %s pending: %s, sel rows: %s anchors: initial=%s current=%s" % (r, c, index1, index2, str(self.pending_select_awaiting_drag), flags.selecting_rows, str((caret.anchor_initial_start_index, caret.anchor_initial_end_index)), str((caret.anchor_start_index, caret.anchor_end_index))))
-        mode_log.debug(("motion before:", ch.carets))
+        mode_log.debug(("motion before:", ch))
         caret = ch.current
         if c < 0 or flags.selecting_rows or not inside:
             selecting_rows = True
@@ -1368,16 +1612,16 @@ class MouseEventMixin:
             mode_log.debug("Extra refresh on handle_select_end for windows")
             self.refresh_view()
         self.commit_change(flags)
-        mode_log.debug(("end after:", self.caret_handler.carets))
+        mode_log.debug(("end after:", self.caret_handler))
 
     def commit_change(self, flags):
-        mode_log.debug(("commit before:", self.caret_handler.carets))
+        mode_log.debug(("commit before:", self.caret_handler))
         self.mouse_mode.refresh_ranges(self.caret_handler)
         self.send_caret_event(flags)
         # self.caret_handler.sync_caret_event = flags
         # self.caret_handler.ensure_visible_event = flags
         # self.caret_handler.refresh_event = flags
-        mode_log.debug(("commit after:", self.caret_handler.carets))
+        mode_log.debug(("commit after:", self.caret_handler))
 
     def get_start_end_index_of_row(self, row):
         raise NotImplementedError
@@ -2,6 +2,7 @@ import sys
 import time
 
 import wx
+import wx.adv
 import wx.lib.scrolledpanel
 import wx.lib.filebrowsebutton as filebrowse
 
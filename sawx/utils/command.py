@@ -298,7 +298,7 @@ class StatusFlags(object):
                 if f1 < s1:
                     s1 = f1
                 if f2 > s2:
-                    s2 = f1
+                    s2 = f2
                 self.index_range = (s1, s2)
 
         if flags.caret_index is not None:
@@ -387,6 +387,20 @@ class Command(object):
     def perform_setup(self, document):
         pass
 
+    def calc_change_range(self, editor):
+        """Return the (start, end) byte range of the document data that
+        performing (or undoing or redoing) the command will change in place,
+        or None if it's not known before the command is performed.
+
+        Once performed, undo and redo change the same range that was reported
+        in the index_range of the command's flags. Commands that know the
+        range in advance can override this.
+        """
+        flags = self.last_flags
+        if flags is not None and flags.byte_values_changed:
+            return flags.index_range
+        return None
+
     def do_change(self, editor, undo_info):
         raise NotImplementedError
 
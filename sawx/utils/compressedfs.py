@@ -0,0 +1,494 @@
+"""Seekable access to gzip, bz2 and xz compressed files
+
+A CompressedFile is a read-only, seekable file object of the decompressed
+data. Compressed streams can only be decompressed from the start, so random
+access is provided by a CompressedIndex of checkpoints where decompression
+can be restarted:
+
+* for gzip, a copy of the decompressor state is kept every
+  checkpoint_interval bytes of output, so reaching any position needs at most
+  that many bytes to be decompressed
+* the start of each gzip member or bz2/xz stream (e.g. files created by pigz,
+  pbzip2 or concatenation) is a checkpoint for every format
+
+The decompressor state can't be saved outside of the process, so only the
+stream boundaries and the length of the decompressed data are saved in the
+index_cache_dir (when set), which means the length of a file is known
+immediately the next time it's opened. Recently decompressed blocks are kept
+in a cache shared by all the file objects for the same file, so moving back
+and forth in a small region doesn't decompress the data again.
+"""
+import io
+import os
+import bz2
+import json
+import lzma
+import zlib
+import bisect
+import hashlib
+import threading
+import collections
+
+import logging
+log = logging.getLogger(__name__)
+
+
+# persisted indexes are saved here if it's not None
+index_cache_dir = None
+
+magic = [
+    ("gzip", b"\x1f\x8b"),
+    ("bz2", b"BZh"),
+    ("xz", b"\xfd7zXZ\x00"),
+]
+
+extensions = {
+    ".gz": "gzip",
+    ".bz2": "bz2",
+    ".xz": "xz",
+}
+
+# number of file indexes kept
+max_cached_indexes = 16
+
+
+def detect_compression(header):
+    """Return the name of the compression format from the first bytes of a
+    file, or None if it's not a recognized format
+    """
+    for name, m in magic:
+        if header.startswith(m):
+            return name
+    return None
+
+
+def is_valid_compressed_start(compression, data):
+    """Check that the first block of a file can be decompressed, so a file
+    that only happens to start with the magic bytes isn't treated as
+    compressed
+    """
+    d = new_decompressor(compression)
+    try:
+        out = d.decompress(data, CompressedFile.max_output_size)
+    except (OSError, EOFError, ValueError, zlib.error, lzma.LZMAError) as e:
+        log.debug(f"not {compression} data: {e}")
+        return False
+    if not out and not d.eof and len(data) < CompressedFile.input_chunk_size:
+        # the whole file was read without producing anything
+        log.debug(f"not {compression} data: no decompressed output")
+        return False
+    return True
+
+
+def detect_stream_compression(fh):
+    """Return the compression format of the file object, or None if it's not
+    a recognized format or its first block can't be decompressed
+    """
+    fh.seek(0)
+    data = fh.read(CompressedFile.input_chunk_size)
+    fh.seek(0)
+    compression = detect_compression(data)
+    if compression is not None and not is_valid_compressed_start(compression, data):
+        compression = None
+    return compression
+
+
+def detect_file_compression(path):
+    with open(path, "rb") as fh:
+        return detect_stream_compression(fh)
+
+
+def get_compression(fh):
+    """Return the compression format if the file object was opened by
+    open_compressed, otherwise None
+    """
+    raw = getattr(fh, "raw", fh)
+    return raw.compression if isinstance(raw, CompressedFile) else None
+
+
+def compression_of_path(path):
+    """Return the compression format implied by the extension of path"""
+    _, ext = os.path.splitext(path)
+    return extensions.get(ext.lower(), None)
+
+
+def new_decompressor(compression):
+    if compression == "gzip":
+        return zlib.decompressobj(zlib.MAX_WBITS | 16)
+    elif compression == "bz2":
+        return bz2.BZ2Decompressor()
+    elif compression == "xz":
+        return lzma.LZMADecompressor()
+    raise ValueError(f"Unknown compression '{compression}'")
+
+
+def new_compressor(compression):
+    if compression == "gzip":
+        return zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    elif compression == "bz2":
+        return bz2.BZ2Compressor()
+    elif compression == "xz":
+        return lzma.LZMACompressor()
+    raise ValueError(f"Unknown compression '{compression}'")
+
+
+Checkpoint = collections.namedtuple("Checkpoint", ["out_offset", "in_offset", "decompressor"])
+
+
+class CompressedIndex:
+    checkpoint_interval = 8 * 1024 * 1024
+
+    block_size = 256 * 1024
+
+    max_cached_blocks = 64
+
+    def __init__(self, compression, stat_key=None):
+        self.compression = compression
+        self.stat_key = stat_key
+        # decompressor is None for the start of a stream
+        self.checkpoints = [Checkpoint(0, 0, None)]
+        self.size = None
+        self.blocks = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def __str__(self):
+        return f"CompressedIndex: {self.compression}, {len(self.checkpoints)} checkpoints, size={self.size}"
+
+    def find_checkpoint(self, pos):
+        """Return the last checkpoint at or before the decompressed
+        position pos
+        """
+        with self.lock:
+            i = bisect.bisect_right(self.checkpoints, (pos, float("inf"))) - 1
+            return self.checkpoints[i]
+
+    def add_checkpoint(self, out_offset, in_offset, decompressor=None):
+        with self.lock:
+            i = bisect.bisect_right(self.checkpoints, (out_offset, float("inf")))
+            previous = self.checkpoints[i - 1]
+            if previous.out_offset == out_offset:
+                if decompressor is None and previous.decompressor is not None:
+                    self.checkpoints[i - 1] = Checkpoint(out_offset, in_offset, None)
+                return
+            if decompressor is not None:
+                # state snapshots are only needed every checkpoint_interval
+                following = self.checkpoints[i].out_offset if i < len(self.checkpoints) else None
+                if out_offset - previous.out_offset < self.checkpoint_interval:
+                    return
+                if following is not None and following - out_offset < self.checkpoint_interval:
+                    return
+            self.checkpoints.insert(i, Checkpoint(out_offset, in_offset, decompressor))
+
+    def get_block(self, block_index):
+        with self.lock:
+            block = self.blocks.pop(block_index, None)
+            if block is not None:
+                self.blocks[block_index] = block
+            return block
+
+    def add_block(self, block_index, block):
+        with self.lock:
+            self.blocks[block_index] = block
+            if len(self.blocks) > self.max_cached_blocks:
+                self.blocks.popitem(last=False)
+
+    #### persistence
+
+    @classmethod
+    def get_cache_path(cls, path):
+        name = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()
+        return os.path.join(index_cache_dir, name + ".json")
+
+    def to_json(self):
+        return {
+            "compression": self.compression,
+            "stat": self.stat_key,
+            "size": self.size,
+            "streams": [[c.out_offset, c.in_offset] for c in self.checkpoints if c.decompressor is None],
+        }
+
+    def save(self, path):
+        if index_cache_dir is None or self.stat_key is None:
+            return
+        cache_path = self.get_cache_path(path)
+        try:
+            with open(cache_path + ".tmp", "w") as fh:
+                json.dump(self.to_json(), fh)
+            os.replace(cache_path + ".tmp", cache_path)
+        except OSError as e:
+            log.warning(f"can't save compressed file index {cache_path}: {e}")
+
+    @classmethod
+    def load(cls, path, compression, stat_key):
+        index = cls(compression, stat_key)
+        if index_cache_dir is None:
+            return index
+        try:
+            with open(cls.get_cache_path(path)) as fh:
+                j = json.load(fh)
+            if j["compression"] != compression or tuple(j["stat"]) != stat_key:
+                return index
+            for out_offset, in_offset in j["streams"]:
+                index.add_checkpoint(out_offset, in_offset)
+            index.size = j["size"]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        else:
+            log.debug(f"loaded {index} for {path}")
+        return index
+
+
+class CompressedFile(io.RawIOBase):
+    # amount of compressed data decompressed at once
+    input_chunk_size = 64 * 1024
+
+    max_output_size = 1024 * 1024
+
+    def __init__(self, fh, compression, index=None, path=None):
+        io.RawIOBase.__init__(self)
+        self.fh = fh
+        self.compression = compression
+        if index is None:
+            index = CompressedIndex(compression)
+        self.index = index
+        self.path = path
+        self.pos = 0
+        self.decompressor = None
+        self.in_pos = 0
+        self.out_pos = 0
+        self.pending = b""
+        self.output = bytearray()
+        self.output_start = 0
+
+    def __str__(self):
+        return f"CompressedFile: {self.path}, {self.index}"
+
+    def close(self):
+        if not self.closed:
+            self.fh.close()
+        io.RawIOBase.close(self)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    @property
+    def size(self):
+        """Length of the decompressed data, which may require decompressing
+        the whole file if it hasn't been done before
+        """
+        if self.index.size is None:
+            checkpoint = self.index.find_checkpoint(float("inf"))
+            if self.decompressor is None or checkpoint.out_offset > self.out_pos:
+                self.restore(checkpoint)
+            self.decompress_to(None)
+        return self.index.size
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self.pos + offset
+        elif whence == io.SEEK_END:
+            pos = self.size + offset
+        else:
+            raise ValueError(f"invalid whence ({whence})")
+        if pos < 0:
+            raise ValueError(f"negative seek position {pos}")
+        self.pos = pos
+        return pos
+
+    #### decompression
+
+    def restore(self, checkpoint):
+        self.in_pos = checkpoint.in_offset
+        self.out_pos = checkpoint.out_offset
+        if checkpoint.decompressor is None:
+            self.decompressor = new_decompressor(self.compression)
+        else:
+            self.decompressor = checkpoint.decompressor.copy()
+        self.pending = b""
+        self.output = bytearray()
+        self.output_start = self.out_pos
+
+    def read_input(self):
+        self.fh.seek(self.in_pos + len(self.pending))
+        data = self.fh.read(self.input_chunk_size)
+        self.pending += data
+        return len(data) > 0
+
+    def decompress_step(self):
+        """Decompress the next chunk of input, returning False at the end of
+        the compressed data
+        """
+        d = self.decompressor
+        if d.eof:
+            # end of a stream; another one may follow
+            if len(self.pending) < 8:
+                self.read_input()
+            if detect_compression(self.pending) != self.compression:
+                self.finish()
+                return False
+            self.decompressor = d = new_decompressor(self.compression)
+            self.index.add_checkpoint(self.out_pos, self.in_pos)
+        is_gzip = self.compression == "gzip"
+        if not is_gzip and not d.needs_input:
+            # bz2 and lzma have buffered input that hasn't been used yet
+            data = b""
+        else:
+            if not self.pending and not self.read_input():
+                # truncated file
+                log.warning(f"{self.path}: compressed data ended unexpectedly")
+                self.finish()
+                return False
+            data = self.pending
+        # limit the output so highly compressed data doesn't use lots of memory
+        out = d.decompress(data, self.max_output_size)
+        if d.eof:
+            unused = len(d.unused_data)
+        elif is_gzip:
+            unused = len(d.unconsumed_tail)
+        else:
+            unused = 0
+        self.in_pos += len(data) - unused
+        self.pending = data[len(data) - unused:]
+        self.out_pos += len(out)
+        self.output.extend(out)
+        if is_gzip and not d.eof:
+            if self.out_pos - self.index.find_checkpoint(self.out_pos).out_offset >= self.index.checkpoint_interval:
+                self.index.add_checkpoint(self.out_pos, self.in_pos, d.copy())
+        return True
+
+    def finish(self):
+        if self.index.size is None:
+            self.index.size = self.out_pos
+            log.debug(f"finished decompressing {self}")
+            if self.path is not None:
+                self.index.save(self.path)
+
+    def decompress_to(self, end, block_index=None):
+        """Decompress until the output reaches end (or the end of the data if
+        end is None), adding complete blocks to the block cache.
+
+        Returns the block with the given index if it was decompressed, which
+        may have already been evicted from the cache by the blocks after it.
+        """
+        bs = self.index.block_size
+        wanted = None
+        while end is None or self.out_pos < end:
+            more = self.decompress_step()
+            # only blocks starting at a block boundary can be cached
+            skip = -self.output_start % bs
+            if skip:
+                skip = min(skip, len(self.output))
+                del self.output[:skip]
+                self.output_start += skip
+            while len(self.output) >= bs or (not more and self.output):
+                block = bytes(self.output[:bs])
+                i = self.output_start // bs
+                self.index.add_block(i, block)
+                if i == block_index:
+                    wanted = block
+                del self.output[:bs]
+                self.output_start += len(block)
+            if not more:
+                break
+        return wanted
+
+    def get_block(self, block_index):
+        block = self.index.get_block(block_index)
+        if block is not None:
+            return block
+        bs = self.index.block_size
+        start = block_index * bs
+        if self.index.size is not None and start >= self.index.size:
+            return b""
+        checkpoint = self.index.find_checkpoint(start)
+        if self.decompressor is None or self.output_start > start or checkpoint.out_offset > self.out_pos:
+            self.restore(checkpoint)
+        block = self.decompress_to(start + bs, block_index)
+        if block is None:
+            if self.index.size is None or start < self.index.size:
+                raise OSError(f"{self.path}: failed decompressing block {block_index}")
+            return b""
+        return block
+
+    def read_at(self, pos, count):
+        bs = self.index.block_size
+        pieces = []
+        end = pos + count
+        while pos < end:
+            block = self.get_block(pos // bs)
+            offset = pos % bs
+            piece = block[offset:offset + end - pos]
+            if not piece:
+                break
+            pieces.append(piece)
+            pos += len(piece)
+        return b"".join(pieces)
+
+    def readinto(self, buffer):
+        data = self.read_at(self.pos, len(buffer))
+        n = len(data)
+        buffer[:n] = data
+        self.pos += n
+        return n
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            return self.readall()
+        data = self.read_at(self.pos, size)
+        self.pos += len(data)
+        return data
+
+    def readall(self):
+        pieces = []
+        while True:
+            data = self.read(1024 * 1024)
+            if not data:
+                break
+            pieces.append(data)
+        return b"".join(pieces)
+
+
+indexes = collections.OrderedDict()
+
+indexes_lock = threading.Lock()
+
+
+def get_compressed_index(path, compression):
+    """Return the (cached) CompressedIndex for the file"""
+    key = os.path.abspath(path)
+    stat = os.stat(key)
+    stat_key = (stat.st_size, stat.st_mtime_ns)
+    with indexes_lock:
+        index = indexes.pop(key, None)
+        if index is None or index.stat_key != stat_key or index.compression != compression:
+            index = CompressedIndex.load(key, compression, stat_key)
+            if len(indexes) >= max_cached_indexes:
+                indexes.popitem(last=False)
+        indexes[key] = index
+        return index
+
+
+def open_compressed(path, mode="rb", compression=None):
+    """Open the compressed file, returning a file object of the
+    decompressed data
+    """
+    if mode not in ("r", "rb"):
+        raise ValueError(f"invalid mode for compressed file: '{mode}'")
+    fh = open(path, "rb")
+    if compression is None:
+        compression = detect_stream_compression(fh)
+        if compression is None:
+            fh.close()
+            raise ValueError(f"{path} is not a compressed file")
+    raw = CompressedFile(fh, compression, get_compressed_index(path, compression), path)
+    if mode == "rb":
+        return io.BufferedReader(raw)
+    return io.TextIOWrapper(io.BufferedReader(raw), encoding="utf-8")
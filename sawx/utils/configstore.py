@@ -0,0 +1,149 @@
+"""Key/value store for configuration data
+
+All values are read from a single sqlite database when the store is opened
+and kept in memory, so reading never touches the disk. Changes are written
+by a background thread after a short delay, batching changes made in quick
+succession into a single transaction, so saving a value never blocks the
+user interface.
+"""
+import os
+import time
+import atexit
+import sqlite3
+import threading
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class ConfigStore:
+    # seconds to wait after a change for further changes before writing
+    write_delay = 0.5
+
+    def __init__(self, path, write_delay=None):
+        self.path = path
+        if write_delay is not None:
+            self.write_delay = write_delay
+        # the lock protects the cache and the dirty list; the database is
+        # only written while holding the write_lock, so callers of set never
+        # wait for the disk
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.cache = {}
+        self.dirty = {}
+        self.is_closed = False
+        try:
+            self.connection = self.open_database()
+            self.load()
+        except sqlite3.DatabaseError as e:
+            log.error(f"Unreadable config database {self.path}: {e}; starting a new one")
+            os.replace(self.path, self.path + ".bad")
+            self.connection = self.open_database()
+            self.load()
+        self.writer = threading.Thread(target=self.write_behind, name="ConfigStore", daemon=True)
+        self.writer.start()
+        atexit.register(self.close)
+
+    def __str__(self):
+        return f"ConfigStore: {self.path}, {len(self.cache)} entries, {len(self.dirty)} unsaved"
+
+    def __contains__(self, name):
+        return name in self.cache
+
+    def open_database(self):
+        dirname = os.path.dirname(self.path)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("CREATE TABLE IF NOT EXISTS config (name TEXT PRIMARY KEY, value BLOB)")
+        return connection
+
+    def load(self):
+        with self.lock:
+            rows = self.connection.execute("SELECT name, value FROM config").fetchall()
+            self.cache = dict(rows)
+        log.debug(f"loaded {len(self.cache)} entries from {self.path}")
+
+    def get(self, name, default=None):
+        return self.cache.get(name, default)
+
+    def set(self, name, value):
+        """Store the value (a str or bytes) for the name. The value is
+        available immediately but is written to the database later.
+        """
+        with self.lock:
+            if self.is_closed:
+                raise RuntimeError(f"{self.path} is closed")
+            self.cache[name] = value
+            self.dirty[name] = value
+            self.changed.notify()
+
+    def delete(self, name):
+        with self.lock:
+            self.cache.pop(name, None)
+            self.dirty[name] = None
+            self.changed.notify()
+
+    def names(self):
+        return list(self.cache.keys())
+
+    def write_behind(self):
+        while True:
+            with self.lock:
+                while not self.dirty and not self.is_closed:
+                    self.changed.wait()
+                if self.is_closed:
+                    return
+                # gather any further changes before writing
+                deadline = time.monotonic() + self.write_delay
+                while not self.is_closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.changed.wait(remaining)
+            self._commit()
+
+    def _commit(self):
+        # the changes are taken while holding the write_lock so that commits
+        # from flush and the writer thread can't be applied out of order
+        with self.write_lock:
+            with self.lock:
+                dirty = self.dirty
+                self.dirty = {}
+            if not dirty:
+                return
+            try:
+                self.connection.execute("BEGIN")
+                self.connection.executemany("INSERT OR REPLACE INTO config (name, value) VALUES (?, ?)", [(k, v) for k, v in dirty.items() if v is not None])
+                self.connection.executemany("DELETE FROM config WHERE name = ?", [(k,) for k, v in dirty.items() if v is None])
+                self.connection.execute("COMMIT")
+            except sqlite3.Error as e:
+                log.error(f"Failed writing {len(dirty)} entries to {self.path}: {e}")
+                try:
+                    self.connection.execute("ROLLBACK")
+                except sqlite3.Error:
+                    pass
+                # keep the changes so they can be retried, unless they have
+                # been replaced by newer values in the meantime
+                with self.lock:
+                    dirty.update(self.dirty)
+                    self.dirty = dirty
+            else:
+                log.debug(f"wrote {len(dirty)} entries to {self.path}")
+
+    def flush(self):
+        """Write all pending changes, waiting until they are committed"""
+        self._commit()
+
+    def close(self):
+        with self.lock:
+            if self.is_closed:
+                return
+            self.is_closed = True
+            self.changed.notify()
+        self.writer.join()
+        self._commit()
+        self.connection.close()
+        atexit.unregister(self.close)
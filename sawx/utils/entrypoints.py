@@ -0,0 +1,185 @@
+"""Index of the entry points of installed packages
+
+Plugins (documents, loaders, editors and remember hooks) are found through
+entry points. Importing pkg_resources to find them is one of the slowest
+parts of startup, and even the standard library's importlib.metadata has to
+read the metadata of every installed package. An EntryPointIndex reads them
+once and saves the result in index_cache_path (when set), so later runs only
+need to check the modification times of the directories on sys.path, which
+change when packages are installed or removed, and of the entry_points.txt
+files of the packages in them, which change when a package is reinstalled.
+
+An entry point in the cached index whose module can't be found causes the
+index to be rebuilt, which handles packages that have been changed in place
+(e.g. development installs).
+"""
+import os
+import sys
+import glob
+import json
+import importlib
+
+import logging
+log = logging.getLogger(__name__)
+
+
+# the index is saved here if it's not None
+index_cache_path = None
+
+
+class EntryPoint:
+    def __init__(self, name, value, group):
+        self.name = name
+        self.value = value
+        self.group = group
+
+    def __str__(self):
+        return f"EntryPoint: {self.group}: {self.name} = {self.value}"
+
+    @property
+    def module_name(self):
+        return self.value.split(":", 1)[0].strip()
+
+    def load(self):
+        obj = importlib.import_module(self.module_name)
+        if ":" in self.value:
+            for attr in self.value.split(":", 1)[1].strip().split("."):
+                obj = getattr(obj, attr)
+        return obj
+
+
+def get_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def calc_entry_points_mtimes(path):
+    mtimes = []
+    for pattern in ["*.dist-info", "*.egg-info"]:
+        for filename in sorted(glob.glob(os.path.join(glob.escape(path), pattern, "entry_points.txt"))):
+            mtimes.append([os.path.relpath(filename, path), get_mtime(filename)])
+    return mtimes
+
+
+def calc_fingerprint(paths=None):
+    if paths is None:
+        paths = sys.path
+    fingerprint = []
+    for path in paths:
+        if not path:
+            # the current directory
+            continue
+        fingerprint.append([path, get_mtime(path), calc_entry_points_mtimes(path)])
+    return fingerprint
+
+
+def scan_entry_points():
+    """Return a dict of group name to the list of (name, value) of its entry
+    points. Only the first distribution found of each package is used, in
+    the same order as sys.path.
+    """
+    import importlib.metadata
+
+    groups = {}
+    seen = set()
+    for dist in importlib.metadata.distributions():
+        name = dist.name
+        if name is None:
+            continue
+        key = name.lower().replace("-", "_")
+        if key in seen:
+            continue
+        seen.add(key)
+        for ep in dist.entry_points:
+            groups.setdefault(ep.group, []).append([ep.name, ep.value])
+    return groups
+
+
+class EntryPointIndex:
+    def __init__(self):
+        self.groups = None
+        self.is_from_cache = False
+
+    def __str__(self):
+        if self.groups is None:
+            return "EntryPointIndex: not loaded"
+        return f"EntryPointIndex: {sum(len(g) for g in self.groups.values())} entry points in {len(self.groups)} groups, from_cache={self.is_from_cache}"
+
+    def invalidate(self):
+        self.groups = None
+
+    def refresh(self):
+        if self.groups is not None:
+            return
+        fingerprint = calc_fingerprint()
+        if self.load(fingerprint):
+            self.is_from_cache = True
+        else:
+            self.groups = scan_entry_points()
+            self.is_from_cache = False
+            self.save(fingerprint)
+        log.debug(f"refreshed {self}")
+
+    def rescan(self):
+        """Rebuild the index if it came from the cache, returning True if it
+        was rebuilt
+        """
+        if self.groups is not None and not self.is_from_cache:
+            return False
+        self.groups = scan_entry_points()
+        self.is_from_cache = False
+        self.save(calc_fingerprint())
+        log.debug(f"rescanned {self}")
+        return True
+
+    def load(self, fingerprint):
+        if index_cache_path is None:
+            return False
+        try:
+            with open(index_cache_path) as fh:
+                j = json.load(fh)
+            if j["fingerprint"] != fingerprint:
+                return False
+            self.groups = j["groups"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+        return True
+
+    def save(self, fingerprint):
+        if index_cache_path is None:
+            return
+        try:
+            with open(index_cache_path + ".tmp", "w") as fh:
+                json.dump({"fingerprint": fingerprint, "groups": self.groups}, fh)
+            os.replace(index_cache_path + ".tmp", index_cache_path)
+        except OSError as e:
+            log.warning(f"can't save entry point index {index_cache_path}: {e}")
+
+    def get(self, group):
+        self.refresh()
+        return [EntryPoint(name, value, group) for name, value in self.groups.get(group, [])]
+
+
+entry_point_index = EntryPointIndex()
+
+
+def iter_entry_points(group):
+    """Yield the EntryPoint objects in the group"""
+    yield from entry_point_index.get(group)
+
+
+def load_entry_point(entry_point):
+    """Load the entry point, rebuilding the index and trying again once if
+    its module no longer exists
+    """
+    try:
+        return entry_point.load()
+    except ModuleNotFoundError:
+        if not entry_point_index.rescan():
+            raise
+    for ep in entry_point_index.get(entry_point.group):
+        if ep.name == entry_point.name:
+            return ep.load()
+    raise ModuleNotFoundError(f"{entry_point} no longer exists")
@@ -22,6 +22,9 @@ class ExpandZip(object):
     of the item in the archive to the pathname on disk.
 
     The temporary directory will be deleted when this object goes out of scope.
+
+    To read individual members without extracting the whole archive, use a
+    zip:// URI (see utils.zipfs) instead.
     """
     def __init__(self, archive_path_or_zipfile, skip_files=[]):
         if hasattr(archive_path_or_zipfile, 'infolist'):
@@ -0,0 +1,366 @@
+"""Random access to files on HTTP servers without downloading them
+
+URIs starting with http:// or https:// are opened by open_http_uri as
+seekable file objects that request only the blocks that are read, using HTTP
+Range requests. Blocks are kept in an in-memory LRU cache shared by all the
+file objects for the same URL and, if block_cache_dir is set, on disk so they
+don't need to be requested again the next time the URL is opened. Disk blocks
+are discarded when the server reports a different size, ETag or modification
+time for the URL (and aren't saved if it reports neither of the latter), and the least recently used URLs are removed when the disk
+cache grows larger than max_disk_cache_size.
+
+Servers that don't support Range requests send the whole file in response to
+the first request, which is then read into a temporary file. That copy is
+reused until a HEAD request shows a different size, ETag or modification time,
+or for the rest of the session if the server doesn't give enough information
+to tell.
+"""
+import io
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+import collections
+import urllib.error
+import urllib.request
+
+from .zipfs import MemberFile
+
+import logging
+log = logging.getLogger(__name__)
+
+
+# blocks are saved here if it's not None
+block_cache_dir = None
+
+max_disk_cache_size = 1024 * 1024 * 1024
+
+# number of URLs kept
+max_cached_resources = 16
+
+
+def parse_content_range(value):
+    """Return the total size from a Content-Range header like
+    "bytes 0-99/1234", or None if it's unknown
+    """
+    try:
+        total = value.rsplit("/", 1)[1]
+    except (AttributeError, IndexError):
+        return None
+    return None if total == "*" else int(total)
+
+
+class HttpResource:
+    block_size = 256 * 1024
+
+    max_cached_blocks = 64
+
+    timeout = 30
+
+    def __init__(self, url):
+        self.url = url
+        self.blocks = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.num_requests = 0
+        self.full_file = None
+        self.cache_dir = None
+        self.size = None
+        self.validator = None
+        self.open()
+
+    def __str__(self):
+        return f"HttpResource: {self.url}, size={self.size}, {len(self.blocks)} blocks cached, {self.num_requests} requests"
+
+    def close(self):
+        with self.lock:
+            self.blocks.clear()
+            if self.full_file is not None:
+                self.full_file.close()
+                self.full_file = None
+
+    def urlopen(self, start=None, end=None, method=None):
+        headers = {}
+        if start is not None:
+            headers["Range"] = f"bytes={start}-{end - 1}"
+        request = urllib.request.Request(self.url, headers=headers, method=method)
+        self.num_requests += 1
+        try:
+            return urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            if e.code == 404 or e.code == 410:
+                raise FileNotFoundError(f"{self.url}: {e}")
+            if e.code == 416:
+                # range not satisfiable, i.e. an empty file
+                return None
+            raise
+
+    def open(self):
+        """Request the first block, which also gives the size of the file and
+        whether the server supports Range requests
+        """
+        response = self.urlopen(0, self.block_size)
+        if response is None:
+            self.size = 0
+            return
+        with response:
+            headers = response.info()
+            if response.status == 206:
+                self.size = parse_content_range(headers.get("Content-Range"))
+            if self.size is None:
+                log.debug(f"{self.url}: no range support, reading whole file")
+                self.full_file = tempfile.TemporaryFile()
+                shutil.copyfileobj(response, self.full_file, self.block_size)
+                self.size = self.full_file.tell()
+                if headers.get("ETag") or headers.get("Last-Modified"):
+                    self.validator = [self.size, headers.get("ETag"), headers.get("Last-Modified")]
+                return
+            first = response.read()
+        self.validator = [self.size, headers.get("ETag"), headers.get("Last-Modified")]
+        self.open_disk_cache()
+        self.add_block(0, first)
+
+    def is_current(self):
+        """Check that the file hasn't changed on the server since the
+        resource was created
+        """
+        if self.validator is None:
+            # a downloaded copy that can't be checked is used for the rest of
+            # the session rather than downloading the whole file every time
+            return self.full_file is not None
+        if self.full_file is not None:
+            return self.is_full_file_current()
+        try:
+            response = self.urlopen(0, 1)
+            if response is None:
+                return self.size == 0
+            with response:
+                if response.status != 206:
+                    return False
+                headers = response.info()
+                validator = [parse_content_range(headers.get("Content-Range")), headers.get("ETag"), headers.get("Last-Modified")]
+        except OSError:
+            return False
+        return validator == self.validator
+
+    def is_full_file_current(self):
+        try:
+            response = self.urlopen(method="HEAD")
+            with response:
+                headers = response.info()
+        except urllib.error.HTTPError as e:
+            log.debug(f"{self.url}: can't check for changes, using downloaded copy: {e}")
+            return True
+        except OSError:
+            return False
+        size = headers.get("Content-Length")
+        size = self.size if size is None else int(size)
+        return [size, headers.get("ETag"), headers.get("Last-Modified")] == self.validator
+
+    #### block cache
+
+    def get_block(self, block_index):
+        with self.lock:
+            block = self.blocks.pop(block_index, None)
+            if block is not None:
+                self.blocks[block_index] = block
+                return block
+        block = self.load_disk_block(block_index)
+        if block is not None:
+            self.add_block(block_index, block, False)
+        return block
+
+    def add_block(self, block_index, block, save=True):
+        with self.lock:
+            self.blocks[block_index] = block
+            if len(self.blocks) > self.max_cached_blocks:
+                self.blocks.popitem(last=False)
+        if save:
+            self.save_disk_block(block_index, block)
+
+    def fetch_blocks(self, first, last):
+        """Request the blocks from first up to (not including) last in a
+        single request, returning the list of blocks
+        """
+        bs = self.block_size
+        start = first * bs
+        end = min(last * bs, self.size)
+        log.debug(f"{self.url}: requesting bytes {start}-{end}")
+        response = self.urlopen(start, end)
+        if response is None:
+            raise OSError(f"{self.url}: range {start}-{end} not satisfiable")
+        with response:
+            if response.status != 206:
+                raise OSError(f"{self.url}: server stopped honoring range requests")
+            data = response.read()
+        if len(data) != end - start:
+            raise OSError(f"{self.url}: expected {end - start} bytes, received {len(data)}")
+        blocks = [data[i:i + bs] for i in range(0, len(data), bs)]
+        for i, block in enumerate(blocks):
+            self.add_block(first + i, block)
+        return blocks
+
+    def read_at(self, pos, count):
+        end = min(pos + count, self.size)
+        if pos >= end:
+            return b""
+        if self.full_file is not None:
+            with self.lock:
+                self.full_file.seek(pos)
+                return self.full_file.read(end - pos)
+        bs = self.block_size
+        first = pos // bs
+        last = (end + bs - 1) // bs
+        blocks = [self.get_block(i) for i in range(first, last)]
+        i = 0
+        while i < len(blocks):
+            if blocks[i] is None:
+                # consecutive missing blocks are requested together
+                j = i
+                while j < len(blocks) and blocks[j] is None:
+                    j += 1
+                blocks[i:j] = self.fetch_blocks(first + i, first + j)
+                i = j
+            else:
+                i += 1
+        data = b"".join(blocks)
+        offset = pos - first * bs
+        return data[offset:offset + end - pos]
+
+    #### disk cache
+
+    def open_disk_cache(self):
+        if block_cache_dir is None:
+            return
+        if self.validator[1] is None and self.validator[2] is None:
+            # without an ETag or modification time, changes that keep the
+            # same size couldn't be detected the next time the URL is opened
+            log.debug(f"{self.url}: no validator, not caching blocks on disk")
+            return
+        name = hashlib.sha1(self.url.encode("utf-8")).hexdigest()
+        self.cache_dir = os.path.join(block_cache_dir, name)
+        info_path = os.path.join(self.cache_dir, "info.json")
+        try:
+            with open(info_path) as fh:
+                info = json.load(fh)
+            if info["url"] == self.url and info["validator"] == self.validator:
+                # marks the directory as recently used
+                os.utime(info_path)
+                return
+            log.debug(f"{self.url} has changed, removing cached blocks")
+        except (OSError, ValueError, KeyError):
+            pass
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        try:
+            os.makedirs(self.cache_dir)
+            with open(info_path, "w") as fh:
+                json.dump({"url": self.url, "validator": self.validator}, fh)
+        except OSError as e:
+            log.warning(f"can't create block cache for {self.url}: {e}")
+            self.cache_dir = None
+            return
+        prune_disk_cache(self.cache_dir)
+
+    def get_disk_block_path(self, block_index):
+        return os.path.join(self.cache_dir, f"{block_index:08d}.block")
+
+    def load_disk_block(self, block_index):
+        if self.cache_dir is None:
+            return None
+        try:
+            with open(self.get_disk_block_path(block_index), "rb") as fh:
+                return fh.read()
+        except OSError:
+            return None
+
+    def save_disk_block(self, block_index, block):
+        if self.cache_dir is None:
+            return
+        path = self.get_disk_block_path(block_index)
+        try:
+            with open(path + ".tmp", "wb") as fh:
+                fh.write(block)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            log.warning(f"can't save block {block_index} of {self.url}: {e}")
+
+
+def prune_disk_cache(keep=None):
+    """Remove the least recently used URLs from the disk cache until it's no
+    larger than max_disk_cache_size, never removing the keep directory
+    """
+    if block_cache_dir is None:
+        return
+    entries = []
+    total = 0
+    for name in os.listdir(block_cache_dir):
+        path = os.path.join(block_cache_dir, name)
+        try:
+            used = os.stat(os.path.join(path, "info.json")).st_mtime
+            size = sum(entry.stat().st_size for entry in os.scandir(path))
+        except OSError:
+            continue
+        entries.append((used, path, size))
+        total += size
+    for used, path, size in sorted(entries):
+        if total <= max_disk_cache_size:
+            break
+        if path != keep:
+            log.debug(f"removing {path} from block cache")
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+
+class HttpFile(MemberFile):
+    def __init__(self, resource):
+        MemberFile.__init__(self, resource.size)
+        self.resource = resource
+
+    def read_at(self, pos, count):
+        return self.resource.read_at(pos, count)
+
+
+resources = collections.OrderedDict()
+
+resources_lock = threading.Lock()
+
+
+def get_http_resource(url):
+    """Return the (cached) HttpResource for the URL, which is checked with
+    the server each time to make sure it hasn't changed
+    """
+    with resources_lock:
+        resource = resources.pop(url, None)
+    if resource is not None and not resource.is_current():
+        resource = None
+    if resource is None:
+        resource = HttpResource(url)
+        log.debug(f"opened {resource}")
+    with resources_lock:
+        if len(resources) >= max_cached_resources:
+            # not closed, because HttpFiles may still be reading from it; its
+            # memory is freed when they are
+            resources.popitem(last=False)
+        resources[url] = resource
+    return resource
+
+
+def open_http_uri(uri, mode="rb"):
+    if mode not in ("r", "rb"):
+        raise ValueError(f"invalid mode for http filesystem: '{mode}'")
+    resource = get_http_resource(uri)
+    # buffering a block at a time means small reads don't request more than
+    # the block containing them
+    fh = io.BufferedReader(HttpFile(resource), resource.block_size)
+    if mode == "rb":
+        return fh
+    return io.TextIOWrapper(fh, encoding="utf-8")
+
+
+def open_http(path, mode="rb"):
+    return open_http_uri("http://" + path, mode)
+
+
+def open_https(path, mode="rb"):
+    return open_http_uri("https://" + path, mode)
@@ -0,0 +1,104 @@
+"""Report of the time spent importing modules during startup
+
+Setting the environment variable SAWX_IMPORT_REPORT before sawx is imported
+installs an ImportTimer that records how long each module takes to import
+the first time. When the first frame has been shown, the time since sawx was
+imported and the slowest modules are printed. The value of the variable is
+the number of modules to list (default 25).
+
+Times are inclusive, i.e. include the modules imported by that module, so
+the "self" column shows the time spent in the module itself.
+"""
+import os
+import sys
+import time
+import builtins
+import importlib.util
+
+
+env_var = "SAWX_IMPORT_REPORT"
+
+start_time = time.perf_counter()
+
+
+class ImportTimer:
+    def __init__(self):
+        self.times = {}
+        self.stack = []
+        self.marks = []
+        self.original_import = None
+
+    def install(self):
+        if self.original_import is None:
+            self.original_import = builtins.__import__
+            builtins.__import__ = self.timed_import
+
+    def uninstall(self):
+        if self.original_import is not None:
+            builtins.__import__ = self.original_import
+            self.original_import = None
+
+    def resolve(self, name, globals, level):
+        if level > 0:
+            package = globals.get("__package__") if globals else None
+            try:
+                return importlib.util.resolve_name("." * level + name, package)
+            except (ImportError, ValueError):
+                return name
+        return name
+
+    def timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        resolved = self.resolve(name, globals, level)
+        if resolved in sys.modules and not fromlist:
+            return self.original_import(name, globals, locals, fromlist, level)
+        num_modules = len(sys.modules)
+        self.stack.append(0.0)
+        t = time.perf_counter()
+        try:
+            return self.original_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - t
+            children = self.stack.pop()
+            if len(sys.modules) > num_modules:
+                if self.stack:
+                    self.stack[-1] += elapsed
+                self.times[resolved] = (elapsed, elapsed - children)
+
+    def mark(self, label):
+        self.marks.append((label, time.perf_counter() - start_time))
+
+    def get_report(self, limit=25):
+        lines = []
+        for label, elapsed in self.marks:
+            lines.append(f"{label}: {elapsed * 1000:.1f}ms since sawx import")
+        total = sum(s for _, s in self.times.values())
+        lines.append(f"{len(self.times)} imports, {total * 1000:.1f}ms total")
+        lines.append(f"{'inclusive':>10} {'self':>10}  module")
+        slowest = sorted(self.times.items(), key=lambda item: item[1][0], reverse=True)
+        for name, (inclusive, self_time) in slowest[:limit]:
+            lines.append(f"{inclusive * 1000:8.1f}ms {self_time * 1000:8.1f}ms  {name}")
+        return "\n".join(lines)
+
+
+import_timer = None
+
+
+def install_from_environment():
+    global import_timer
+
+    if env_var in os.environ and import_timer is None:
+        import_timer = ImportTimer()
+        import_timer.install()
+
+
+def report_startup(label="first frame shown"):
+    """Print the report if the import timer is active"""
+    if import_timer is None:
+        return
+    import_timer.uninstall()
+    import_timer.mark(label)
+    try:
+        limit = int(os.environ.get(env_var) or 25)
+    except ValueError:
+        limit = 25
+    print(import_timer.get_report(limit))
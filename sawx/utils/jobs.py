@@ -69,6 +69,25 @@ class Job(object):
         pass
 
 
+class ThreadJob(Job):
+    """Job that runs in a thread of the main process, so it can use the same
+    objects (e.g. document data) as the GUI.
+
+    Long running jobs should check is_cancelled periodically and return early
+    if it has been set.
+    """
+    def __init__(self, job_id=None):
+        Job.__init__(self, job_id)
+        self._cancel_event = threading.Event()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    @property
+    def is_cancelled(self):
+        return self._cancel_event.is_set()
+
+
 class ProcessJob(Job):
     def _start(self, results):
         raise RuntimeError("Abstract method")
@@ -136,11 +155,17 @@ class JobDispatcher(object):
 
 
 class ThreadJobDispatcher(threading.Thread, JobDispatcher):
+    # dispatcher is kept by the JobManager to handle all future jobs
+    is_persistent = True
+
     def __init__(self, share_input_queue_with=None):
         threading.Thread.__init__(self)
         JobDispatcher.__init__(self, share_input_queue_with)
         self.log = log
 
+    def _progress_update(self, item):
+        self._manager._progress_report(item)
+
     def start_processing(self):
 #        self.setDaemon(True)
         self.start()
@@ -164,6 +189,32 @@ class ThreadJobDispatcher(threading.Thread, JobDispatcher):
             self._manager._job_done(job)
 
 
+class ThreadPerJobDispatcher(ThreadJobDispatcher):
+    # a new daemon thread is created for each job, so a long job (e.g.
+    # building an index) doesn't hold up the others and doesn't keep the
+    # application from exiting
+    is_persistent = False
+
+    def __init__(self, *args, **kwargs):
+        ThreadJobDispatcher.__init__(self, *args, **kwargs)
+        self.daemon = True
+        self._job = None
+
+    def add_job(self, job):
+        self._job = job
+        self.name = job.get_name()
+        self.start()
+
+    def run(self):
+        job = self._job
+        try:
+            job._start(self)
+        except Exception as e:
+            import traceback
+            job.exception = traceback.format_exc()
+        self._manager._job_done(job, self)
+
+
 class ProcessJobDispatcher(ThreadJobDispatcher):
     def __init__(self, *args, **kwargs):
         ThreadJobDispatcher.__init__(self, *args, **kwargs)
@@ -249,6 +300,9 @@ class LargeMemoryWorker(multiprocessing.Process):
 
 
 class LargeMemoryJobDispatcher(ThreadJobDispatcher):
+    # a new dispatcher is created for each job
+    is_persistent = False
+
     def __init__(self, *args, **kwargs):
         ThreadJobDispatcher.__init__(self, *args, **kwargs)
         self._multiprocessing_progress = multiprocessing.Queue()
@@ -342,7 +396,7 @@ class JobManager(object):
         self.job_id_handlers = {}
         self._finished = queue.Queue()
         self.dispatchers = []
-        self.dispatcher_classes = [LargeMemoryJobDispatcher]
+        self.dispatcher_classes = [LargeMemoryJobDispatcher, ThreadPerJobDispatcher]
         self.timer = Timer(event_callback)
 
     def start_ticks(self, resolution, expire_time):
@@ -358,7 +412,10 @@ class JobManager(object):
         for dispatcher_cls in self.dispatcher_classes:
             if dispatcher_cls.can_handle(job):
                 dispatcher = dispatcher_cls()
-                dispatcher.set_manager(self)
+                if dispatcher.is_persistent:
+                    self.start_dispatcher(dispatcher)
+                else:
+                    dispatcher.set_manager(self)
                 return dispatcher
         return None
 
@@ -473,6 +530,19 @@ def get_global_job_manager():
     return GlobalJobManager
 
 
+def start_thread_job(job, name=None, job_manager=None):
+    """Run the ThreadJob using the job manager, or in a daemon thread of its
+    own if there's no job manager to handle it.
+    """
+    if job_manager is None:
+        job_manager = get_global_job_manager()
+    if job_manager is None or not job_manager.add_job(job):
+        if name is None:
+            name = job.__class__.__name__
+        thread = threading.Thread(target=job._start, args=(None,), name=name, daemon=True)
+        thread.start()
+
+
 if __name__ == '__main__':
     import functools
 
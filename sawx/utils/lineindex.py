@@ -0,0 +1,148 @@
+"""Line offsets of large text files
+
+A LineIndex records the offset of the start of each line in a byte buffer
+(usually a memory mapped file). The buffer is scanned one chunk at a time,
+normally by a LineIndexJob in the background, and the lines found so far can
+be used while the rest of the file is still being scanned.
+
+Lines end with "\\n", "\\r\\n" or "\\r", the same as textutil.LineStats.
+"""
+import threading
+
+import numpy as np
+
+from .jobs import ThreadJob
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class LineIndex:
+    chunk_size = 16 * 1024 * 1024
+
+    def __init__(self, data, encoding="utf-8"):
+        self.data = np.asarray(data, dtype=np.uint8) if not isinstance(data, np.ndarray) else data.view(np.uint8)
+        self.size = len(self.data)
+        self.encoding = encoding
+        self.scanned = 0
+        self.lock = threading.Lock()
+        self._chunks = [np.zeros(1, dtype=np.int64)]
+        self._line_starts = self._chunks[0]
+
+    def __str__(self):
+        return f"LineIndex: {self.num_lines} lines in {self.scanned} of {self.size} bytes"
+
+    @property
+    def is_complete(self):
+        return self.scanned >= self.size
+
+    @property
+    def progress(self):
+        return 1.0 if self.size == 0 else self.scanned / self.size
+
+    def scan_next(self, chunk_size=None):
+        """Find the lines in the next chunk of data, returning True when the
+        whole buffer has been scanned.
+        """
+        if self.is_complete:
+            return True
+        if chunk_size is None:
+            chunk_size = self.chunk_size
+        start = self.scanned
+        end = min(start + chunk_size, self.size)
+        d = self.data[start:end]
+        lf = d == 10
+        eol = lf.copy()
+        # a CR followed by LF is part of the CRLF line ending, so a CR at the
+        # end of the chunk needs the first byte of the next chunk
+        following = np.append(lf[1:], self.data[end] == 10 if end < self.size else False)
+        eol |= (d == 13) & ~following
+        starts = np.flatnonzero(eol).astype(np.int64) + (start + 1)
+        with self.lock:
+            if len(starts) > 0:
+                self._chunks.append(starts)
+                self._line_starts = None
+            self.scanned = end
+        return self.is_complete
+
+    def scan_all(self):
+        while not self.scan_next():
+            pass
+
+    @property
+    def line_starts(self):
+        """Offsets of the start of each line found so far"""
+        with self.lock:
+            if self._line_starts is None:
+                self._line_starts = np.concatenate(self._chunks)
+                self._chunks = [self._line_starts]
+            return self._line_starts
+
+    @property
+    def num_lines(self):
+        """Number of lines found so far. The line following the last line
+        ending only counts once the whole buffer has been scanned.
+        """
+        n = len(self.line_starts)
+        if not self.is_complete:
+            n -= 1
+        return n
+
+    def line_of_index(self, index):
+        """Return the line containing the byte at index"""
+        return int(np.searchsorted(self.line_starts, index, side="right") - 1)
+
+    def index_of_line(self, line):
+        """Return the offset of the first byte of the line"""
+        return int(self.line_starts[line])
+
+    def get_line_range(self, line):
+        """Return the start and end offsets of the line, not including the
+        line ending
+        """
+        starts = self.line_starts
+        start = int(starts[line])
+        if line + 1 < len(starts):
+            end = int(starts[line + 1]) - 1
+            if end > start and self.data[end] == 10 and self.data[end - 1] == 13:
+                end -= 1
+        else:
+            end = self.scanned
+        return start, end
+
+    def get_line_bytes(self, line):
+        start, end = self.get_line_range(line)
+        return self.data[start:end].tobytes()
+
+    def get_line_text(self, line):
+        return self.get_line_bytes(line).decode(self.encoding, errors="replace")
+
+    def get_lines_text(self, first_line, last_line):
+        """Return the text of the lines from first_line up to (but not
+        including) last_line
+        """
+        last_line = min(last_line, self.num_lines)
+        return [self.get_line_text(line) for line in range(first_line, last_line)]
+
+
+class LineIndexJob(ThreadJob):
+    """Scan the whole buffer of a LineIndex, calling the callback after each
+    chunk with the job as the argument.
+    """
+    def __init__(self, line_index, callback=None):
+        ThreadJob.__init__(self)
+        self.line_index = line_index
+        self.callback = callback
+
+    def get_name(self):
+        return f"line index job: {self.line_index}"
+
+    def _start(self, dispatcher):
+        index = self.line_index
+        while not self.is_cancelled:
+            done = index.scan_next()
+            if self.callback is not None:
+                self.callback(self)
+            if done:
+                log.debug(f"finished {index}")
+                break
@@ -0,0 +1,199 @@
+"""N-gram index of binary data
+
+The index lists, for every 3 byte sequence in the data, the offsets where it
+occurs. Searching for a literal pattern only has to check the offsets of the
+rarest n-gram in the pattern rather than scanning the whole document.
+
+Indexes are saved in the cache directory using the fingerprint of the data
+as the filename, so reopening an unchanged file reuses the index. Edits are
+handled by marking the changed region as dirty; searches scan the dirty
+regions directly until the index is rebuilt.
+"""
+import os
+import hashlib
+
+import numpy as np
+
+from .jobs import ThreadJob
+from .sortutil import RangeSet
+
+import logging
+log = logging.getLogger(__name__)
+
+
+def calc_fingerprint(data):
+    h = hashlib.blake2b(memoryview(np.ascontiguousarray(data)).cast("B"), digest_size=16)
+    return "%s-%d" % (h.hexdigest(), len(data))
+
+
+class NgramIndex:
+    n = 3
+
+    # dirty regions larger than this fraction of the data make the index
+    # not worth using
+    max_dirty_fraction = .05
+
+    # checking more candidates than this takes longer than the background
+    # scan takes to show its first results, so common n-grams aren't used
+    max_candidates = 4 * 1024 * 1024
+
+    def __init__(self, keys, key_starts, positions, size, fingerprint=None):
+        self.keys = keys
+        self.key_starts = key_starts
+        self.positions = positions
+        self.size = size
+        self.fingerprint = fingerprint
+        self.dirty = RangeSet()
+
+    def __str__(self):
+        return f"NgramIndex: {len(self.keys)} keys, {len(self.positions)} positions, size={self.size}"
+
+    @classmethod
+    def calc_keys(cls, data):
+        d = np.asarray(data, dtype=np.uint8)
+        keys = d[:-2].astype(np.uint32) << 16
+        keys |= d[1:-1].astype(np.uint32) << 8
+        keys |= d[2:]
+        return keys
+
+    @classmethod
+    def from_data(cls, data, fingerprint=None):
+        size = len(data)
+        pos_dtype = np.uint32 if size < 2**32 else np.int64
+        if size < cls.n:
+            empty = np.zeros(0, dtype=np.uint32)
+            return cls(empty, np.zeros(1, dtype=np.int64), empty.astype(pos_dtype), size, fingerprint)
+        keys = cls.calc_keys(data)
+        positions = np.argsort(keys, kind="stable").astype(pos_dtype)
+        sorted_keys = keys[positions]
+        del keys
+        change = np.flatnonzero(sorted_keys[1:] != sorted_keys[:-1]) + 1
+        key_starts = np.concatenate(([0], change, [len(sorted_keys)])).astype(np.int64)
+        unique_keys = sorted_keys[key_starts[:-1]]
+        return cls(unique_keys, key_starts, positions, size, fingerprint)
+
+    #### persistence
+
+    @classmethod
+    def get_paths(cls, dirname, fingerprint):
+        return {name: os.path.join(dirname, f"{fingerprint}.{name}.npy") for name in ["keys", "key_starts", "positions"]}
+
+    def save(self, dirname):
+        if self.fingerprint is None:
+            raise ValueError("Can't save an index without a fingerprint")
+        for name, path in self.get_paths(dirname, self.fingerprint).items():
+            # write to a temp file so that a partially written index is never
+            # found by load
+            tmp = path + ".tmp"
+            with open(tmp, "wb") as fh:
+                np.save(fh, getattr(self, name))
+            os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, dirname, fingerprint):
+        """Return the index from the cache directory, or None if there isn't
+        one for the fingerprint
+        """
+        arrays = {}
+        try:
+            for name, path in cls.get_paths(dirname, fingerprint).items():
+                arrays[name] = np.load(path, mmap_mode="r")
+        except (OSError, ValueError) as e:
+            log.debug(f"no ngram index for {fingerprint}: {e}")
+            return None
+        size = int(fingerprint.rsplit("-", 1)[1])
+        return cls(arrays["keys"], arrays["key_starts"], arrays["positions"], size, fingerprint)
+
+    #### editing
+
+    def invalidate(self, start, end):
+        """Mark the bytes from start up to (but not including) end as changed.
+        The number of bytes in the data must not change.
+        """
+        self.dirty = self.dirty | [(start, end)]
+
+    @property
+    def is_usable(self):
+        return self.dirty.num_indexes <= self.size * self.max_dirty_fraction
+
+    #### searching
+
+    def postings(self, key):
+        i = np.searchsorted(self.keys, self.keys.dtype.type(key))
+        if i < len(self.keys) and self.keys[i] == key:
+            return self.positions[self.key_starts[i]:self.key_starts[i + 1]]
+        return self.positions[0:0]
+
+    def find(self, data, pattern):
+        """Return a sorted array of the offsets of the pattern in the data, or
+        None if the index can't be used for this pattern, including when even
+        its rarest n-gram has more than max_candidates offsets.
+        """
+        pattern = bytes(pattern)
+        m = len(pattern)
+        if m < self.n or len(data) != self.size or not self.is_usable:
+            return None
+        d = np.asarray(data, dtype=np.uint8)
+        p = np.frombuffer(pattern, dtype=np.uint8)
+
+        # candidates from the rarest n-gram in the pattern
+        best = None
+        for k, key in enumerate(self.calc_keys(p).tolist()):
+            postings = self.postings(key)
+            if best is None or len(postings) < len(best[1]):
+                best = (k, postings)
+                if len(postings) == 0:
+                    break
+        k, postings = best
+        if len(postings) > self.max_candidates:
+            log.debug(f"{pattern}: too many candidates ({len(postings)}) to use the index")
+            return None
+        candidates = postings.astype(np.int64) - k
+        candidates = candidates[(candidates >= 0) & (candidates <= len(d) - m)]
+        for j in range(m):
+            if len(candidates) == 0:
+                break
+            candidates = candidates[d[candidates + j] == p[j]]
+
+        if self.dirty:
+            # the index may have missed matches that overlap changed bytes,
+            # so look for those directly
+            found = [candidates]
+            for start, end in self.dirty:
+                first = max(start - m + 1, 0)
+                chunk = d[first:min(end + m - 1, len(d))].tobytes()
+                i = chunk.find(pattern)
+                while i >= 0:
+                    found.append(np.asarray([first + i], dtype=np.int64))
+                    i = chunk.find(pattern, i + 1)
+            candidates = np.unique(np.concatenate(found))
+        return candidates
+
+
+class NgramIndexJob(ThreadJob):
+    """Load the index for the data from the cache directory, or build it (and
+    save it in the cache) if it doesn't exist yet.
+    """
+    def __init__(self, data, cache_dir=None, callback=None):
+        ThreadJob.__init__(self)
+        self.data = data
+        self.cache_dir = cache_dir
+        self.callback = callback
+        self.index = None
+
+    def _start(self, dispatcher):
+        fingerprint = calc_fingerprint(self.data)
+        index = None
+        if self.cache_dir is not None:
+            index = NgramIndex.load(self.cache_dir, fingerprint)
+        if index is None:
+            if self.is_cancelled:
+                return
+            index = NgramIndex.from_data(self.data, fingerprint)
+            log.debug(f"built {index}")
+            if self.cache_dir is not None:
+                index.save(self.cache_dir)
+        if not self.is_cancelled:
+            self.index = index
+            if self.callback is not None:
+                self.callback(self)
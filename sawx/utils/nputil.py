@@ -2,7 +2,7 @@ import numpy as np
 
 
 def to_numpy(value):
-    if type(value) is np.ndarray:
+    if isinstance(value, np.ndarray):
         return value
     elif type(value) is bytes:
         return np.fromstring(value, dtype=np.uint8)
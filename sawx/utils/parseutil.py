@@ -2,14 +2,26 @@
 # Glenn Linderman, licensed under the pyparsing license arith.py from:
 #
 # http://pyparsing.wikispaces.com/file/view/arith.py/241810293/arith.py
+import os
+import functools
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 
 from pyparsing import Word, nums, hexnums, alphas, Combine, oneOf, Optional, \
     opAssoc, operatorPrecedence, ParseException, ParserElement, Literal, Regex, pyparsing_common
 
+from .sortutil import RangeSet
+
 ParserElement.enablePackrat()
 
 
+# Each EvalXXX class can either evaluate itself directly, or produce the
+# python source of an equivalent expression through to_source. The source of
+# the whole tree is compiled into a code object by CompiledExpression, where
+# variables are looked up in the _vars dict.
+
 class EvalConstant():
     "Class to evaluate a parsed constant or variable"
 
@@ -21,12 +33,25 @@ class EvalConstant():
         if v in vars_:
             return vars_[v]
         else:
-            if v.startswith("$"):
-                return int(v[1:], 16)
-            elif v.startswith("0x"):
-                return int(v[2:], 16)
-            else:
-                return int(v)
+            return self.constant()
+
+    def constant(self):
+        v = self.value
+        if v.startswith("$"):
+            return int(v[1:], 16)
+        elif v.startswith("0x"):
+            return int(v[2:], 16)
+        else:
+            return int(v)
+
+    def is_variable(self):
+        return isinstance(self.value, str) and self.value.isalpha()
+
+    def to_source(self, names):
+        if self.is_variable():
+            names.add(self.value)
+            return "_vars[%r]" % self.value
+        return repr(self.constant())
 
 
 class EvalSignOp():
@@ -39,6 +64,10 @@ class EvalSignOp():
         mult = {'+':1, '-':-1}[self.sign]
         return mult * self.value.eval(vars_)
 
+    def to_source(self, names):
+        mult = {'+':1, '-':-1}[self.sign]
+        return "(%d * %s)" % (mult, self.value.to_source(names))
+
 
 def operatorOperands(tokenlist):
     "generator to extract operators and operands in pairs"
@@ -52,6 +81,22 @@ def operatorOperands(tokenlist):
             break
 
 
+def binary_op_source(tokenlist, names):
+    "source of left associative operations using python operators"
+    source = tokenlist[0].to_source(names)
+    for op, val in operatorOperands(tokenlist[1:]):
+        source = "(%s %s %s)" % (source, op, val.to_source(names))
+    return source
+
+
+def function_op_source(func, tokenlist, names):
+    "source of left associative operations using a function of two arguments"
+    source = tokenlist[0].to_source(names)
+    for op, val in operatorOperands(tokenlist[1:]):
+        source = "%s(%s, %s)" % (func, source, val.to_source(names))
+    return source
+
+
 class EvalMultOp():
     "Class to evaluate multiplication and division expressions"
 
@@ -71,6 +116,9 @@ class EvalMultOp():
                 prod %= val.eval(vars_)
         return prod
 
+    def to_source(self, names):
+        return binary_op_source(self.value, names)
+
 
 class EvalAddOp():
     "Class to evaluate addition and subtraction expressions"
@@ -87,6 +135,9 @@ class EvalAddOp():
                 sum -= val.eval(vars_)
         return sum
 
+    def to_source(self, names):
+        return binary_op_source(self.value, names)
+
 
 class EvalBitwiseAndOp():
     "Class to evaluate addition and subtraction expressions"
@@ -101,6 +152,9 @@ class EvalBitwiseAndOp():
             val1 = val1 & val2
         return val1
 
+    def to_source(self, names):
+        return binary_op_source(self.value, names)
+
 
 class EvalBitwiseOrOp():
     "Class to evaluate addition and subtraction expressions"
@@ -115,6 +169,9 @@ class EvalBitwiseOrOp():
             val1 = val1 | val2
         return val1
 
+    def to_source(self, names):
+        return binary_op_source(self.value, names)
+
 
 class EvalLogicalAndOp():
     "Class to evaluate addition and subtraction expressions"
@@ -129,6 +186,9 @@ class EvalLogicalAndOp():
             val1 = np.logical_and(val1, val2)
         return val1
 
+    def to_source(self, names):
+        return function_op_source("_np.logical_and", self.value, names)
+
 
 class EvalLogicalOrOp():
     "Class to evaluate addition and subtraction expressions"
@@ -143,6 +203,9 @@ class EvalLogicalOrOp():
             val1 = np.logical_or(val1, val2)
         return val1
 
+    def to_source(self, names):
+        return function_op_source("_np.logical_or", self.value, names)
+
 
 class EvalComparisonOp():
     "Class to evaluate comparison expressions"
@@ -160,17 +223,24 @@ class EvalComparisonOp():
         self.value = tokens[0]
 
     def eval(self, vars_ ):
-        val1 = self.value[0].eval(vars_)
+        values = [self.value[0].eval(vars_)]
+        ops = []
+        for op,val in operatorOperands(self.value[1:]):
+            ops.append(op)
+            values.append(val.eval(vars_))
+        return self.compare(values, ops)
+
+    @classmethod
+    def compare(cls, values, ops):
+        val1 = values[0]
         if type(val1) is np.ndarray:
-            for op,val in operatorOperands(self.value[1:]):
-                fn = self.opMap[op]
-                val2 = val.eval(vars_)
+            for op, val2 in zip(ops, values[1:]):
+                fn = cls.opMap[op]
                 val1 = fn(val1, val2)
             return val1
         else:
-            for op,val in operatorOperands(self.value[1:]):
-                fn = self.opMap[op]
-                val2 = val.eval(vars_)
+            for op, val2 in zip(ops, values[1:]):
+                fn = cls.opMap[op]
                 if not fn(val1,val2):
                     break
                 val1 = val2
@@ -178,8 +248,157 @@ class EvalComparisonOp():
                 return True
             return False
 
+    def to_source(self, names):
+        if len(self.value) == 3:
+            op = self.value[1]
+            if op == "<>":
+                op = "!="
+            return "(%s %s %s)" % (self.value[0].to_source(names), op, self.value[2].to_source(names))
+        values = [self.value[0].to_source(names)]
+        ops = []
+        for op,val in operatorOperands(self.value[1:]):
+            ops.append(op)
+            values.append(val.to_source(names))
+        return "_compare([%s], %r)" % (", ".join(values), ops)
+
+
+class CompiledExpression():
+    """Expression compiled to a python code object.
+
+    Operations produce new arrays rather than modifying the arrays in vars_,
+    and arrays can be evaluated in chunks to limit the size of the temporary
+    arrays created by each operation.
+    """
+    default_chunk_size = 1 << 20
+
+    def __init__(self, text, tree):
+        self.text = text
+        names = set()
+        self.source = tree.to_source(names)
+        self.names = frozenset(names)
+        self.code = compile(self.source, "<expression %s>" % text, "eval")
+        self.globals = {"__builtins__": {}, "_np": np, "_compare": EvalComparisonOp.compare}
+
+    def __repr__(self):
+        return "CompiledExpression(%r)" % self.text
+
+    def eval(self, vars_):
+        missing = self.names.difference(vars_)
+        if missing:
+            raise ValueError("Unknown variable(s): %s" % ", ".join(sorted(missing)))
+        return eval(self.code, self.globals, {"_vars": vars_})
+
+    def get_array_length(self, vars_):
+        """Length of the arrays used by the expression, or None if the
+        expression doesn't use arrays of one common length.
+        """
+        lengths = set()
+        for name in self.names:
+            v = vars_.get(name)
+            if isinstance(v, np.ndarray) and v.ndim > 0:
+                lengths.add(len(v))
+        if len(lengths) == 1:
+            return lengths.pop()
+        return None
+
+    def iter_chunks(self, vars_, chunk_size=None, num_threads=1):
+        """Generator evaluating the expression over consecutive slices of
+        the array variables, yielding the start index of each slice and the
+        result for that slice, in order.
+
+        Numpy releases the GIL during array operations, so using more than
+        one thread evaluates several chunks in parallel (all CPUs if
+        num_threads is None).
+        """
+        if chunk_size is None:
+            chunk_size = self.default_chunk_size
+        if num_threads is None:
+            num_threads = os.cpu_count() or 1
+        num = self.get_array_length(vars_)
+        if num is None:
+            yield 0, self.eval(vars_)
+            return
+        arrays = [name for name in self.names if isinstance(vars_.get(name), np.ndarray)]
+
+        def eval_chunk(start):
+            chunk_vars = dict(vars_)
+            for name in arrays:
+                chunk_vars[name] = vars_[name][start:start + chunk_size]
+            return start, self.eval(chunk_vars)
+
+        starts = range(0, num, chunk_size)
+        if num_threads > 1:
+            with ThreadPoolExecutor(num_threads) as executor:
+                # limit the number of chunks in flight so results don't pile
+                # up if the consumer is slower than the evaluation
+                pending = collections.deque()
+                window = 2 * num_threads
+                for start in starts:
+                    pending.append(executor.submit(eval_chunk, start))
+                    if len(pending) >= window:
+                        yield pending.popleft().result()
+                while pending:
+                    yield pending.popleft().result()
+        else:
+            for start in starts:
+                yield eval_chunk(start)
+
+    def eval_chunked(self, vars_, chunk_size=None, num_threads=1):
+        """Same result as eval, but evaluating the arrays in chunks"""
+        num = self.get_array_length(vars_)
+        if num is None or num <= (chunk_size or self.default_chunk_size):
+            return self.eval(vars_)
+        result = None
+        for start, value in self.iter_chunks(vars_, chunk_size, num_threads):
+            if result is None:
+                result = np.empty(num, dtype=np.asarray(value).dtype)
+            result[start:start + len(value)] = value
+        return result
+
+    def iter_match_ranges(self, vars_, chunk_size=None, num_threads=1):
+        """Generator yielding a RangeSet for each chunk holding the indexes
+        where the expression is true.
+
+        Only one chunk's worth of temporary arrays exists at a time (per
+        thread), so with memory mapped arrays this works on data larger than
+        available memory.
+        """
+        for start, value in self.iter_chunks(vars_, chunk_size, num_threads):
+            if np.ndim(value) == 0:
+                raise ValueError("Expression %s doesn't depend on any arrays" % self.text)
+            yield RangeSet.from_mask(value, start)
+
+
+@functools.lru_cache(maxsize=256)
+def compile_expression(grammar, text):
+    """Parse and compile the expression using the grammar of an expression
+    class, caching the result.
+    """
+    tree = grammar.arith_expr.parseString(text, parseAll=True)[0]
+    return CompiledExpression(text, tree)
+
 
-class NumpyIntExpression():
+class NumpyExpressionBase():
+    def __init__(self, vars_={}):
+        self.vars_ = vars_
+
+    def setvars(self, vars_):
+        self.vars_ = vars_
+
+    def setvar(self, var, val):
+        self.vars_[ var ] = val
+
+    def compile(self, strExpr):
+        return compile_expression(type(self), strExpr)
+
+    def eval( self, strExpr ):
+        return self.compile(strExpr).eval(self.vars_)
+
+    def eval_chunked(self, strExpr, chunk_size=None, num_threads=1):
+        return self.compile(strExpr).eval_chunked(self.vars_, chunk_size, num_threads)
+
+
+class NumpyIntExpression(NumpyExpressionBase):
     integer = Word(nums)
     hexint = Combine(oneOf('0x $') + Word(hexnums))
 
@@ -208,20 +427,6 @@ class NumpyIntExpression():
          (logicalorop, 2, opAssoc.LEFT, EvalLogicalOrOp),
          ])
 
-    def __init__(self, vars_={}):
-        self.vars_ = vars_
-
-    def setvars(self, vars_):
-        self.vars_ = vars_
-
-    def setvar( var, val ):
-        self.vars_[ var ] = val
-
-    def eval( self, strExpr ):
-        ret = self.arith_expr.parseString( strExpr, parseAll=True)[0]
-        result = ret.eval( self.vars_ )
-        return result
-
 
 class EvalFloatConstant():
     "Class to evaluate a parsed constant or variable"
@@ -234,10 +439,22 @@ class EvalFloatConstant():
         if v in vars_:
             return vars_[v]
         else:
-            return float(v)
+            return self.constant()
 
+    def constant(self):
+        return float(self.value)
 
-class NumpyFloatExpression():
+    def is_variable(self):
+        return isinstance(self.value, str) and self.value.isalpha()
+
+    def to_source(self, names):
+        if self.is_variable():
+            names.add(self.value)
+            return "_vars[%r]" % self.value
+        return repr(self.constant())
+
+
+class NumpyFloatExpression(NumpyExpressionBase):
     variable = Word(alphas)
     leading_dot_float = Regex(r'\.\d+')
     operand = leading_dot_float | pyparsing_common.number | variable
@@ -260,20 +477,6 @@ class NumpyFloatExpression():
          (orop, 2, opAssoc.LEFT, EvalLogicalOrOp),
          ])
 
-    def __init__(self, vars_={}):
-        self.vars_ = vars_
-
-    def setvars(self, vars_):
-        self.vars_ = vars_
-
-    def setvar( var, val ):
-        self.vars_[ var ] = val
-
-    def eval( self, strExpr ):
-        ret = self.arith_expr.parseString( strExpr, parseAll=True)[0]
-        result = ret.eval( self.vars_ )
-        return result
-
 
 if __name__=='__main__':
     a = np.arange(256*256)
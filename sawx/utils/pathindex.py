@@ -0,0 +1,131 @@
+"""Index of the files in a list of resource directories
+
+Resources like templates and icons are found by searching a list of
+directories for the first one containing the name. A PathIndex walks the
+directories once and keeps the names of everything in them, so lookups don't
+touch the filesystem. The index is rebuilt when the list of directories is
+changed or the modification time of any of the directories changes (i.e. a
+file has been added, removed or renamed). To limit the number of stat calls,
+the modification times are checked at most once every check_interval
+seconds.
+"""
+import os
+import time
+
+import logging
+log = logging.getLogger(__name__)
+
+
+def get_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class PathIndex:
+    check_interval = 1.0
+
+    def __init__(self, paths, check_interval=None):
+        # the list is kept rather than a copy so changes to it are noticed.
+        # None entries in the list are skipped.
+        self.paths = paths
+        if check_interval is not None:
+            self.check_interval = check_interval
+        self.key = None
+        self.names = {}
+        self.files = {}
+        self.dir_mtimes = {}
+        self.last_check = 0
+        # incremented each time the directories are scanned, so anything
+        # derived from the index can tell when it needs to be recalculated
+        self.generation = 0
+
+    def __str__(self):
+        return f"PathIndex: {sum(len(n) for n in self.names.values())} names in {len(self.dir_mtimes)} directories, generation {self.generation}"
+
+    def invalidate(self):
+        self.key = None
+
+    def is_stale(self):
+        if self.key != tuple(self.paths):
+            return True
+        now = time.monotonic()
+        if now - self.last_check < self.check_interval:
+            return False
+        self.last_check = now
+        for path, mtime in self.dir_mtimes.items():
+            if get_mtime(path) != mtime:
+                log.debug(f"{path} has changed")
+                return True
+        return False
+
+    def refresh(self):
+        """Rescan the directories if they have changed, returning True if they
+        were rescanned
+        """
+        if self.is_stale():
+            self.scan()
+            return True
+        return False
+
+    def scan(self):
+        self.key = tuple(self.paths)
+        self.names = {}
+        self.files = {}
+        self.dir_mtimes = {}
+        for toplevel in self.key:
+            if toplevel is None or toplevel in self.names:
+                continue
+            names = set()
+            files = set()
+            self.dir_mtimes[toplevel] = get_mtime(toplevel)
+            for dirpath, dirnames, filenames in os.walk(toplevel, followlinks=True):
+                if dirpath != toplevel:
+                    self.dir_mtimes[dirpath] = get_mtime(dirpath)
+                rel = os.path.relpath(dirpath, toplevel)
+                for name in dirnames:
+                    names.add(os.path.normpath(os.path.join(rel, name)))
+                for name in filenames:
+                    name = os.path.normpath(os.path.join(rel, name))
+                    names.add(name)
+                    files.add(name)
+            self.names[toplevel] = names
+            self.files[toplevel] = files
+        self.last_check = time.monotonic()
+        self.generation += 1
+        log.debug(f"scanned {self}")
+
+    def find_first(self, name, paths=None):
+        """Return the full path of the name in the first directory that
+        contains it, searching only the given paths (which must be from the
+        index's list) if specified. Raises OSError if it's not found.
+        """
+        if os.path.isabs(name):
+            return name
+        self.refresh()
+        key = os.path.normpath(name)
+        if paths is None:
+            paths = self.key
+        for toplevel in paths:
+            if toplevel is None:
+                continue
+            if key in self.names.get(toplevel, ()):
+                return os.path.normpath(os.path.join(toplevel, name))
+        raise OSError(f"'{name}' not found in {[p for p in paths if p is not None]}")
+
+    def iter_toplevel_files(self):
+        """Return (toplevel directory, name) for each file directly inside
+        each of the directories
+        """
+        self.refresh()
+        for toplevel in self.key:
+            if toplevel is None:
+                continue
+            for name in sorted(self.files.get(toplevel, ())):
+                if os.sep not in name:
+                    yield toplevel, name
+
+    def contains(self, toplevel, name):
+        self.refresh()
+        return os.path.normpath(name) in self.names.get(toplevel, ())
@@ -1,5 +1,6 @@
 import inspect
-import pkg_resources
+
+from .entrypoints import iter_entry_points, load_entry_point
 
 import logging
 log = logging.getLogger(__name__)
@@ -7,9 +8,9 @@ log = logging.getLogger(__name__)
 
 def iter_sorted_entry_points(entry_point):
     entry_points = []
-    for entry_point in pkg_resources.iter_entry_points(entry_point):
+    for entry_point in iter_entry_points(entry_point):
         try:
-            mod = entry_point.load()
+            mod = load_entry_point(entry_point)
         except Exception as e:
             log.error(f"iter_sorted_entry_points: Failed importing {entry_point.name}: {e}")
             if log.isEnabledFor(logging.DEBUG):
@@ -0,0 +1,400 @@
+"""Saving documents without blocking the user interface
+
+A SaveSnapshot captures the data of a document at the time the save is
+requested without copying it. The data is written a chunk at a time by a
+SaveJob in the background, and any chunk that the document is about to change
+before it has been written is copied first (see SaveSnapshot.preserve), so the
+file always contains the data as it was when the save was started.
+
+Files are written to a temporary file in the same directory and renamed over
+the original only after everything has been written, so a failed or cancelled
+save never leaves a partially written file behind.
+
+When only a few bytes of a file have changed and its size is the same, a
+PatchSnapshot of just the modified ranges is written in place instead. The
+original bytes of those ranges are first saved in a journal next to the file,
+so a save that's interrupted part way through can be rolled back, either
+immediately or by recover_journal the next time the file is loaded.
+
+A CompressedSaveJob compresses the snapshot as it's written, using any of the
+formats supported by compressedfs.
+"""
+import os
+import codecs
+import struct
+import tempfile
+import threading
+
+import numpy as np
+
+from .jobs import ThreadJob
+from .compressedfs import new_compressor
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class SaveCancelled(RuntimeError):
+    pass
+
+
+class SaveSnapshot:
+    chunk_size = 4 * 1024 * 1024
+
+    def __init__(self, data, chunk_size=None):
+        if isinstance(data, np.ndarray):
+            self.data = data.view(np.uint8).reshape(-1)
+        else:
+            self.data = np.frombuffer(data, dtype=np.uint8)
+        if chunk_size is not None:
+            self.chunk_size = chunk_size
+        self.size = len(self.data)
+        self.lock = threading.Lock()
+        self.next_chunk = 0
+        self.preserved = {}
+        self.done = threading.Event()
+
+    def __str__(self):
+        return f"SaveSnapshot: {self.size} bytes, {self.next_chunk} of {self.num_chunks} chunks written, {len(self.preserved)} preserved"
+
+    @property
+    def num_chunks(self):
+        return (self.size + self.chunk_size - 1) // self.chunk_size
+
+    @property
+    def progress(self):
+        num_chunks = self.num_chunks
+        return 1.0 if num_chunks == 0 else self.next_chunk / num_chunks
+
+    def preserve(self, start, end):
+        """Keep a copy of the original data in the byte range start:end if it
+        hasn't been written yet. Must be called before the data is changed in
+        place.
+        """
+        cs = self.chunk_size
+        with self.lock:
+            first = max(start // cs, self.next_chunk)
+            last = min((end + cs - 1) // cs, self.num_chunks)
+            for i in range(first, last):
+                if i not in self.preserved:
+                    self.preserved[i] = self.data[i * cs:(i + 1) * cs].tobytes()
+
+    def wait_until_written(self, timeout=None):
+        """Block until the SaveJob has stopped reading the data (whether or
+        not the save succeeded), after which the data can be changed without
+        preserving anything. Returns False if the timeout expired first.
+        """
+        return self.done.wait(timeout)
+
+    def iter_chunks(self):
+        """Return the data as bytes one chunk at a time"""
+        cs = self.chunk_size
+        while True:
+            with self.lock:
+                i = self.next_chunk
+                if i >= self.num_chunks:
+                    break
+                chunk = self.preserved.pop(i, None)
+                if chunk is None:
+                    chunk = self.data[i * cs:(i + 1) * cs].tobytes()
+                self.next_chunk = i + 1
+            yield chunk
+
+
+class TextSaveSnapshot(SaveSnapshot):
+    """Snapshot of a str, encoded a chunk at a time while writing. The str is
+    immutable so no data ever needs to be preserved.
+    """
+    chunk_size = 1024 * 1024
+
+    def __init__(self, text, encoding, bom=None, errors="strict", chunk_size=None):
+        self.text = text
+        self.encoding = encoding
+        self.bom = bom
+        self.errors = errors
+        if chunk_size is not None:
+            self.chunk_size = chunk_size
+        self.size = len(text)
+        self.lock = threading.Lock()
+        self.next_chunk = 0
+        self.done = threading.Event()
+
+    def preserve(self, start, end):
+        pass
+
+    def wait_until_written(self, timeout=None):
+        return True
+
+    def iter_chunks(self):
+        cs = self.chunk_size
+        encoder = codecs.getincrementalencoder(self.encoding)(self.errors)
+        if self.bom:
+            yield self.bom
+        for i in range(self.num_chunks):
+            self.next_chunk = i + 1
+            chunk = encoder.encode(self.text[i * cs:(i + 1) * cs])
+            if chunk:
+                yield chunk
+        chunk = encoder.encode("", True)
+        if chunk:
+            yield chunk
+
+
+class PatchSnapshot(SaveSnapshot):
+    """Snapshot of only the given (start, end) byte ranges of the data, which
+    are written in place over a file that already contains the rest of it.
+    Ranges larger than the chunk size are split into multiple patches.
+    """
+    def __init__(self, data, ranges, chunk_size=None):
+        SaveSnapshot.__init__(self, data, chunk_size)
+        cs = self.chunk_size
+        self.ranges = []
+        for start, end in ranges:
+            end = min(end, self.size)
+            self.ranges.extend((i, min(i + cs, end)) for i in range(start, end, cs))
+
+    def __str__(self):
+        return f"PatchSnapshot: {len(self.ranges)} patches, {self.num_bytes} bytes, {self.next_chunk} written, {len(self.preserved)} preserved"
+
+    @property
+    def num_chunks(self):
+        return len(self.ranges)
+
+    @property
+    def num_bytes(self):
+        return sum(end - start for start, end in self.ranges)
+
+    def preserve(self, start, end):
+        with self.lock:
+            for i in range(self.next_chunk, len(self.ranges)):
+                s, e = self.ranges[i]
+                if s < end and start < e and i not in self.preserved:
+                    self.preserved[i] = self.data[s:e].tobytes()
+
+    def iter_chunks(self):
+        """Return (offset, bytes) for each patch"""
+        while True:
+            with self.lock:
+                i = self.next_chunk
+                if i >= len(self.ranges):
+                    break
+                start, end = self.ranges[i]
+                chunk = self.preserved.pop(i, None)
+                if chunk is None:
+                    chunk = self.data[start:end].tobytes()
+                self.next_chunk = i + 1
+            yield start, chunk
+
+
+journal_extension = ".journal"
+
+journal_magic = b"SAWXJRNL"
+
+journal_end_magic = b"SAWXEND!"
+
+journal_header = struct.Struct("<QQ")
+
+
+def write_journal(fh, ranges, journal_path):
+    """Save the current contents of the byte ranges of the open file in the
+    journal. The journal is only valid once the end marker has been written,
+    so a partially written journal is ignored by recover_journal.
+    """
+    with open(journal_path, "wb") as jh:
+        jh.write(journal_magic)
+        for start, end in ranges:
+            fh.seek(start)
+            jh.write(journal_header.pack(start, end - start))
+            jh.write(fh.read(end - start))
+        jh.write(journal_end_magic)
+        jh.write(struct.pack("<Q", len(ranges)))
+        jh.flush()
+        os.fsync(jh.fileno())
+
+
+def read_journal(journal_path):
+    """Return the list of (offset, original bytes) from a complete journal,
+    or None if the journal was not completely written.
+    """
+    with open(journal_path, "rb") as jh:
+        data = jh.read()
+    if not data.startswith(journal_magic):
+        return None
+    end_size = len(journal_end_magic) + 8
+    if len(data) < len(journal_magic) + end_size or data[-end_size:-8] != journal_end_magic:
+        return None
+    count, = struct.unpack("<Q", data[-8:])
+    patches = []
+    pos = len(journal_magic)
+    body_end = len(data) - end_size
+    while pos + journal_header.size <= body_end:
+        start, length = journal_header.unpack_from(data, pos)
+        pos += journal_header.size
+        patches.append((start, data[pos:pos + length]))
+        pos += length
+    if pos != body_end or len(patches) != count:
+        return None
+    return patches
+
+
+def recover_journal(path):
+    """Restore the original contents of a file whose in-place save was
+    interrupted, returning True if there was a journal to recover from.
+    """
+    journal_path = path + journal_extension
+    if not os.path.exists(journal_path):
+        return False
+    patches = read_journal(journal_path)
+    if patches is None:
+        # the file is only changed once the journal is complete
+        log.warning(f"discarding incomplete journal {journal_path}")
+    else:
+        log.warning(f"restoring {len(patches)} ranges of {path} from {journal_path}")
+        with open(path, "r+b") as fh:
+            for start, data in patches:
+                fh.seek(start)
+                fh.write(data)
+            fh.flush()
+            os.fsync(fh.fileno())
+    os.remove(journal_path)
+    return True
+
+
+def write_patches(path, ranges, patches):
+    """Write the (offset, bytes) patches covering the byte ranges in place,
+    journaling the original contents first so the file is restored if any of
+    the patches can't be written.
+    """
+    journal_path = path + journal_extension
+    try:
+        with open(path, "r+b") as fh:
+            write_journal(fh, ranges, journal_path)
+            for start, data in patches:
+                fh.seek(start)
+                fh.write(data)
+            fh.flush()
+            os.fsync(fh.fileno())
+    except BaseException:
+        if os.path.exists(journal_path):
+            recover_journal(path)
+        raise
+    os.remove(journal_path)
+    log.debug(f"patched {len(ranges)} ranges of {path}")
+
+
+def write_atomic(path, chunks):
+    """Write the chunks (bytes or str) to a temporary file in the same
+    directory as path, replacing path with it once all the data has been
+    written and flushed to disk.
+
+    Replacing the file rather than writing over it also means that any memory
+    map of the original file still sees the original data.
+    """
+    dirname, basename = os.path.split(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=f".{basename}.", suffix=".tmp", dir=dirname)
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode("utf-8")
+                fh.write(chunk)
+            fh.flush()
+            os.fsync(fh.fileno())
+        try:
+            mode = os.stat(path).st_mode
+        except OSError:
+            # new files get the usual permissions rather than the owner-only
+            # permissions of mkstemp
+            umask = os.umask(0)
+            os.umask(umask)
+            mode = 0o666 & ~umask
+        os.chmod(temp_path, mode & 0o7777)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    log.debug(f"wrote {path}")
+
+
+class SaveJob(ThreadJob):
+    """Write a snapshot to a file, followed by the session data if a
+    SessionFile (or anything else with a write method) is given.
+
+    Files are written with write_atomic unless an open_func is specified, in
+    which case the main file is written directly using a file handle from
+    open_func(path, "wb") (e.g. for URIs not on the local filesystem).
+
+    The callback is called from the thread with the job as its argument after
+    each chunk is written and once more when the job is finished.
+    """
+    compression = None
+
+    def __init__(self, snapshot, path, session_file=None, callback=None, open_func=None):
+        ThreadJob.__init__(self)
+        self.snapshot = snapshot
+        self.path = path
+        self.session_file = session_file
+        self.callback = callback
+        self.open_func = open_func
+        self.is_finished = False
+
+    def get_name(self):
+        return f"save job: {self.path}"
+
+    @property
+    def progress(self):
+        return self.snapshot.progress
+
+    def iter_chunks(self):
+        for chunk in self.snapshot.iter_chunks():
+            if self.is_cancelled:
+                raise SaveCancelled(f"save of {self.path} cancelled")
+            yield chunk
+            if self.callback is not None:
+                self.callback(self)
+
+    def write_file(self):
+        if self.open_func is None:
+            write_atomic(self.path, self.iter_chunks())
+        else:
+            with self.open_func(self.path, "wb") as fh:
+                for chunk in self.iter_chunks():
+                    fh.write(chunk)
+
+    def _start(self, dispatcher):
+        try:
+            self.write_file()
+            if self.session_file is not None:
+                self.session_file.write()
+        except Exception as e:
+            log.error(f"{self.get_name()} failed: {e}")
+            self.error = str(e)
+        finally:
+            self.is_finished = True
+            self.snapshot.done.set()
+            if self.callback is not None:
+                self.callback(self)
+
+
+class PatchSaveJob(SaveJob):
+    """Write a PatchSnapshot in place over the existing file"""
+    def write_file(self):
+        write_patches(self.path, self.snapshot.ranges, self.iter_chunks())
+
+
+class CompressedSaveJob(SaveJob):
+    """Write a snapshot compressed with the named compressedfs format"""
+    def __init__(self, snapshot, path, session_file=None, callback=None, open_func=None, compression="gzip"):
+        SaveJob.__init__(self, snapshot, path, session_file, callback, open_func)
+        self.compression = compression
+
+    def iter_chunks(self):
+        compressor = new_compressor(self.compression)
+        for chunk in SaveJob.iter_chunks(self):
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
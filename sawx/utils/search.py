@@ -0,0 +1,355 @@
+"""Background searching of document data
+
+Searches run as ThreadJobs that scan the data in chunks, starting from the
+search start position and wrapping around to the beginning. The matches from
+each chunk are passed back to the main thread through a queue, so results
+show up progressively, and a new search cancels any search in progress.
+"""
+import re
+import queue
+import threading
+
+import numpy as np
+
+from .jobs import ThreadJob, get_global_job_manager, start_thread_job
+from .sortutil import RangeSet
+from .ngram import NgramIndexJob
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class RegexSearcher:
+    """Finds matches of a regular expression in any bytes-like object
+    (bytes, numpy arrays, memory mapped data).
+
+    Matches may extend past the end of a chunk by at most `overlap` bytes.
+    Searchers for an exact byte string set `literal` so the search can use an
+    n-gram index.
+
+    Text documents hold their data as a str, which is searched using the
+    pattern decoded with the same encoding; indexes are then character
+    positions.
+    """
+    literal = None
+
+    def __init__(self, pattern, ignore_case=False, overlap=1024, encoding="utf-8"):
+        if isinstance(pattern, str):
+            pattern = pattern.encode(encoding)
+        flags = re.IGNORECASE if ignore_case else 0
+        self.regex = re.compile(pattern, flags)
+        self.encoding = encoding
+        self._str_regex = None
+        self.overlap = overlap
+
+    def __str__(self):
+        return f"{self.__class__.__name__}: {self.regex.pattern}"
+
+    @property
+    def str_regex(self):
+        if self._str_regex is None:
+            pattern = self.regex.pattern.decode(self.encoding, errors="surrogateescape")
+            self._str_regex = re.compile(pattern, self.regex.flags & re.IGNORECASE)
+        return self._str_regex
+
+    def find(self, data, start, end):
+        """Return arrays of the start and end indexes of the matches that
+        begin in the range start up to (but not including) end
+        """
+        if isinstance(data, str):
+            view = data[start:min(end + self.overlap, len(data))]
+            regex = self.str_regex
+        else:
+            view = memoryview(data)[start:min(end + self.overlap, len(data))]
+            regex = self.regex
+        last = end - start
+        starts = []
+        ends = []
+        for match in regex.finditer(view):
+            s = match.start()
+            if s >= last:
+                break
+            e = match.end()
+            if e > s:
+                starts.append(s)
+                ends.append(e)
+        return np.asarray(starts, dtype=np.int64) + start, np.asarray(ends, dtype=np.int64) + start
+
+
+class ByteSearcher(RegexSearcher):
+    """Exact match of a byte string"""
+    def __init__(self, pattern):
+        RegexSearcher.__init__(self, re.escape(bytes(pattern)), overlap=max(len(pattern) - 1, 0))
+        self.literal = bytes(pattern)
+
+
+class TextSearcher(RegexSearcher):
+    """Match of literal text in the given encoding, by default ignoring case"""
+    def __init__(self, text, ignore_case=True, encoding="utf-8"):
+        pattern = text.encode(encoding)
+        RegexSearcher.__init__(self, re.escape(pattern), ignore_case, max(len(pattern) - 1, 0))
+        if not ignore_case:
+            self.literal = pattern
+
+
+class SearchJob(ThreadJob):
+    """Search the data in chunks, or all at once using the n-gram index if
+    one is given and it can be used for the search
+    """
+    def __init__(self, data, searcher, start_index, chunk_size, generation, results, callback=None, index=None):
+        ThreadJob.__init__(self)
+        self.data = data
+        self.searcher = searcher
+        self.start_index = start_index
+        self.chunk_size = chunk_size
+        self.generation = generation
+        self.results = results
+        self.callback = callback
+        self.index = index
+
+    def get_name(self):
+        return f"search job #{self.generation}: {self.searcher}"
+
+    def find_with_index(self):
+        starts = self.index.find(self.data, self.searcher.literal)
+        if starts is None:
+            return False
+        log.debug(f"{self.searcher}: {len(starts)} matches from {self.index}")
+        self.results.put((self.generation, 0, len(self.data), starts, starts + len(self.searcher.literal)))
+        return True
+
+    def iter_chunks(self):
+        num = len(self.data)
+        start_index = min(max(self.start_index, 0), num)
+        for first, last in [(start_index, num), (0, start_index)]:
+            for start in range(first, last, self.chunk_size):
+                yield start, min(start + self.chunk_size, last)
+
+    def _start(self, dispatcher):
+        try:
+            if self.index is not None and self.find_with_index():
+                return
+            for start, end in self.iter_chunks():
+                if self.is_cancelled:
+                    log.debug(f"{self.get_name()}: cancelled")
+                    return
+                starts, ends = self.searcher.find(self.data, start, end)
+                self.results.put((self.generation, start, end, starts, ends))
+                if self.callback is not None:
+                    self.callback(self)
+        finally:
+            # always mark the search as finished so the engine isn't left
+            # waiting if the search fails
+            self.results.put((self.generation, None, None, None, None))
+            if self.callback is not None:
+                self.callback(self)
+
+
+class SearchEngine:
+    """Incremental search over document data.
+
+    Call `start` to begin a search (cancelling any previous search), then
+    `poll` from the main thread to collect matches as they are found. The
+    optional callback is called from the search thread whenever new results
+    are available, e.g. to wx.CallAfter a method that calls `poll`.
+
+    If `build_index` has been called, searches for literal byte strings use the
+    n-gram index (once it is ready) instead of scanning the data. The index is
+    rebuilt in the background once too much of the data has changed for it to
+    be used.
+    """
+    chunk_size = 4 * 1024 * 1024
+
+    def __init__(self, job_manager=None, callback=None):
+        if job_manager is None:
+            job_manager = get_global_job_manager()
+        self.job_manager = job_manager
+        self.callback = callback
+        self.results = queue.Queue()
+        self.generation = 0
+        self.job = None
+        self.data_size = 0
+        self.index = None
+        self.index_job = None
+        self.index_lock = threading.Lock()
+        self.index_dirty = []
+        self.index_data = None
+        self.index_cache_dir = None
+        self.clear()
+
+    def clear(self):
+        self.match_starts = np.zeros(0, dtype=np.int64)
+        self.match_ends = np.zeros(0, dtype=np.int64)
+        self._matches = RangeSet()
+        self.pending = []
+        self.searched = RangeSet()
+        self.is_finished = True
+
+    def start(self, data, searcher, start_index=0):
+        self.cancel()
+        self.generation += 1
+        self.clear()
+        self.is_finished = False
+        self.data_size = len(data)
+        index = self.get_search_index(data, searcher)
+        self.job = SearchJob(data, searcher, start_index, self.chunk_size, self.generation, self.results, self.callback, index)
+        self.run_job(self.job, "SearchJob")
+        log.debug(f"started {self.job.get_name()}")
+
+    def run_job(self, job, name):
+        start_thread_job(job, name, self.job_manager)
+
+    def get_search_index(self, data, searcher):
+        """Return the index if it may be used for the search, which is then
+        done in the search thread like a scan so a slow lookup doesn't block
+        """
+        if searcher.literal is None or isinstance(data, str):
+            return None
+        return self.index
+
+    def build_index(self, data, cache_dir=None):
+        """Load or build the n-gram index of the data in the background,
+        replacing any current index. If cache_dir is specified, the index is
+        looked up there and saved there after it is built.
+        """
+        self.discard_index()
+        self.index_data = data
+        self.index_cache_dir = cache_dir
+        self.index_job = NgramIndexJob(data, cache_dir, self.index_ready)
+        self.run_job(self.index_job, "NgramIndexJob")
+
+    def index_ready(self, job):
+        # called from the index thread
+        with self.index_lock:
+            if job is self.index_job:
+                # changes made while the index was being built may not be
+                # in the index
+                for start, end in self.index_dirty:
+                    job.index.invalidate(start, end)
+                self.index_dirty = []
+                self.index = job.index
+                self.index_job = None
+
+    def discard_index(self):
+        with self.index_lock:
+            if self.index_job is not None:
+                self.index_job.cancel()
+                self.index_job = None
+            self.index = None
+            self.index_dirty = []
+
+    def data_changed(self, start=None, end=None):
+        """Update the index after the bytes from start up to (but not
+        including) end have been changed. Without a range (e.g. when the size
+        of the data has changed) the index is discarded.
+        """
+        if start is None:
+            if self.index is not None or self.index_job is not None:
+                self.discard_index()
+            return
+        rebuild = False
+        with self.index_lock:
+            if self.index is not None:
+                self.index.invalidate(start, end)
+                rebuild = not self.index.is_usable
+            elif self.index_job is not None:
+                self.index_dirty.append((start, end))
+        if rebuild:
+            log.debug(f"too many changes to use {self.index}, rebuilding")
+            self.build_index(self.index_data, self.index_cache_dir)
+
+    def cancel(self):
+        if self.job is not None:
+            self.job.cancel()
+            self.job = None
+        self.is_finished = True
+
+    def poll(self):
+        """Collect results from the search thread, returning True if there are
+        new matches or the search has finished.
+        """
+        changed = False
+        while True:
+            try:
+                generation, start, end, starts, ends = self.results.get(False)
+            except queue.Empty:
+                break
+            if generation != self.generation:
+                # results from a cancelled search
+                continue
+            if start is None:
+                self.is_finished = True
+                self.job = None
+                changed = True
+            else:
+                self.searched = self.searched | [(start, end)]
+                if len(starts) > 0:
+                    self.pending.append((starts, ends))
+                    changed = True
+        return changed
+
+    def collect_pending(self):
+        """Add the matches received by poll to the sorted arrays of match
+        start and end indexes, which keep every match even where they touch or
+        overlap.
+        """
+        if self.pending:
+            # each batch is already sorted and comes from a separate chunk, so
+            # it only needs to be inserted where its first match belongs
+            batches = sorted(self.pending, key=lambda p: p[0][0])
+            positions = np.searchsorted(self.match_starts, [p[0][0] for p in batches]).tolist()
+            starts = []
+            ends = []
+            previous = 0
+            for i, (batch_starts, batch_ends) in zip(positions, batches):
+                starts.extend((self.match_starts[previous:i], batch_starts))
+                ends.extend((self.match_ends[previous:i], batch_ends))
+                previous = i
+            starts.append(self.match_starts[previous:])
+            ends.append(self.match_ends[previous:])
+            self.match_starts = np.concatenate(starts)
+            self.match_ends = np.concatenate(ends)
+            self._matches = None
+            self.pending = []
+
+    @property
+    def num_matches(self):
+        self.collect_pending()
+        return len(self.match_starts)
+
+    @property
+    def matches(self):
+        """RangeSet of all matches found so far, with touching and
+        overlapping matches merged, e.g. for highlighting.
+        """
+        self.collect_pending()
+        if self._matches is None:
+            self._matches = RangeSet.from_arrays(self.match_starts, self.match_ends)
+        return self._matches
+
+    @property
+    def progress(self):
+        """Fraction of the data searched so far"""
+        if self.data_size == 0:
+            return 1.0
+        return self.searched.num_indexes / self.data_size
+
+    def find_next(self, index):
+        """Return the (start, end) of the first match after index, wrapping
+        around to the beginning if necessary, or None if there are no matches.
+        """
+        if self.num_matches == 0:
+            return None
+        i = np.searchsorted(self.match_starts, index, side="right")
+        if i >= len(self.match_starts):
+            i = 0
+        return int(self.match_starts[i]), int(self.match_ends[i])
+
+    def find_prev(self, index):
+        """Return the (start, end) of the last match before index, wrapping
+        around to the end if necessary, or None if there are no matches.
+        """
+        if self.num_matches == 0:
+            return None
+        i = np.searchsorted(self.match_starts, index, side="left") - 1
+        return int(self.match_starts[i]), int(self.match_ends[i])
@@ -0,0 +1,184 @@
+"""Session data with NumPy arrays stored outside of the JSON
+
+Large arrays in session data (e.g. per-byte style or label arrays) are slow
+to encode as base64 in JSON and take up much more space than the data itself.
+A SessionFile replaces each large array in the session dict with a reference
+to an .npy file in a sidecar directory next to the session file, so only the
+remaining (scalar) data is serialized as JSON. Loading maps the .npy files
+copy-on-write, so arrays are only read from disk as they are used.
+
+Arrays are written with new names each time the session is saved and the JSON
+is written last, so the session file always refers to a complete set of
+arrays. Arrays no longer referenced are removed after the JSON is written,
+except for those still mapped by arrays loaded from an earlier session, which
+are removed by a later save or when the application exits.
+"""
+import io
+import os
+import uuid
+import atexit
+import weakref
+
+import numpy as np
+import jsonpickle
+
+from . import jsonutil
+from .savefile import write_atomic
+
+import logging
+log = logging.getLogger(__name__)
+
+
+# key of the dict that replaces an array in the JSON data
+array_marker = "sawx/npy"
+
+sidecar_extension = ".arrays"
+
+# smaller arrays are stored in the JSON as usual
+min_sidecar_bytes = 4096
+
+# arrays loaded from sidecar files, by the absolute path of the file, that
+# are still in use and so still mapping their files
+mapped_arrays = weakref.WeakValueDictionary()
+
+# unused sidecar files that couldn't be removed because they were mapped
+unused_sidecar_files = set()
+
+
+def get_sidecar_dir(path):
+    return path + sidecar_extension
+
+
+def iter_npy_chunks(array, chunk_size=4 * 1024 * 1024):
+    """Return the contents of an .npy file for the array as a sequence of
+    bytes objects, without copying the array data
+    """
+    array = np.ascontiguousarray(array)
+    header = io.BytesIO()
+    np.lib.format.write_array_header_1_0(header, np.lib.format.header_data_from_array_1_0(array))
+    yield header.getvalue()
+    data = memoryview(array.reshape(-1).view(np.uint8))
+    for i in range(0, len(data), chunk_size):
+        yield data[i:i + chunk_size]
+
+
+class SessionFile:
+    def __init__(self, path, session, expand_keywords={}):
+        self.path = path
+        self.sidecar_dir = get_sidecar_dir(path)
+        self.token = uuid.uuid4().hex[:8]
+        self.arrays = {}
+        session = self.extract_arrays(session)
+        jsonpickle.set_encoder_options("json", sort_keys=True, indent=4)
+        text = jsonpickle.dumps(session)
+        self.text = jsonutil.collapse_json(text, 8, expand_keywords)
+
+    def __str__(self):
+        return f"SessionFile: {self.path}, {len(self.arrays)} arrays"
+
+    def extract_arrays(self, obj):
+        """Return a copy of the dicts, lists and tuples in obj with large
+        arrays replaced by references to .npy files.
+
+        The arrays are copied because they may be changed by the user
+        interface while the session is being written in the background.
+        """
+        if isinstance(obj, np.ndarray):
+            if obj.nbytes >= min_sidecar_bytes and not obj.dtype.hasobject:
+                name = f"{self.token}-{len(self.arrays)}.npy"
+                self.arrays[name] = obj.copy()
+                return {array_marker: name}
+            return obj
+        if isinstance(obj, dict):
+            return {k: self.extract_arrays(v) for k, v in obj.items()}
+        if isinstance(obj, list):
+            return [self.extract_arrays(v) for v in obj]
+        if isinstance(obj, tuple):
+            return tuple(self.extract_arrays(v) for v in obj)
+        return obj
+
+    def write(self):
+        if self.arrays:
+            os.makedirs(self.sidecar_dir, exist_ok=True)
+            for name, array in self.arrays.items():
+                write_atomic(os.path.join(self.sidecar_dir, name), iter_npy_chunks(array))
+        write_atomic(self.path, [self.text])
+        self.remove_unused_arrays()
+        log.debug(f"wrote {self}")
+
+    def remove_unused_arrays(self):
+        try:
+            names = os.listdir(self.sidecar_dir)
+        except OSError:
+            return
+        for name in names:
+            if name.endswith(".npy") and name not in self.arrays:
+                path = os.path.abspath(os.path.join(self.sidecar_dir, name))
+                if path in mapped_arrays:
+                    log.debug(f"postponing removal of mapped session array {path}")
+                    unused_sidecar_files.add(path)
+                    continue
+                unused_sidecar_files.discard(path)
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    log.warning(f"can't remove unused session array {name}: {e}")
+        if not self.arrays:
+            try:
+                os.rmdir(self.sidecar_dir)
+            except OSError:
+                pass
+
+
+def remove_unused_sidecar_files():
+    """Remove the unused sidecar files that were still mapped when their
+    session was saved, called when the application exits
+    """
+    for path in list(unused_sidecar_files):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            log.warning(f"can't remove unused session array {path}: {e}")
+            continue
+        unused_sidecar_files.discard(path)
+        try:
+            os.rmdir(os.path.dirname(path))
+        except OSError:
+            pass
+
+atexit.register(remove_unused_sidecar_files)
+
+
+def restore_arrays(obj, sidecar_dir):
+    """Replace the .npy file references in obj with the arrays. Missing or
+    unreadable arrays are replaced with None.
+
+    The arrays are memory mapped copy-on-write, so changes to them are never
+    written back to the files, which aren't removed while they're in use.
+    """
+    if isinstance(obj, dict):
+        if len(obj) == 1 and array_marker in obj:
+            path = os.path.abspath(os.path.join(sidecar_dir, os.path.basename(obj[array_marker])))
+            try:
+                array = np.load(path, mmap_mode="c", allow_pickle=False)
+            except (OSError, ValueError) as e:
+                log.error(f"can't load session array {path}: {e}")
+                return None
+            mapped_arrays[path] = array
+            return array
+        return {k: restore_arrays(v, sidecar_dir) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [restore_arrays(v, sidecar_dir) for v in obj]
+    if isinstance(obj, tuple):
+        return tuple(restore_arrays(v, sidecar_dir) for v in obj)
+    return obj
+
+
+def unserialize(path, text):
+    """Parse the session text loaded from path, including any arrays in its
+    sidecar directory
+    """
+    session = jsonutil.unserialize(path, text)
+    return restore_arrays(session, get_sidecar_dir(path))
@@ -27,18 +27,11 @@ def collapse_overlapping_ranges(ranges):
 
 
 def ranges_to_indexes(ranges):
-    if len(ranges) == 0:
-        return np.zeros([0], dtype=np.uint32)
-    return np.hstack((np.arange(r[0], r[1], dtype=np.uint32) for r in ranges))
+    return RangeSet(ranges).to_indexes()
 
 
 def indexes_to_ranges(indexes):
-    groups = np.split(indexes, np.where(np.diff(indexes) != 1)[0] + 1)
-    ranges = []
-    for group in groups:
-        if np.alen(group) > 0:
-            ranges.append((int(group[0]), int(group[-1]) + 1))
-    return ranges
+    return RangeSet.from_indexes(indexes).to_list()
 
 
 def invert_ranges(ranges, last):
@@ -46,82 +39,359 @@ def invert_ranges(ranges, last):
     monotonically increasing set of non-overlapping ranges that represents the
     opposite of the listed ranges
     """
-    # get a monotonically increasing list
-    ranges = collapse_overlapping_ranges(ranges)
-    inverted = []
-
-    first = 0
-    for start, end in ranges:
-        if start > first:
-            inverted.append((first, start))
-            first = end
+    return RangeSet(ranges).invert(last).to_list()
+
+
+def _normalize_ranges(starts, ends):
+    """Sort and merge the parallel start/end arrays into non-overlapping,
+    non-adjacent half-open ranges.
+
+    Ranges given backwards (start > end) are swapped and empty ranges are
+    dropped.
+    """
+    starts = np.asarray(starts, dtype=RangeSet.dtype)
+    ends = np.asarray(ends, dtype=RangeSet.dtype)
+    swap = starts > ends
+    if swap.any():
+        starts, ends = np.where(swap, ends, starts), np.where(swap, starts, ends)
+    keep = ends > starts
+    if not keep.all():
+        starts, ends = starts[keep], ends[keep]
+    if len(starts) == 0:
+        return starts, ends
+    order = np.argsort(starts, kind="stable")
+    starts = starts[order]
+    ends = np.maximum.accumulate(ends[order])
+
+    # a new range begins wherever the start is beyond everything seen so far;
+    # touching ranges are merged just like collapse_overlapping_ranges
+    first = np.empty(len(starts), dtype=np.bool_)
+    first[0] = True
+    np.greater(starts[1:], ends[:-1], out=first[1:])
+    last = np.empty_like(first)
+    last[:-1] = first[1:]
+    last[-1] = True
+    return starts[first], ends[last]
+
+
+class RangeSet:
+    """Set of integer indexes stored as sorted, non-overlapping half-open
+    ranges.
+
+    The start and end points are kept in two parallel NumPy arrays, so set
+    operations and membership tests cost time proportional to the number of
+    ranges rather than the number of indexes that they cover. Indexes are
+    only materialized when explicitly requested with `to_indexes`.
+    """
+    dtype = np.int64
+
+    def __init__(self, ranges=None):
+        if ranges is None:
+            self.starts = np.zeros([0], dtype=self.dtype)
+            self.ends = np.zeros([0], dtype=self.dtype)
+        elif isinstance(ranges, RangeSet):
+            self.starts = ranges.starts.copy()
+            self.ends = ranges.ends.copy()
+        else:
+            r = np.asarray(ranges, dtype=self.dtype).reshape(-1, 2)
+            self.starts, self.ends = _normalize_ranges(r[:,0], r[:,1])
+
+    @classmethod
+    def from_arrays(cls, starts, ends, normalized=False):
+        """Create from parallel arrays of start and end points.
+
+        If the caller guarantees that the arrays are already sorted,
+        non-overlapping and non-empty, `normalized` skips that processing.
+        """
+        rs = cls()
+        if normalized:
+            rs.starts = np.asarray(starts, dtype=cls.dtype)
+            rs.ends = np.asarray(ends, dtype=cls.dtype)
         else:
-            first = end
-    if first < last:
-        inverted.append((first, last))
-    return inverted
+            rs.starts, rs.ends = _normalize_ranges(starts, ends)
+        return rs
+
+    @classmethod
+    def from_indexes(cls, indexes):
+        """Create from an array of (possibly unsorted or repeated) indexes
+        """
+        indexes = np.asarray(indexes, dtype=cls.dtype)
+        if len(indexes) == 0:
+            return cls()
+        if len(indexes) > 1 and (np.diff(indexes) <= 0).any():
+            indexes = np.unique(indexes)
+        breaks = np.flatnonzero(np.diff(indexes) != 1) + 1
+        starts = indexes[np.r_[0, breaks]]
+        ends = indexes[np.r_[breaks - 1, len(indexes) - 1]] + 1
+        return cls.from_arrays(starts, ends, True)
+
+    @classmethod
+    def from_mask(cls, mask, offset=0):
+        """Create from a boolean array where True values are members of the
+        set. The index of the first element of the array is `offset`.
+        """
+        m = np.zeros(len(mask) + 2, dtype=np.int8)
+        m[1:-1] = np.asarray(mask, dtype=np.bool_)
+        edges = np.diff(m)
+        starts = np.flatnonzero(edges == 1) + offset
+        ends = np.flatnonzero(edges == -1) + offset
+        return cls.from_arrays(starts, ends, True)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __bool__(self):
+        return len(self.starts) > 0
+
+    def __iter__(self):
+        for start, end in zip(self.starts.tolist(), self.ends.tolist()):
+            yield start, end
+
+    def __eq__(self, other):
+        if not isinstance(other, RangeSet):
+            other = RangeSet(other)
+        return np.array_equal(self.starts, other.starts) and np.array_equal(self.ends, other.ends)
+
+    def __repr__(self):
+        return "RangeSet(%s)" % self.to_list()
+
+    def __contains__(self, index):
+        i = np.searchsorted(self.starts, index, "right") - 1
+        return bool(i >= 0 and index < self.ends[i])
+
+    def __or__(self, other):
+        return self.union(other)
+
+    def __and__(self, other):
+        return self.intersection(other)
+
+    def __sub__(self, other):
+        return self.difference(other)
+
+    @property
+    def num_indexes(self):
+        return int((self.ends - self.starts).sum())
+
+    @property
+    def first(self):
+        return int(self.starts[0]) if len(self.starts) else None
+
+    @property
+    def last(self):
+        return int(self.ends[-1]) if len(self.ends) else None
+
+    def copy(self):
+        return RangeSet(self)
+
+    def to_list(self):
+        return list(self)
+
+    def to_indexes(self, dtype=np.uint32):
+        """Materialize the full, sorted array of indexes in the set.
+        """
+        lengths = self.ends - self.starts
+        total = int(lengths.sum())
+        if total == 0:
+            return np.zeros([0], dtype=dtype)
+
+        # Build the first difference of the index array: a step of 1 within
+        # a range and the size of the gap at the start of each new range.
+        steps = np.ones(total, dtype=dtype)
+        steps[0] = self.starts[0]
+        steps[np.cumsum(lengths[:-1])] = self.starts[1:] - self.ends[:-1] + 1
+        return np.cumsum(steps, dtype=dtype, out=steps)
+
+    def contains(self, indexes):
+        """Vectorized membership test: returns a boolean array with an entry
+        for each item in `indexes`.
+        """
+        indexes = np.asarray(indexes)
+        i = np.searchsorted(self.starts, indexes, "right") - 1
+        valid = i >= 0
+        inside = np.zeros(indexes.shape, dtype=np.bool_)
+        inside[valid] = indexes[valid] < self.ends[i[valid]]
+        return inside
+
+    def clip(self, first, last):
+        """Return the subset of this set that lies within first <= index <
+        last. Only the ranges near the boundaries are examined, so this is
+        cheap even for huge sets and used for drawing only the visible part.
+        """
+        i1 = np.searchsorted(self.ends, first, "right")
+        i2 = np.searchsorted(self.starts, last, "left")
+        starts = np.maximum(self.starts[i1:i2], first)
+        ends = np.minimum(self.ends[i1:i2], last)
+        keep = ends > starts
+        return RangeSet.from_arrays(starts[keep], ends[keep], True)
+
+    def union(self, other):
+        if not isinstance(other, RangeSet):
+            other = RangeSet(other)
+        return RangeSet.from_arrays(np.concatenate((self.starts, other.starts)), np.concatenate((self.ends, other.ends)))
+
+    def invert(self, last, first=0):
+        """Return the set of indexes from first <= index < last that are not
+        in this set
+        """
+        starts = np.clip(np.r_[first, self.ends], first, last)
+        ends = np.clip(np.r_[self.starts, last], first, last)
+        keep = ends > starts
+        return RangeSet.from_arrays(starts[keep], ends[keep], True)
+
+    def intersection(self, other):
+        if not isinstance(other, RangeSet):
+            other = RangeSet(other)
+        if not self or not other:
+            return RangeSet()
+        first = min(self.starts[0], other.starts[0])
+        last = max(self.ends[-1], other.ends[-1])
+        outside = self.invert(last, first) | other.invert(last, first)
+        return outside.invert(last, first)
+
+    def difference(self, other):
+        if not isinstance(other, RangeSet):
+            other = RangeSet(other)
+        if not self or not other:
+            return self.copy()
+        return self & other.invert(self.ends[-1], self.starts[0])
+
+
+def _rect_rows_to_range_set(r1, c1, num_rows, num_cols, row_width, start_offset=0):
+    """Create a RangeSet from arrays describing rectangles, one range per row
+    of each rectangle.
+
+    Only the row count of each rectangle is expanded, so the cost depends on
+    the number of rows rather than the number of selected items.
+    """
+    num_rows = np.asarray(num_rows, dtype=RangeSet.dtype)
+    total = int(num_rows.sum())
+    if total == 0:
+        return RangeSet()
+    which = np.repeat(np.arange(len(num_rows)), num_rows)
+    first_of_rect = np.cumsum(num_rows) - num_rows
+    rows = np.asarray(r1, dtype=RangeSet.dtype)[which] + (np.arange(total) - first_of_rect[which])
+    starts = rows * row_width + np.asarray(c1, dtype=RangeSet.dtype)[which] - start_offset
+    ends = starts + np.asarray(num_cols, dtype=RangeSet.dtype)[which]
+    return RangeSet.from_arrays(starts, ends)
+
+
+def rect_ranges_to_range_set(row_width, start_offset, ranges):
+    """Convert a list of (start, end) index pairs, each of which describes
+    the opposite corners of a rectangle in a grid `row_width` items wide, into
+    a RangeSet.
+    """
+    r = np.asarray([r for r in ranges if r[0] is not None], dtype=RangeSet.dtype).reshape(-1, 2)
+    if len(r) == 0:
+        return RangeSet()
+    start = r.min(axis=1)
+    end = r.max(axis=1) - 1  # instead of slice format, last byte becomes inclusive
+    r1, c1 = np.divmod(start, row_width)
+    r2, c2 = np.divmod(end, row_width)
+    left = np.minimum(c1, c2)
+    num_cols = np.abs(c2 - c1) + 1
+    num_rows = r2 - r1 + 1
+    return _rect_rows_to_range_set(r1, left, num_rows, num_cols, row_width)
 
 
 def rect_ranges_to_indexes(row_width, start_offset, ranges):
-    # Loop over each range to determine the indexes of the selected bytes
     # Returns a unique, monotonically increasing list of indexes to guarantee
     # that each index appears in the list only once.
-    if len(ranges) == 0:
-        return np.zeros([0], dtype=np.uint32)
-    indexes = np.empty([0], dtype=np.uint32)
-    log.debug("starting rects: %s" % np.vectorize(hex)(ranges))
-    for start, end in ranges:
-        if start is None:
-            continue
-        if start > end:
-            start, end = end, start
-        end -= 1  # instead of slice format, last byte becomes inclusive
-        r1, c1 = divmod(start, row_width)
-        r2, c2 = divmod(end, row_width)
-        log.debug("before: %x-%x, (%d,%d) -> (%d,%d)" % (start, end, r1, c1, r2, c2))
-        if c2 < c1:
-            first_row_column_zero = start - c1
-            c1, c2 = c2, c1
-        else:
-            first_row_column_zero = start - c1
-        num_cols = c2 - c1 + 1
-        num_rows = r2 - r1 + 1
-        log.debug("range: %x-%x, (%d,%d) -> (%d,%d), nr=%d nc=%d zeroc=%x" % (start, end, r1, c1, r2, c2, num_rows, num_cols, first_row_column_zero))
-        rect_indexes = np.hstack((np.arange(i + c1 + first_row_column_zero, i + c1 + first_row_column_zero + num_cols, dtype=np.uint32) for i in range(0, num_rows * row_width, row_width)))
-        indexes = np.hstack((indexes, rect_indexes))
+    return rect_ranges_to_range_set(row_width, start_offset, ranges).to_indexes()
 
-    unique_indexes = np.unique(indexes)
-    log.debug("rect indexes: %s" % np.vectorize(hex)(unique_indexes))
-    return unique_indexes
+
+def rects_to_range_set(rects, row_width, start_offset=0):
+    """Convert a list of rectangles in the form [(r1, c1), (r2, c2)] where the
+    lower right corner is exclusive into a RangeSet of indexes, where the
+    index of row r and column c is ``r * row_width + c - start_offset``.
+    """
+    r = np.asarray(rects, dtype=RangeSet.dtype).reshape(-1, 4)
+    return _rect_rows_to_range_set(r[:,0], r[:,1], r[:,2] - r[:,0], r[:,3] - r[:,1], row_width, start_offset)
+
+
+def _calc_rect_coverage(rects, numr=None, numc=None):
+    """Mark the rectangles on a grid compressed to only those rows and
+    columns that are the boundary of some rectangle.
+
+    Returns the row boundaries, column boundaries and a boolean array where
+    ``inside[i, j]`` covers rows ``rows[i]:rows[i+1]`` and columns
+    ``cols[j]:cols[j+1]``.
+    """
+    r = np.asarray(rects, dtype=RangeSet.dtype).reshape(-1, 4)
+    bounds_r = [r[:,0], r[:,2]]
+    bounds_c = [r[:,1], r[:,3]]
+    if numr is not None:
+        bounds_r.append([0, numr])
+    if numc is not None:
+        bounds_c.append([0, numc])
+    rows = np.unique(np.concatenate(bounds_r))
+    cols = np.unique(np.concatenate(bounds_c))
+    ri1, ri2 = np.searchsorted(rows, r[:,0]), np.searchsorted(rows, r[:,2])
+    ci1, ci2 = np.searchsorted(cols, r[:,1]), np.searchsorted(cols, r[:,3])
+
+    # 2D difference array; the cumulative sums give the number of rectangles
+    # covering each compressed cell
+    coverage = np.zeros((len(rows), len(cols)), dtype=np.int32)
+    np.add.at(coverage, (ri1, ci1), 1)
+    np.add.at(coverage, (ri1, ci2), -1)
+    np.add.at(coverage, (ri2, ci1), -1)
+    np.add.at(coverage, (ri2, ci2), 1)
+    coverage = coverage.cumsum(axis=0).cumsum(axis=1)
+    return rows, cols, coverage[:-1,:-1] > 0
+
+
+def _mask_to_rects(rows, cols, mask):
+    """Convert cells of the compressed grid into the smallest-ish list of
+    rectangles by merging horizontal runs, then stacking runs that span the
+    same columns in consecutive rows.
+    """
+    num_r, num_c = mask.shape
+    if num_r == 0 or num_c == 0:
+        return []
+    padded = np.zeros((num_r, num_c + 2), dtype=np.int8)
+    padded[:,1:-1] = mask
+    edges = np.diff(padded, axis=1)
+    run_row, run_start = np.nonzero(edges == 1)
+    _, run_end = np.nonzero(edges == -1)
+    if len(run_row) == 0:
+        return []
+
+    order = np.lexsort((run_row, run_end, run_start))
+    run_row, run_start, run_end = run_row[order], run_start[order], run_end[order]
+    new = np.ones(len(run_row), dtype=np.bool_)
+    new[1:] = (run_start[1:] != run_start[:-1]) | (run_end[1:] != run_end[:-1]) | (run_row[1:] != run_row[:-1] + 1)
+    first = np.flatnonzero(new)
+    last = np.r_[first[1:] - 1, len(run_row) - 1]
+    r1 = rows[run_row[first]]
+    r2 = rows[run_row[last] + 1]
+    c1 = cols[run_start[first]]
+    c2 = cols[run_end[first]]
+    order = np.lexsort((c1, r1))
+    return [[(int(r1[i]), int(c1[i])), (int(r2[i]), int(c2[i]))] for i in order]
+
+
+def union_rects(rects):
+    """Merge the list of (possibly overlapping) rectangles in the form
+    [(r1, c1), (r2, c2)] into non-overlapping rectangles covering the same
+    area.
+    """
+    if len(rects) == 0:
+        return []
+    rows, cols, inside = _calc_rect_coverage(rects)
+    return _mask_to_rects(rows, cols, inside)
 
 
 def invert_rects(rects, numr, numc):
-    # Purely heuristic approach.  An algorithmic approach might be based on:
-    # http://stackoverflow.com/questions/30818645 but this one breaks up the
-    # entire space into a set of rectangles with boundaries at every possible
-    # row/col boundary of all the contained rectangles.
-
-    # Get list of all referenced rows and cols
-    rows = sorted(list(set([r[0] for rect in rects for r in rect]).union(set([0, numr]))))
-    cols = sorted(list(set([r[1] for rect in rects for r in rect]).union(set([0, numc]))))
-
-    # create inside/outside flags for each row/col in the entire grid
-    inside = np.zeros((numr, numc), dtype=np.bool_)
-    for [(r1, c1), (r2, c2)] in rects:
-        inside[r1:r2, c1:c2] = True
-
-    # create lo/hi values for each subdivision of the grid
-    rowpairs = [(rows[i], rows[i+1]) for i in range(len(rows) - 1)]
-    colpairs = [(cols[i], cols[i+1]) for i in range(len(cols) - 1)]
-
-    # create a rectangle at each intersection point and if it's outside the
-    # original set of rectangles, add it to the list
-    outside = []
-    for r1, r2 in rowpairs:
-        for c1, c2 in colpairs:
-            if not inside[r1, c1]:
-                outside.append([(r1, c1), (r2, c2)])
-
-    # optimization: merge neighboring rectangles that share common edges
-
-    return outside
+    """Return the list of non-overlapping rectangles that cover the area of a
+    `numr` x `numc` grid not covered by any of the rectangles in `rects`.
+
+    The grid is subdivided only at the boundaries of the given rectangles, so
+    the work depends on the number of rectangles and not on the size of the
+    grid.
+    """
+    if len(rects) == 0:
+        return [[(0, 0), (numr, numc)]] if numr > 0 and numc > 0 else []
+    rows, cols, inside = _calc_rect_coverage(rects, numr, numc)
+    keep_r = (rows >= 0) & (rows <= numr)
+    keep_c = (cols >= 0) & (cols <= numc)
+    inside = inside[keep_r[:-1] & keep_r[1:]][:,keep_c[:-1] & keep_c[1:]]
+    return _mask_to_rects(rows[keep_r], cols[keep_c], ~inside)
@@ -6,8 +6,15 @@
 These text utilities have no dependencies on any other part of peppy, and
 therefore may be used independently of peppy.
 """
+import os
 import re
+import codecs
+import functools
+import collections
 from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 
 import logging
 log = logging.getLogger(__name__)
@@ -70,16 +77,17 @@ def getMagicComments(data, headersize=1024):
 def detectBOM(data):
     """Search for unicode Byte Order Marks (BOM)
     """
-    boms = {
-        'utf-8': b'\xef\xbb\xbf',
-        'utf-16-le': b'\xff\xfe',
-        'utf-16-be': b'\xfe\xff',
-        'utf-32-le': b'\xff\xfe\x00\x00',
-        'utf-32-be': b'\x00\x00\xfe\xff',
-        }
-    # FIXME: utf-32 is not available in python 2.5, only 2.6 and later.
-
-    for encoding, bom in list(boms.items()):
+    # utf-32-le must be checked before utf-16-le because the utf-16-le BOM is
+    # a prefix of the utf-32-le BOM
+    boms = [
+        ('utf-8', b'\xef\xbb\xbf'),
+        ('utf-32-le', b'\xff\xfe\x00\x00'),
+        ('utf-32-be', b'\x00\x00\xfe\xff'),
+        ('utf-16-le', b'\xff\xfe'),
+        ('utf-16-be', b'\xfe\xff'),
+        ]
+    data = bytes(data[0:4])
+    for encoding, bom in boms:
         if data.startswith(bom):
             return encoding, bom
     return None, None
@@ -95,29 +103,81 @@ def detectEncoding(data):
     if isinstance(data, str):
         # Only check byte order marks when the input is a bytes.  If the
         # input is unicode, it can't have a valid byte order mark.
-        return unicode, None
+        return "unicode", None
     encoding, bom = detectBOM(data)
     if encoding:
         return encoding, bom
-    lines = getMagicComments(data)
-    regex = re.compile(b"coding[:=]\s*([-\w.]+)")
+    lines = getMagicComments(bytes(data[0:1024]))
+    regex = re.compile(rb"coding[:=]\s*([-\w.]+)")
     for txt in lines:
         match = regex.search(txt)
         if match:
-            log.debug("guessEncoding: Found encoding %s" % match.group(1))
-            return match.group(1), None
+            encoding = match.group(1).decode("ascii")
+            try:
+                codecs.lookup(encoding)
+            except LookupError:
+                log.debug("guessEncoding: unknown encoding %s" % encoding)
+                continue
+            log.debug("guessEncoding: Found encoding %s" % encoding)
+            return encoding, None
     return None, None
 
 
+def guessEncoding(data, headersize=65536, default="latin-1"):
+    """Determine the encoding of a byte string from the BOM or magic
+    comments, or by checking if the start of the data is valid UTF-8.
+
+    @returns tuple containing (encoding name, BOM) like detectEncoding, but
+    the encoding is never None; data that isn't valid UTF-8 uses the default.
+    """
+    encoding, bom = detectEncoding(data)
+    if encoding:
+        return encoding, bom
+    head = bytes(data[0:headersize])
+    try:
+        # incremental decoding so a character split at the end of the header
+        # isn't an error
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=len(head) == len(data))
+    except UnicodeDecodeError:
+        return default, None
+    return "utf-8", None
+
+
 def encodedBytesToUnicode(data, encoding, bom):
+    if encoding == "unicode":
+        return data
     if bom:
         start = len(bom)
     else:
         start = 0
-    unicodestring = data[start:].decode(encoding)
+    unicodestring = bytes(data[start:]).decode(encoding)
     return unicodestring
 
 
+decode_chunk_size = 1024 * 1024
+
+
+def decode_text(data, encoding, bom=None, errors="strict", chunk_size=None):
+    """Decode a bytes-like buffer (bytes, numpy array, memory mapped file)
+    into a string, skipping the byte order mark.
+
+    The buffer is decoded a chunk at a time with an incremental decoder, so
+    a memory mapped file isn't copied into a bytes object first.
+    """
+    if chunk_size is None:
+        chunk_size = decode_chunk_size
+    view = memoryview(data).cast("B") if not isinstance(data, np.ndarray) else memoryview(data.view(np.uint8))
+    decoder = codecs.getincrementaldecoder(encoding)(errors)
+    start = len(bom) if bom else 0
+    size = len(view)
+    texts = []
+    for pos in range(start, size, chunk_size):
+        end = min(pos + chunk_size, size)
+        texts.append(decoder.decode(view[pos:end], final=end == size))
+    texts.append(decoder.decode(b"", final=True))
+    return "".join(texts)
+
+
 def parseEmacs(header):
     """Determine if the header specifies a major mode.
     
@@ -186,40 +246,148 @@ def guessSpacesPerIndent(text):
     
     Takes from the SciTE source file SciTEBase::DiscoverIndentSetting
     """
-    tabsizes = [0]*9
-    indent = 0 # current line indentation
-    previndent = 0 # previous line indentation
-    prevsize = -1 # previous line tab size
-    newline = True
-    for c in text:
-        if c == '\n' or c == '\r':
-            newline = True
-            indent = 0
-        elif newline:
-            if c == ' ':
-                indent += 1
-            else:
-                if indent:
-                    if indent == previndent and prevsize >= 0:
-                        tabsizes[prevsize] += 1
-                    elif indent > previndent and previndent >= 0:
-                        if indent - previndent <= 8:
-                            prevsize = indent - previndent
-                            tabsizes[prevsize] += 1
-                        else:
-                            prevsize = -1
-                    previndent = indent
-                elif c == '\t':
-                    tabsizes[0] += 1
-                newline = False
-
-    # find maximum non-zero indent
-    index = -1
-    for i, size in enumerate(tabsizes):
-        if size > 0 and (index == -1 or size > tabsizes[index]):
-            index = i
-
-    return index
+    return LineStats(text).spaces_per_indent
+
+
+class LineStats:
+    """Line boundaries and indentation of text, computed with numpy array
+    operations rather than character by character.
+
+    The text may be a string or any bytes-like object (e.g. the raw data of
+    a document) in an ASCII compatible encoding. Indexes are character
+    indexes for a string and byte offsets otherwise. Lines end with any of
+    "\\n", "\\r\\n" or "\\r".
+
+    line_starts: index of the first character of each line
+    line_ends: index of the end of each line, not including the line ending
+    indent: number of leading spaces of each line
+    leading_whitespace: number of leading spaces and tabs of each line
+    has_tab_indent: True for lines where the leading whitespace contains a tab
+    tab_size_counts: SciTE indent size histogram; index 0 counts lines
+        indented by tabs, index N counts changes of indent by N spaces
+    """
+    # leading whitespace longer than this is counted one line at a time
+    max_vector_indent = 64
+
+    def __init__(self, text):
+        if isinstance(text, str):
+            d = self.calc_code_points(text)
+        elif isinstance(text, np.ndarray):
+            d = text.view(np.uint8)
+        else:
+            d = np.asarray(memoryview(text).cast("B"))
+        self.size = len(d)
+        self.calc_lines(d)
+        self.indent = self.calc_leading(d, b" ")
+        self.leading_whitespace = self.calc_leading(d, b" \t")
+        self.has_tab_indent = self.indent < self.leading_whitespace
+        self.calc_tab_sizes(d)
+
+    def __len__(self):
+        return len(self.line_starts)
+
+    @property
+    def num_lines(self):
+        return len(self.line_starts)
+
+    @classmethod
+    def calc_code_points(cls, text):
+        """Array with one element per character of the string, using a byte
+        per character when all the characters fit
+        """
+        try:
+            return np.frombuffer(text.encode("latin-1"), dtype=np.uint8)
+        except UnicodeEncodeError:
+            return np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+
+    def calc_lines(self, d):
+        lf = d == 10
+        eol = lf.copy()
+        # a CR followed by LF is part of the CRLF line ending
+        eol[:-1] |= (d[:-1] == 13) & ~lf[1:]
+        if self.size > 0:
+            eol[-1] |= d[-1] == 13
+        eol = np.flatnonzero(eol)
+        crlf = lf[eol] & (eol > 0) & (d[np.maximum(eol - 1, 0)] == 13)
+        self.line_starts = np.concatenate(([0], eol + 1)).astype(np.int64)
+        self.line_ends = np.concatenate((eol - crlf, [self.size])).astype(np.int64)
+
+    def calc_leading(self, d, chars):
+        """Return the number of characters at the start of each line that
+        are in chars
+        """
+        values = np.zeros(256, dtype=bool)
+        values[np.frombuffer(chars, dtype=np.uint8)] = True
+        starts = self.line_starts
+        ends = self.line_ends
+        count = np.zeros(len(starts), dtype=np.int64)
+        active = np.flatnonzero(starts < ends)
+        for i in range(self.max_vector_indent):
+            if len(active) == 0:
+                return count
+            pos = starts[active] + i
+            # characters outside of latin-1 are never whitespace here
+            ok = (pos < ends[active]) & values[np.minimum(d[np.minimum(pos, self.size - 1)], 255)]
+            active = active[ok]
+            count[active] += 1
+        for line in active.tolist():
+            i = starts[line] + count[line]
+            while i < ends[line] and d[i] < 256 and values[d[i]]:
+                i += 1
+            count[line] = i - starts[line]
+        return count
+
+    def calc_tab_sizes(self, d):
+        """SciTE's indent guessing, from SciTEBase::DiscoverIndentSetting.
+
+        Only lines with text after the indent count. The indent size is the
+        increase in indent from the previous indented line, and lines with the
+        same indent as the previous indented line count toward the size of
+        the most recent increase.
+        """
+        tabsizes = np.zeros(9, dtype=np.int64)
+        has_text = self.line_starts + self.indent < self.line_ends
+        indented = np.flatnonzero(has_text & (self.indent > 0))
+        first_chars = d[np.minimum(self.line_starts, max(self.size - 1, 0))] if self.size > 0 else np.zeros(0, dtype=np.uint8)
+        tabsizes[0] = np.count_nonzero(has_text & (self.indent == 0) & (first_chars == 9))
+
+        indent = self.indent[indented]
+        prev = np.concatenate(([0], indent[:-1]))
+        diff = indent - prev
+        increase = diff > 0
+        # size set by each increase, carried forward to following lines
+        size = np.where(diff <= 8, diff, -1)
+        last_increase = np.maximum.accumulate(np.where(increase, np.arange(len(diff)), -1)) if len(diff) > 0 else diff
+        prevsize = np.where(last_increase >= 0, size[np.maximum(last_increase, 0)], -1)
+        prevsize = np.concatenate(([-1], prevsize[:-1]))
+        same = (diff == 0) & (prevsize >= 0)
+        tabsizes += np.bincount(prevsize[same], minlength=9)[:9]
+        grew = increase & (diff <= 8)
+        tabsizes += np.bincount(diff[grew], minlength=9)[:9]
+        self.tab_size_counts = tabsizes
+
+    @property
+    def spaces_per_indent(self):
+        """Most common indent size, 0 if indenting with tabs, or -1 if there
+        are no indented lines
+        """
+        tabsizes = self.tab_size_counts
+        if not tabsizes.any():
+            return -1
+        return int(np.argmax(tabsizes))
+
+    @property
+    def uses_tabs(self):
+        return bool(self.has_tab_indent.any())
+
+    def line_of_index(self, index):
+        """Return the line containing the character at index"""
+        return int(np.searchsorted(self.line_starts, index, side="right") - 1)
+
+    def index_of_line(self, line):
+        """Return the index of the first character of the line"""
+        return int(self.line_starts[line])
+
 
 # HTML converters from Chris Barker:
 #
@@ -455,17 +623,16 @@ def parse_pretty_seconds(s):
 
 
 def check_for_matching_lines(text, sre):
-    """Return a list of lines that match the regular expression
+    """Return the number of lines that match and don't match the regular
+    expression. Blank lines are not counted.
     """
     cre = re.compile(sre)
     num_matched = 0
     num_unmatched = 0
     for line in text.splitlines(False):
-        log.debug("processing %s" % line)
         match = cre.match(line)
         if match is None:
             if line.strip(): # ignore blank lines
-                log.debug("unmatched: %s" % line)
                 num_unmatched += 1
         else:
             num_matched += 1
@@ -482,21 +649,219 @@ def parse_for_matching_lines(text, sre, group_indexes):
     matches = []
     num_unmatched = 0
     for line in text.splitlines(False):
-        log.debug("processing %s" % line)
         match = cre.match(line)
         if match is None:
             if line.strip(): # ignore blank lines
-                log.debug("unmatched: %s" % line)
                 num_unmatched += 1
         else:
-            row = []
-            for i in group_indexes:
-                row.append(match.group(i))
-            matches.append(row)
+            matches.append([match.group(i) for i in group_indexes])
     log.debug("%d matched, %d unmatched" % (len(matches), num_unmatched))
     return matches, num_unmatched
 
 
+default_line_chunk_size = 16 * 1024 * 1024
+
+
+def iter_line_chunks(source, chunk_size=None, encoding="utf-8"):
+    """Generator returning consecutive chunks of bytes from the source that
+    each end on a line boundary.
+
+    The source may be text, any bytes-like object, an open binary file, or a
+    path object (e.g. pathlib.Path; plain strings are treated as text). Files
+    are read one chunk at a time so the whole file is never in memory at
+    once.
+    """
+    if chunk_size is None:
+        chunk_size = default_line_chunk_size
+    if isinstance(source, str):
+        source = source.encode(encoding)
+    elif isinstance(source, os.PathLike):
+        with open(source, "rb") as fh:
+            yield from iter_line_chunks(fh, chunk_size)
+        return
+    if hasattr(source, "read"):
+        read = source.read
+    else:
+        view = memoryview(source).cast("B")
+        pos = [0]
+
+        def read(size):
+            chunk = view[pos[0]:pos[0] + size].tobytes()
+            pos[0] += size
+            return chunk
+    leftover = b""
+    while True:
+        chunk = read(chunk_size)
+        if not chunk:
+            break
+        chunk = leftover + chunk
+        i = max(chunk.rfind(b"\n"), chunk.rfind(b"\r"))
+        if i < 0:
+            leftover = chunk
+        else:
+            leftover = chunk[i + 1:]
+            yield chunk[:i + 1]
+    if leftover:
+        yield leftover
+
+
+@functools.lru_cache()
+def compile_bytes_regex(sre, encoding="utf-8"):
+    if isinstance(sre, str):
+        sre = sre.encode(encoding)
+    return re.compile(sre)
+
+
+def default_fill_value(dtype):
+    """Value used for missing or unconvertible values of the dtype"""
+    if dtype is None:
+        return b""
+    kind = np.dtype(dtype).kind
+    if kind in "fc":
+        return np.nan
+    elif kind == "b":
+        return False
+    elif kind in "SU":
+        return ""
+    return 0
+
+
+def _convert_column(values, missing, dtype, fill_value):
+    """Convert the bytes values to the dtype, using fill_value where the value
+    is missing or can't be converted. Returns the array and the number of
+    values that couldn't be converted.
+    """
+    converted = np.full(len(values), fill_value, dtype=dtype)
+    present = np.flatnonzero(~missing)
+    try:
+        converted[present] = values[present].astype(dtype)
+        return converted, 0
+    except (ValueError, OverflowError):
+        pass
+    # only a few values are expected to be bad, so find them one at a time
+    num_bad = 0
+    for i in present.tolist():
+        try:
+            converted[i] = values[i:i + 1].astype(dtype)[0]
+        except (ValueError, OverflowError):
+            num_bad += 1
+    return converted, num_bad
+
+
+def _parse_chunk_for_matching_lines(chunk, sre, group_indexes, dtypes, fill_values, encoding):
+    match = compile_bytes_regex(sre, encoding).match
+    columns = [[] for i in group_indexes]
+    num_matched = 0
+    num_unmatched = 0
+    for line in chunk.splitlines():
+        m = match(line)
+        if m is None:
+            if line.strip(): # ignore blank lines
+                num_unmatched += 1
+        else:
+            num_matched += 1
+            for column, i in zip(columns, group_indexes):
+                column.append(m.group(i))
+    arrays = []
+    num_bad = 0
+    for column, dtype, fill_value in zip(columns, dtypes, fill_values):
+        # optional groups that didn't match are None
+        missing = np.asarray([v is None for v in column], dtype=np.bool_)
+        if dtype is None:
+            values = np.asarray([fill_value if v is None else v for v in column], dtype=np.bytes_)
+        else:
+            values = np.asarray([b"" if v is None else v for v in column], dtype=np.bytes_)
+            values, bad = _convert_column(values, missing, dtype, fill_value)
+            num_bad += bad
+        arrays.append(values)
+    return num_matched, num_unmatched, num_bad, arrays
+
+
+def parse_matching_lines(source, sre, group_indexes, dtypes=np.float64, chunk_size=None, num_processes=None, encoding="utf-8", fill_values=None):
+    """Parse all the lines in the source that match the regular expression,
+    returning the number of matched lines, the number of unmatched lines
+    (not counting blank lines), and a list of numpy arrays, one for each of
+    the groups in group_indexes.
+
+    The source can be anything accepted by iter_line_chunks. Values are
+    converted to the dtype given for each group (or one dtype for all
+    groups); a dtype of None leaves the values as bytes. Values from optional
+    groups that don't match, or that can't be converted to the dtype, are
+    replaced by the fill value given for each group (or one for all groups).
+    By default that's NaN for floating point dtypes, 0 for integers and empty
+    for bytes; the number of values that couldn't be converted is logged.
+
+    Lines are matched as bytes, so character classes like \\w only match
+    ASCII; check_for_matching_lines and parse_for_matching_lines match text
+    using str semantics.
+
+    Chunks are parsed in num_processes worker processes (all CPUs if None)
+    when there is more than one chunk.
+    """
+    group_indexes = tuple(group_indexes)
+    if dtypes is None or not isinstance(dtypes, (list, tuple)):
+        dtypes = (dtypes,) * len(group_indexes)
+    dtypes = tuple(dtypes)
+    if len(dtypes) != len(group_indexes):
+        raise ValueError("Need one dtype for each group")
+    if fill_values is None:
+        fill_values = tuple(default_fill_value(dtype) for dtype in dtypes)
+    elif not isinstance(fill_values, (list, tuple)):
+        fill_values = (fill_values,) * len(group_indexes)
+    fill_values = tuple(fill_values)
+    if len(fill_values) != len(group_indexes):
+        raise ValueError("Need one fill value for each group")
+    if num_processes is None:
+        num_processes = os.cpu_count() or 1
+    chunks = iter_line_chunks(source, chunk_size, encoding)
+    args = (sre, group_indexes, dtypes, fill_values, encoding)
+
+    def iter_results():
+        first = next(chunks, None)
+        second = next(chunks, None)
+        if second is None or num_processes < 2:
+            for chunk in [first, second]:
+                if chunk is not None:
+                    yield _parse_chunk_for_matching_lines(chunk, *args)
+            for chunk in chunks:
+                yield _parse_chunk_for_matching_lines(chunk, *args)
+            return
+        with ProcessPoolExecutor(num_processes) as executor:
+            # limit the number of chunks in flight so the whole file isn't
+            # read into memory while waiting for the workers
+            pending = collections.deque()
+            window = 2 * num_processes
+            for chunk in [first, second]:
+                pending.append(executor.submit(_parse_chunk_for_matching_lines, chunk, *args))
+            for chunk in chunks:
+                pending.append(executor.submit(_parse_chunk_for_matching_lines, chunk, *args))
+                if len(pending) >= window:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    num_matched = 0
+    num_unmatched = 0
+    num_bad = 0
+    columns = [[] for i in group_indexes]
+    for matched, unmatched, bad, arrays in iter_results():
+        num_matched += matched
+        num_unmatched += unmatched
+        num_bad += bad
+        for column, values in zip(columns, arrays):
+            column.append(values)
+    arrays = []
+    for column, dtype in zip(columns, dtypes):
+        if column:
+            arrays.append(np.concatenate(column))
+        else:
+            arrays.append(np.zeros(0, dtype=np.bytes_ if dtype is None else dtype))
+    if num_bad:
+        log.warning(f"{num_bad} values couldn't be converted and were replaced by fill values")
+    log.debug("%d matched, %d unmatched" % (num_matched, num_unmatched))
+    return num_matched, num_unmatched, arrays
+
+
 if __name__ == "__main__":
     import sys
 
@@ -0,0 +1,316 @@
+"""Random access to the members of zip archives without extracting them
+
+URIs of the form ``zip://path/to/archive.zip!/member/name`` are opened by
+open_zip_uri. The central directory of each archive is read once into a
+ZipIndex (cached until the archive changes on disk), and members are read
+only as needed:
+
+* stored (uncompressed) members are read directly from their offset in the
+  archive, so any part of them can be read immediately
+* compressed members are decompressed only as far as the furthest position
+  that has been read, into a temporary file shared by everything reading that
+  member, so seeking backwards never decompresses the data again
+"""
+import io
+import os
+import struct
+import zipfile
+import tempfile
+import threading
+import collections
+
+import logging
+log = logging.getLogger(__name__)
+
+
+uri_prefix = "zip://"
+
+member_separator = "!/"
+
+# number of archive indexes kept open
+max_cached_indexes = 16
+
+# number of decompressed members kept for each archive
+max_cached_members = 4
+
+local_header = struct.Struct("<IHHHHHIIIHH")
+
+
+def split_zip_path(path):
+    """Split "archive!/member" into the archive path and member name, using
+    the first separator after which the archive path is an existing file
+    """
+    start = 0
+    while True:
+        i = path.find(member_separator, start)
+        if i < 0:
+            raise FileNotFoundError(f"No archive member in zip path '{path}'")
+        archive = path[:i]
+        if os.path.isfile(archive):
+            return archive, path[i + len(member_separator):]
+        start = i + 1
+
+
+def make_zip_uri(archive, member):
+    return f"{uri_prefix}{archive}{member_separator}{member}"
+
+
+class DecompressedMember:
+    """Decompressed contents of a compressed member, filled in a block at a
+    time as far as needed by reads
+    """
+    block_size = 1024 * 1024
+
+    def __init__(self, archive_path, info):
+        self.info = info
+        self.size = info.file_size
+        self.zf = zipfile.ZipFile(archive_path)
+        self.source = self.zf.open(info)
+        self.cache = tempfile.TemporaryFile()
+        self.decompressed = 0
+        self.lock = threading.Lock()
+        # the member is closed once it has been removed from the cache and
+        # all the files reading it have been closed
+        self.num_users = 0
+        self.is_evicted = False
+
+    def acquire(self):
+        with self.lock:
+            self.num_users += 1
+
+    def release(self):
+        with self.lock:
+            self.num_users -= 1
+            done = self.is_evicted and self.num_users == 0
+        if done:
+            self.close()
+
+    def evict(self):
+        with self.lock:
+            self.is_evicted = True
+            done = self.num_users == 0
+        if done:
+            self.close()
+
+    def close(self):
+        with self.lock:
+            if self.source is not None:
+                self.source.close()
+                self.zf.close()
+                self.source = None
+            self.cache.close()
+
+    def read_at(self, pos, count):
+        with self.lock:
+            end = min(pos + count, self.size)
+            while self.decompressed < end:
+                data = self.source.read(self.block_size)
+                if not data:
+                    break
+                self.cache.seek(self.decompressed)
+                self.cache.write(data)
+                self.decompressed += len(data)
+            if self.decompressed >= self.size and self.source is not None:
+                self.source.close()
+                self.zf.close()
+                self.source = None
+            self.cache.seek(pos)
+            return self.cache.read(max(min(end, self.decompressed) - pos, 0))
+
+
+class ZipIndex:
+    """Central directory of a zip archive"""
+    def __init__(self, archive_path):
+        self.archive_path = archive_path
+        stat = os.stat(archive_path)
+        self.stat_key = (stat.st_size, stat.st_mtime_ns)
+        with zipfile.ZipFile(archive_path) as zf:
+            self.infos = {info.filename: info for info in zf.infolist()}
+        self.extension_cache = {}
+        self.members = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def __str__(self):
+        return f"ZipIndex: {self.archive_path}, {len(self.infos)} members"
+
+    def __contains__(self, name):
+        return name in self.infos
+
+    def close(self):
+        with self.lock:
+            for member in self.members.values():
+                member.evict()
+            self.members.clear()
+
+    def is_current(self):
+        try:
+            stat = os.stat(self.archive_path)
+        except OSError:
+            return False
+        return (stat.st_size, stat.st_mtime_ns) == self.stat_key
+
+    @property
+    def names(self):
+        return list(self.infos.keys())
+
+    def getinfo(self, name):
+        try:
+            return self.infos[name]
+        except KeyError:
+            raise FileNotFoundError(f"No member '{name}' in {self.archive_path}")
+
+    def contains_extension(self, ext):
+        try:
+            return self.extension_cache[ext]
+        except KeyError:
+            found = any(name.endswith(ext) for name in self.infos)
+            self.extension_cache[ext] = found
+            return found
+
+    def get_data_offset(self, info):
+        with open(self.archive_path, "rb") as fh:
+            fh.seek(info.header_offset)
+            header = local_header.unpack(fh.read(local_header.size))
+        if header[0] != 0x04034b50:
+            raise zipfile.BadZipFile(f"Bad local header for {info.filename} in {self.archive_path}")
+        filename_length, extra_length = header[9], header[10]
+        return info.header_offset + local_header.size + filename_length + extra_length
+
+    def get_decompressed(self, info):
+        """Return the DecompressedMember for the member, which must be
+        released by the caller when it's no longer used
+        """
+        with self.lock:
+            try:
+                member = self.members.pop(info.filename)
+            except KeyError:
+                member = DecompressedMember(self.archive_path, info)
+                if len(self.members) >= max_cached_members:
+                    _, oldest = self.members.popitem(last=False)
+                    oldest.evict()
+            self.members[info.filename] = member
+            member.acquire()
+            return member
+
+    def open(self, name):
+        """Return a seekable binary file object for the member"""
+        info = self.getinfo(name)
+        if info.is_dir():
+            raise IsADirectoryError(f"'{name}' is a directory in {self.archive_path}")
+        if info.compress_type == zipfile.ZIP_STORED and not info.flag_bits & 0x1:
+            return StoredMemberFile(self.archive_path, self.get_data_offset(info), info.file_size)
+        return DecompressedMemberFile(self.get_decompressed(info))
+
+
+class MemberFile(io.RawIOBase):
+    def __init__(self, size):
+        io.RawIOBase.__init__(self)
+        self.size = size
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self.pos + offset
+        elif whence == io.SEEK_END:
+            pos = self.size + offset
+        else:
+            raise ValueError(f"invalid whence ({whence})")
+        if pos < 0:
+            raise ValueError(f"negative seek position {pos}")
+        self.pos = pos
+        return pos
+
+    def read_at(self, pos, count):
+        raise NotImplementedError
+
+    def readinto(self, buffer):
+        data = self.read_at(self.pos, min(len(buffer), max(self.size - self.pos, 0)))
+        n = len(data)
+        buffer[:n] = data
+        self.pos += n
+        return n
+
+    def readall(self):
+        return self.read(max(self.size - self.pos, 0))
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = max(self.size - self.pos, 0)
+        data = self.read_at(self.pos, min(size, max(self.size - self.pos, 0)))
+        self.pos += len(data)
+        return data
+
+
+class StoredMemberFile(MemberFile):
+    def __init__(self, archive_path, offset, size):
+        MemberFile.__init__(self, size)
+        self.fh = open(archive_path, "rb")
+        self.offset = offset
+
+    def close(self):
+        if not self.closed:
+            self.fh.close()
+        MemberFile.close(self)
+
+    def read_at(self, pos, count):
+        self.fh.seek(self.offset + pos)
+        return self.fh.read(count)
+
+
+class DecompressedMemberFile(MemberFile):
+    def __init__(self, member):
+        MemberFile.__init__(self, member.size)
+        self.member = member
+
+    def close(self):
+        if not self.closed:
+            self.member.release()
+        MemberFile.close(self)
+
+    def read_at(self, pos, count):
+        return self.member.read_at(pos, count)
+
+
+indexes = collections.OrderedDict()
+
+indexes_lock = threading.Lock()
+
+
+def get_zip_index(archive_path):
+    """Return the (cached) ZipIndex of the archive"""
+    key = os.path.abspath(archive_path)
+    with indexes_lock:
+        index = indexes.pop(key, None)
+        if index is not None and not index.is_current():
+            index.close()
+            index = None
+        if index is None:
+            index = ZipIndex(key)
+            log.debug(f"loaded {index}")
+            if len(indexes) >= max_cached_indexes:
+                _, oldest = indexes.popitem(last=False)
+                oldest.close()
+        indexes[key] = index
+        return index
+
+
+def open_zip_uri(path, mode="rb"):
+    """Open the "archive!/member" path (the URI without the zip:// prefix)"""
+    if mode not in ("r", "rb"):
+        raise ValueError(f"invalid mode for zip filesystem: '{mode}'")
+    archive, member = split_zip_path(path)
+    fh = get_zip_index(archive).open(member)
+    if mode == "rb":
+        return io.BufferedReader(fh)
+    return io.TextIOWrapper(io.BufferedReader(fh), encoding="utf-8")
@@ -106,6 +106,7 @@ setup(
         ],
         "sawx.editors": [
             'html = sawx.editors.html_viewer',
+            'large_text = sawx.editors.large_text_viewer',
             'text = sawx.editors.text_editor',
         ],
     },
@@ -0,0 +1,172 @@
+import types
+
+import numpy as np
+import pytest
+
+from sawx.ui.compactgrid import CompactGrid, HexTable, VariableWidthHexTable
+from sawx.ui.compactgrid import make_byte_text_table, format_bytes, hex_byte_text, decimal_byte_text, ascii_byte_text
+
+
+def make_table(size, items_per_row, start_addr=0):
+    data = np.arange(size, dtype=np.uint8)
+    style = np.zeros(size, dtype=np.uint8)
+    return HexTable(data, style, items_per_row, start_addr, row_labels_in_multiples=True)
+
+
+@pytest.mark.parametrize("size,items_per_row,start_addr", [(100, 16, 0), (100, 16, 0x605), (7, 4, 3), (1, 8, 0)])
+def test_array_index_helpers(size, items_per_row, start_addr):
+    t = make_table(size, items_per_row, start_addr)
+    rows, cols = np.meshgrid(np.arange(-2, t.num_rows + 2), np.arange(-2, items_per_row + 2))
+    rows = rows.ravel()
+    cols = cols.ravel()
+
+    r, c = t.enforce_valid_rows_cols(rows, cols)
+    assert list(zip(r.tolist(), c.tolist())) == [t.enforce_valid_row_col(*rc) for rc in zip(rows.tolist(), cols.tolist())]
+
+    indexes = t.get_index_of_rows_cols(rows, cols)
+    assert indexes.tolist() == [t.get_index_range(*rc)[0] for rc in zip(rows.tolist(), cols.tolist())]
+
+    indexes = np.arange(0, t.last_valid_index + 1)
+    r, c = t.index_to_rows_cols(indexes)
+    assert list(zip(r.tolist(), c.tolist())) == [t.index_to_row_col(i) for i in indexes.tolist()]
+
+
+def test_array_index_helpers_use_overridden_scalar_methods():
+    class ShiftedTable(HexTable):
+        def index_to_row_col(self, index):
+            return HexTable.index_to_row_col(self, index + 1)
+
+        def get_index_range(self, row, col):
+            return 5, 6
+
+    t = ShiftedTable(np.zeros(64, dtype=np.uint8), np.zeros(64, dtype=np.uint8), 16)
+    r, c = t.index_to_rows_cols([0, 15, 31])
+    assert list(zip(r.tolist(), c.tolist())) == [(0, 1), (1, 0), (2, 0)]
+    assert t.get_index_of_rows_cols([0, 3], [0, 9]).tolist() == [5, 5]
+
+
+def brute_force_rows(sizes):
+    """List of (row, col) of every index"""
+    return [(r, c) for r, size in enumerate(sizes) for c in range(size)]
+
+
+def check_variable_width_lookups(t, sizes):
+    rcs = brute_force_rows(sizes)
+    assert t.num_rows == len(sizes)
+    assert t.last_valid_index == len(rcs)
+    assert t.index_of_row.tolist() == [rcs.index((r, 0)) for r in range(len(sizes))]
+    for index, rc in enumerate(rcs):
+        assert t.index_to_row_col(index) == rc
+        assert t.get_index_range(*rc) == (index, index + 1)
+    indexes = np.arange(-3, len(rcs) + 3)
+    r, c = t.index_to_rows_cols(indexes)
+    assert list(zip(r.tolist(), c.tolist())) == [t.index_to_row_col(i) for i in indexes.tolist()]
+    rows, cols = np.array(rcs).T
+    assert t.get_index_of_rows_cols(rows, cols).tolist() == list(range(len(rcs)))
+    rows = np.repeat(np.arange(-2, t.num_rows + 2), 12)
+    cols = np.tile(np.arange(-2, 10), t.num_rows + 4)
+    r, c = t.enforce_valid_rows_cols(rows, cols)
+    assert list(zip(r.tolist(), c.tolist())) == [t.enforce_valid_row_col(*rc) for rc in zip(rows.tolist(), cols.tolist())]
+
+
+def test_variable_width_lookups():
+    desc = [3, 0, 5, 1, 4, 1]
+    sizes = [3, 5, 1, 4, 1]
+    data = np.arange(14, dtype=np.uint8)
+    t = VariableWidthHexTable(data, np.zeros(14, dtype=np.uint8), desc)
+    check_variable_width_lookups(t, sizes)
+
+    # indexes past the end are clamped to the last item
+    assert t.index_to_row_col(100) == (4, 0)
+    assert t.index_to_row_col(-5) == (0, 0)
+
+
+def test_variable_width_set_row_size():
+    data = np.arange(40, dtype=np.uint8)
+    t = VariableWidthHexTable(data, np.zeros(40, dtype=np.uint8), [3, 5, 1, 4])
+    assert t.get_row_text(1) == ["3", "4", "5", "6", "7"]
+    t.set_row_size(1, 2)
+    check_variable_width_lookups(t, [3, 2, 1, 4])
+    assert t.get_row_text(1) == ["3", "4"]
+    assert t.get_row_text(2) == ["5"]
+    t.set_row_size(0, 7)
+    check_variable_width_lookups(t, [7, 2, 1, 4])
+    assert t.get_row_text(3) == ["10", "11", "12", "13"]
+    with pytest.raises(ValueError):
+        t.set_row_size(2, 0)
+    check_variable_width_lookups(t, [7, 2, 1, 4])
+
+    t.set_row_sizes([1, 1, 8])
+    check_variable_width_lookups(t, [1, 1, 8])
+    assert t.get_row_text(2) == [str(i) for i in range(2, 10)]
+
+
+def test_row_text_follows_data_changes():
+    data = np.arange(40, dtype=np.uint8)
+    t = VariableWidthHexTable(data, np.zeros(40, dtype=np.uint8), [8, 8, 8, 8, 8])
+    assert t.get_row_values_styles(1, 0, 3)[0] == ["8", "9", "10"]
+    assert t.get_row_values_styles(3, 0, 2)[0] == ["24", "25"]
+
+    # the editor refreshes the whole view after data changes
+    grid = types.SimpleNamespace(table=t, Refresh=lambda: None)
+    grid.top = grid.left = grid
+    grid.redraw_view = lambda: CompactGrid.redraw_view(grid)
+    data[9] = 99
+    CompactGrid.refresh_view(grid)
+    assert t.get_row_values_styles(1, 0, 3)[0] == ["8", "99", "10"]
+
+    # or only the range of changed indexes
+    t.get_row_values_styles(3, 0, 2)
+    data[8] = 77
+    data[25] = 55
+    CompactGrid.refresh_data_range(grid, 25, 26)
+    assert t.get_row_values_styles(3, 0, 2)[0] == ["24", "55"]
+    assert t.get_row_values_styles(1, 0, 3)[0] == ["8", "99", "10"]
+    CompactGrid.refresh_data_range(grid)
+    assert t.get_row_values_styles(1, 0, 3)[0] == ["77", "99", "10"]
+
+
+all_bytes = np.arange(256, dtype=np.uint8)
+
+
+def test_byte_text_tables():
+    assert format_bytes(all_bytes) == ["%02x" % i for i in range(256)]
+    assert format_bytes(all_bytes, decimal_byte_text) == [str(i) for i in range(256)]
+    assert format_bytes(all_bytes, ascii_byte_text) == [chr(i) if 32 <= i < 127 else "." for i in range(256)]
+    assert format_bytes(bytes([0, 0x7f, 0xff]), hex_byte_text) == ["00", "7f", "ff"]
+    assert format_bytes([]) == []
+
+    charset = "".join(chr(0x100 + i) for i in range(256))
+    assert format_bytes(all_bytes, make_byte_text_table(charset)) == list(charset)
+    assert format_bytes(all_bytes, make_byte_text_table(list(charset))) == list(charset)
+    with pytest.raises(ValueError):
+        make_byte_text_table(["x"] * 255)
+
+
+@pytest.mark.parametrize("text_table", [hex_byte_text, decimal_byte_text, ascii_byte_text])
+def test_display_text_table_matches_calc_display_text(text_table):
+    class ScalarTable(HexTable):
+        def calc_display_text(self, col, item):
+            return text_table[item]
+
+    class LookupTable(HexTable):
+        display_text_table = text_table
+
+    args = (all_bytes, np.zeros(256, dtype=np.uint8), 16)
+    scalar = ScalarTable(*args)
+    lookup = LookupTable(*args)
+    for col in (0, 5):
+        assert lookup.calc_display_texts(col, all_bytes) == scalar.calc_display_texts(col, all_bytes)
+    assert HexTable(*args).calc_display_texts(0, all_bytes[:3]) == ["0", "1", "2"]
+
+
+def test_primary_caret_visible_info():
+    from sawx.ui.compactgrid_mouse import Caret, MultiCaretHandler
+
+    t = make_table(1000, 16)
+    handler = MultiCaretHandler()
+    handler.set_carets([Caret(30, 1), Caret(12, 4), Caret(5, 3)])
+    grid = types.SimpleNamespace(table=t, caret_handler=handler, main=types.SimpleNamespace(first_visible_row=10, visible_rows=10))
+    assert CompactGrid.calc_primary_caret_visible_info(grid) == (12 * 16 + 4, 12, 2, 4)
+    grid.main.first_visible_row = 40
+    assert CompactGrid.calc_primary_caret_visible_info(grid) == (40 * 16, 40, 0, 0)
@@ -0,0 +1,155 @@
+import random
+
+import numpy as np
+import pytest
+
+from sawx.ui.compactgrid import HexTable
+from sawx.ui.compactgrid_mouse import Caret, MultiCaretHandler
+
+
+def make_table(size=200, items_per_row=16):
+    return HexTable(np.arange(size, dtype=np.uint8), np.zeros(size, dtype=np.uint8), items_per_row)
+
+
+def make_caret(rc, start=None, end=None):
+    caret = Caret(*rc)
+    if start is not None:
+        caret.set_initial_selection(start, end)
+    return caret
+
+
+def collapse_one_at_a_time(others, current):
+    """The merge rules of collapse_overlapping applied to Caret objects"""
+    collapsed = []
+    if current.has_selection:
+        for c in others:
+            if current.contains(c):
+                continue
+            elif current.intersects(c):
+                current.merge(c)
+            else:
+                collapsed.append(c)
+    else:
+        for c in others:
+            if not c.has_selection and c.rc == current.rc:
+                continue
+            collapsed.append(c)
+    return collapsed + [current]
+
+
+def random_caret(rng):
+    rc = (rng.randrange(20), rng.randrange(16))
+    if rng.random() < 0.3:
+        return Caret(*rc)
+    a = (rng.randrange(20), rng.randrange(16))
+    b = (rng.randrange(20), rng.randrange(16))
+    start, end = min(a, b), max(a, b)
+    return make_caret(rc, start, end)
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_collapse_overlapping(seed):
+    rng = random.Random(seed)
+    carets = [random_caret(rng) for _ in range(rng.randrange(1, 12))]
+    handler = MultiCaretHandler()
+    handler.set_carets([c.copy() for c in carets])
+    current = handler.current
+
+    others = handler.copy_carets()[:-1]
+    expected = collapse_one_at_a_time(others, carets[-1].copy())
+
+    handler.collapse_overlapping()
+    assert handler.current is current
+    assert sorted(handler.serialize()[:-1]) == sorted(c.serialize() for c in expected[:-1])
+    assert handler.current.serialize() == expected[-1].serialize()
+
+
+def test_collapse_keeps_standalone_carets_and_current():
+    handler = MultiCaretHandler()
+    handler.set_carets([Caret(1, 2), make_caret((0, 5), (0, 3), (0, 8)), Caret(0, 4)])
+    current = handler.current
+    handler.collapse_overlapping()
+    assert handler.current is current
+    assert handler.current.rc == (0, 4)
+    assert len(handler) == 3
+
+    handler.add_caret(Caret(1, 2))
+    handler.collapse_overlapping()
+    assert len(handler) == 3
+    assert handler.current.rc == (1, 2)
+
+
+def test_current_caret_is_live():
+    handler = MultiCaretHandler()
+    handler.set_carets([Caret(0, 1), Caret(2, 3)])
+    handler.current.rc = (4, 5)
+    copies = handler.copy_carets()
+    assert [c.rc for c in copies] == [(0, 1), (4, 5)]
+    copies[0].rc = (9, 9)
+    assert handler.serialize()[0][0] == (0, 1)
+    handler.set_carets(copies)
+    assert handler.serialize()[0][0] == (9, 9)
+
+
+def test_calc_state():
+    handler = MultiCaretHandler()
+    handler.set_carets([Caret(0, 1), make_caret((2, 3), (2, 0), (2, 3))])
+    state = handler.calc_state()
+    # has_changed_state is True when the state is the same
+    assert handler.has_changed_state(state)
+    assert handler.copy().has_changed_state(state)
+    handler.current.rc = (2, 4)
+    assert not handler.has_changed_state(state)
+
+    state = handler.calc_state()
+    handler.collapse_selections_to_carets()
+    assert not handler.has_changed_state(state)
+    state = handler.calc_state()
+    handler.move_carets_vertically(make_table(), 1)
+    assert not handler.has_changed_state(state)
+
+    # the same carets in a different handler aren't the same state
+    other = MultiCaretHandler()
+    other.set_carets(handler.copy_carets())
+    assert other.serialize() == handler.serialize()
+    assert other.calc_state() != handler.calc_state()
+
+
+def test_first_visible_caret():
+    handler = MultiCaretHandler()
+    assert handler.get_first_visible_caret(0, 10) is None
+    handler.set_carets([Caret(30, 1), Caret(12, 4), Caret(15, 2), Caret(5, 3)])
+    assert handler.get_first_visible_caret(10, 10) == (12, 4)
+    assert handler.get_first_visible_caret(0, 10) == (5, 3)
+    assert handler.get_first_visible_caret(40, 10) is None
+
+
+def test_moves_match_scalar_table_methods():
+    t = make_table()
+    rcs = [(0, 0), (0, 15), (5, 7), (12, 0), (12, 7)]
+    handler = MultiCaretHandler()
+    handler.set_carets([Caret(*rc) for rc in rcs])
+    current = handler.current
+    handler.move_carets_vertically(t, 3)
+    expected = sorted(t.enforce_valid_row_col(r + 3, c) for r, c in rcs[:-1])
+    assert [s[0] for s in handler.serialize()] == expected + [t.enforce_valid_row_col(15, 7)]
+    assert handler.current is current
+
+    handler.set_carets([Caret(*rc) for rc in rcs])
+    handler.move_carets_horizontally(t, -1, wrap=True)
+    assert [s[0] for s in handler.serialize()] == [(0, 14), (0, 15), (5, 6), (11, 15), (12, 6)]
+
+
+def test_index_conversion():
+    t = make_table()
+    handler = MultiCaretHandler()
+    handler.set_carets([Caret(0, 3), make_caret((3, 4), (1, 2), (3, 4))])
+    indexes = handler.convert_to_indexes(t)
+    assert indexes == [(3, -1, -1), (52, 18, 52)]
+    other = MultiCaretHandler()
+    other.convert_from_indexes(t, indexes)
+    assert [s[:2] for s in other.serialize()] == [((0, 3), (-1, -1)), ((3, 4), (1, 2))]
+
+    other.set_selected_index_ranges(t, [(5, 10), (20, 20), (30, 40)])
+    assert other.get_selected_ranges(t) == [(5, 10), (30, 40)]
+    assert other.get_selected_ranges_including_carets(t) == [(5, 10), (30, 40)]
@@ -0,0 +1,144 @@
+import os
+import bz2
+import gzip
+import lzma
+import random
+
+import numpy as np
+import pytest
+
+from sawx.utils import compressedfs
+from sawx.utils.savefile import SaveSnapshot, CompressedSaveJob
+
+
+modules = {"gzip": gzip, "bz2": bz2, "xz": lzma}
+
+random.seed(48)
+data = bytes(random.getrandbits(8) for _ in range(50000)) * 20 + b"\0" * 2000000
+
+
+@pytest.fixture(params=["gzip", "bz2", "xz"])
+def compressed(request, tmp_path, monkeypatch):
+    monkeypatch.setattr(compressedfs.CompressedIndex, "block_size", 4096)
+    monkeypatch.setattr(compressedfs.CompressedIndex, "checkpoint_interval", 100000)
+    monkeypatch.setattr(compressedfs.CompressedFile, "max_output_size", 10000)
+    monkeypatch.setattr(compressedfs, "index_cache_dir", str(tmp_path))
+    compressedfs.indexes.clear()
+    name = request.param
+    path = str(tmp_path / ("data.gz" if name == "gzip" else f"data.{name}"))
+    # two streams, as created by concatenation or parallel compressors
+    with open(path, "wb") as fh:
+        fh.write(modules[name].compress(data[:300000]))
+        fh.write(modules[name].compress(data[300000:]))
+    return name, path
+
+
+def test_detect(compressed):
+    name, path = compressed
+    assert compressedfs.detect_file_compression(path) == name
+    assert compressedfs.compression_of_path(path) == name
+    assert compressedfs.detect_compression(b"plain") is None
+
+
+def test_random_access(compressed):
+    name, path = compressed
+    fh = compressedfs.open_compressed(path)
+    assert compressedfs.get_compression(fh) == name
+    assert fh.read(10) == data[:10]
+    fh.seek(-5, os.SEEK_END)
+    assert fh.tell() == len(data) - 5
+    assert fh.read() == data[-5:]
+    for pos in [900000, 299990, 12345, 2500000, 0]:
+        fh.seek(pos)
+        assert fh.read(20000) == data[pos:pos + 20000]
+    fh.seek(0)
+    assert fh.read() == data
+    fh.close()
+
+    index = compressedfs.get_compressed_index(path, name)
+    assert index.size == len(data)
+    assert [c.out_offset for c in index.checkpoints if c.decompressor is None] == [0, 300000]
+    if name == "gzip":
+        assert len(index.checkpoints) > 2
+
+
+def test_blocks_evicted_while_decompressing(compressed, monkeypatch):
+    # one step of decompressing the zeros produces many more blocks than the
+    # cache holds, so the block being read is evicted before it's returned
+    name, path = compressed
+    monkeypatch.setattr(compressedfs.CompressedFile, "max_output_size", 1024 * 1024)
+    monkeypatch.setattr(compressedfs.CompressedIndex, "max_cached_blocks", 64)
+    fh = compressedfs.open_compressed(path)
+    for pos in [1100000, 2900000, 1000000 + 4096 * 100]:
+        fh.seek(pos)
+        assert fh.read(10000) == data[pos:pos + 10000]
+    fh.close()
+
+
+def test_persisted_index(compressed):
+    name, path = compressed
+    fh = compressedfs.open_compressed(path)
+    fh.seek(0, os.SEEK_END)
+    fh.close()
+    compressedfs.indexes.clear()
+    index = compressedfs.get_compressed_index(path, name)
+    assert index.size == len(data)
+    assert [c.out_offset for c in index.checkpoints] == [0, 300000]
+
+    # a changed file doesn't use the old index
+    with open(path, "ab") as fh:
+        fh.write(modules[name].compress(b"more"))
+    index = compressedfs.get_compressed_index(path, name)
+    assert index.size is None
+    fh = compressedfs.open_compressed(path)
+    fh.seek(-4, os.SEEK_END)
+    assert fh.read() == b"more"
+
+
+def test_compressed_save_job(compressed):
+    name, path = compressed
+    job = CompressedSaveJob(SaveSnapshot(b"abc" * 1000, chunk_size=100), path, compression=name)
+    job._start(None)
+    assert job.success()
+    assert modules[name].decompress(open(path, "rb").read()) == b"abc" * 1000
+
+
+@pytest.mark.parametrize("header", [b"\x1f\x8b", b"BZh91AY&SY", b"\xfd7zXZ\x00\x00"])
+def test_magic_bytes_without_compressed_data(tmp_path, header):
+    path = str(tmp_path / "fake")
+    with open(path, "wb") as fh:
+        fh.write(header + b"not really compressed" * 100)
+    assert compressedfs.detect_compression(header) is not None
+    assert compressedfs.detect_file_compression(path) is None
+    with pytest.raises(ValueError):
+        compressedfs.open_compressed(path)
+
+    from sawx.filesystem import fsopen
+    with fsopen(path, "rb", decompress=True) as fh:
+        assert compressedfs.get_compression(fh) is None
+        assert fh.read(len(header)) == header
+
+
+def test_read_raw_data_decompresses_once(compressed, monkeypatch):
+    from sawx.document import SawxDocument
+
+    name, path = compressed
+    restores = []
+    restore = compressedfs.CompressedFile.restore
+    monkeypatch.setattr(compressedfs.CompressedFile, "restore", lambda self, c: restores.append(c) or restore(self, c))
+    doc = SawxDocument.__new__(SawxDocument)
+    doc.file_metadata = {"uri": path, "mime": "application/octet-stream", "compression": name}
+
+    doc.memory_map_threshold = 1000
+    raw = doc.load_raw_data()
+    assert isinstance(raw, np.memmap)
+    assert raw.tobytes() == data
+    assert len(restores) == 1
+
+    restores[:] = []
+    doc.memory_map_threshold = None
+    assert doc.load_raw_data() == data
+    assert len(restores) == 1
+
+    doc.memory_map_threshold = len(data) + 1
+    assert doc.load_raw_data() == data
@@ -0,0 +1,53 @@
+import time
+import threading
+
+from sawx.utils.configstore import ConfigStore
+
+
+def test_write_behind(tmp_path):
+    path = str(tmp_path / "config.sqlite")
+    store = ConfigStore(path, write_delay=60)
+    store.set("a.json", "[1, 2]")
+    store.set("b.json", b"bytes")
+    assert store.get("a.json") == "[1, 2]"
+    assert "b.json" in store
+
+    # nothing written until flushed
+    other = ConfigStore(path)
+    assert other.get("a.json") is None
+    other.close()
+
+    store.flush()
+    store.set("a.json", "[3]")
+    store.delete("b.json")
+    store.close()
+
+    store = ConfigStore(path)
+    assert store.get("a.json") == "[3]"
+    assert store.get("b.json", "missing") == "missing"
+    store.close()
+
+
+def test_batched(tmp_path):
+    path = str(tmp_path / "config.sqlite")
+    store = ConfigStore(path, write_delay=.05)
+    threads = [threading.Thread(target=store.set, args=(f"key{i}", str(i))) for i in range(50)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    time.sleep(.3)
+    check = ConfigStore(path)
+    assert len(check.names()) == 50
+    check.close()
+    store.close()
+
+
+def test_corrupt(tmp_path):
+    path = tmp_path / "config.sqlite"
+    path.write_bytes(b"not a database" * 100)
+    store = ConfigStore(str(path))
+    assert store.names() == []
+    store.set("a", "1")
+    store.close()
+    assert (tmp_path / "config.sqlite.bad").exists()
@@ -0,0 +1,73 @@
+import os
+import sys
+
+import pytest
+
+from sawx.utils import entrypoints
+
+
+@pytest.fixture
+def site(tmp_path, monkeypatch):
+    site = tmp_path / "site"
+    site.mkdir()
+    dist = site / "sawx_test_plugin-1.0.dist-info"
+    dist.mkdir()
+    (dist / "METADATA").write_text("Metadata-Version: 2.1\nName: sawx-test-plugin\nVersion: 1.0\n")
+    (dist / "entry_points.txt").write_text("[sawx.test]\nfirst = sawx_test_plugin\nsecond = sawx_test_plugin:value\n")
+    (site / "sawx_test_plugin.py").write_text("value = 42\n")
+    monkeypatch.setattr(sys, "path", [str(site)])
+    monkeypatch.setattr(entrypoints, "index_cache_path", str(tmp_path / "entry_points.json"))
+    monkeypatch.setattr(entrypoints, "entry_point_index", entrypoints.EntryPointIndex())
+    yield site
+    sys.modules.pop("sawx_test_plugin", None)
+
+
+def test_index(site):
+    eps = list(entrypoints.iter_entry_points("sawx.test"))
+    assert [(ep.name, ep.module_name) for ep in eps] == [("first", "sawx_test_plugin"), ("second", "sawx_test_plugin")]
+    assert eps[0].load().value == 42
+    assert eps[1].load() == 42
+    assert not entrypoints.entry_point_index.is_from_cache
+
+    # a new process uses the saved index
+    index = entrypoints.EntryPointIndex()
+    assert [ep.name for ep in index.get("sawx.test")] == ["first", "second"]
+    assert index.is_from_cache
+
+    # installing a package changes the fingerprint
+    (site / "other.py").write_text("")
+    index = entrypoints.EntryPointIndex()
+    index.get("sawx.test")
+    assert not index.is_from_cache
+
+
+def test_stale_cache(site):
+    entrypoints.entry_point_index.refresh()
+    # changed in place, as with development installs, so the fingerprint is
+    # the same
+    stat = os.stat(site)
+    entry_points = site / "sawx_test_plugin-1.0.dist-info" / "entry_points.txt"
+    entry_points_stat = os.stat(entry_points)
+    (site / "sawx_test_plugin.py").rename(site / "sawx_test_plugin2.py")
+    entry_points.write_text("[sawx.test]\nfirst = sawx_test_plugin2\n")
+    os.utime(site, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    os.utime(entry_points, ns=(entry_points_stat.st_atime_ns, entry_points_stat.st_mtime_ns))
+    entrypoints.entry_point_index = index = entrypoints.EntryPointIndex()
+    ep, = [ep for ep in index.get("sawx.test") if ep.name == "first"]
+    assert index.is_from_cache
+    assert entrypoints.load_entry_point(ep).value == 42
+    assert not index.is_from_cache
+    sys.modules.pop("sawx_test_plugin2", None)
+
+
+def test_reinstalled_package_changes_fingerprint(site):
+    entrypoints.entry_point_index.refresh()
+    # reinstalling rewrites the metadata without changing the site directory
+    stat = os.stat(site)
+    entry_points = site / "sawx_test_plugin-1.0.dist-info" / "entry_points.txt"
+    entry_points.write_text("[sawx.test]\nthird = sawx_test_plugin:value\n")
+    os.utime(entry_points, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+    os.utime(site, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    index = entrypoints.EntryPointIndex()
+    assert [ep.name for ep in index.get("sawx.test")] == ["third"]
+    assert not index.is_from_cache
@@ -0,0 +1,103 @@
+import os
+import sys
+import importlib.util
+
+import pytest
+
+from sawx import filesystem
+
+
+@pytest.fixture
+def templates(tmp_path, monkeypatch):
+    user = tmp_path / "user"
+    system = tmp_path / "system"
+    user.mkdir()
+    system.mkdir()
+    (system / "shared.txt").write_text("system")
+    monkeypatch.setattr(filesystem, "template_paths", [str(user), None, str(system)])
+    monkeypatch.setattr(filesystem.template_index, "paths", filesystem.template_paths)
+    monkeypatch.setattr(filesystem.template_index, "check_interval", 0)
+    monkeypatch.setattr(filesystem, "local_path_cache", {})
+    monkeypatch.setattr(filesystem, "local_path_cache_key", None)
+    return str(user), str(system)
+
+
+@pytest.fixture
+def counting_finder(monkeypatch):
+    calls = []
+    finder = filesystem.filesystems_to_local_file["template://"]
+
+    def find(name):
+        calls.append(name)
+        return finder(name)
+
+    monkeypatch.setitem(filesystem.filesystems_to_local_file, "template://", find)
+    return calls
+
+
+def test_filesystem_path_is_memoized(templates, counting_finder):
+    user, system = templates
+    expected = os.path.join(system, "shared.txt")
+    assert filesystem.filesystem_path("template://shared.txt") == expected
+    assert filesystem.filesystem_path("template://shared.txt") == expected
+    assert counting_finder == ["shared.txt"]
+    assert filesystem.filesystem_path("file:///tmp/x") == "/tmp/x"
+    assert filesystem.filesystem_path("/tmp/x") == "/tmp/x"
+
+    with pytest.raises(FileNotFoundError):
+        filesystem.filesystem_path("template://missing.txt")
+    with pytest.raises(FileNotFoundError):
+        filesystem.filesystem_path("template://missing.txt")
+    assert counting_finder == ["shared.txt", "missing.txt", "missing.txt"]
+
+
+def test_cache_cleared_when_index_rebuilt(templates, counting_finder):
+    user, system = templates
+    assert filesystem.filesystem_path("template://shared.txt") == os.path.join(system, "shared.txt")
+    generation = filesystem.template_index.generation
+
+    # a forced rescan clears the cache even if nothing changed on disk
+    filesystem.template_index.invalidate()
+    assert filesystem.filesystem_path("template://shared.txt") == os.path.join(system, "shared.txt")
+    assert filesystem.template_index.generation == generation + 1
+    assert counting_finder == ["shared.txt", "shared.txt"]
+
+    # a new user template shadows the cached system one once the directory
+    # change is noticed
+    path = os.path.join(user, "shared.txt")
+    with open(path, "w") as fh:
+        fh.write("user")
+    os.utime(user, (1, 1))
+    assert filesystem.filesystem_path("template://shared.txt") == path
+    assert filesystem.template_index.generation == generation + 2
+    assert counting_finder == ["shared.txt", "shared.txt", "shared.txt"]
+
+
+def test_http_support_imported_when_needed(monkeypatch):
+    monkeypatch.delitem(sys.modules, "sawx.utils.httpfs", raising=False)
+    monkeypatch.delattr(sys.modules["sawx.utils"], "httpfs", raising=False)
+    spec = importlib.util.spec_from_file_location("sawx._filesystem_lazy_import", filesystem.__file__)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    assert "sawx.utils.httpfs" not in sys.modules
+
+    with pytest.raises(ValueError):
+        module.fsopen("http://127.0.0.1/data.bin", "w")
+    assert "sawx.utils.httpfs" in sys.modules
+
+
+def test_persistence_doesnt_import_http_support(monkeypatch, tmp_path):
+    from sawx import persistence
+
+    monkeypatch.delitem(sys.modules, "sawx.utils.httpfs", raising=False)
+    monkeypatch.delattr(sys.modules["sawx.utils"], "httpfs", raising=False)
+    spec = importlib.util.spec_from_file_location("sawx._persistence_lazy_import", persistence.__file__)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    assert "sawx.utils.httpfs" not in sys.modules
+
+    # the cache directory is passed on when the http support is imported
+    monkeypatch.setattr(filesystem, "http_block_cache_dir", str(tmp_path))
+    httpfs = filesystem.get_httpfs()
+    assert httpfs.block_cache_dir == str(tmp_path)
+    httpfs.block_cache_dir = None
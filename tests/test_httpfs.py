@@ -0,0 +1,203 @@
+import os
+import re
+import zlib
+import threading
+import http.server
+
+import pytest
+
+from sawx.utils import httpfs
+
+
+data = bytes(range(256)) * 4000
+
+
+class RangeHandler(http.server.BaseHTTPRequestHandler):
+    supports_ranges = True
+
+    sends_etag = True
+
+    requests = []
+
+    head_requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self.head_requests.append(self.path)
+        self.respond(False)
+
+    def do_GET(self):
+        self.requests.append(self.headers.get("Range"))
+        self.respond(True)
+
+    def respond(self, send_body):
+        if self.path.split("?")[0] != "/data.bin":
+            self.send_error(404)
+            return
+        body = self.server.body
+        match = re.match(r"bytes=(\d+)-(\d+)", self.headers.get("Range", ""))
+        if match and self.supports_ranges:
+            start, end = int(match.group(1)), int(match.group(2)) + 1
+            if start >= len(body):
+                self.send_error(416)
+                return
+            end = min(end, len(body))
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end - 1}/{len(body)}")
+        else:
+            start, end = 0, len(body)
+            self.send_response(200)
+        self.send_header("Content-Length", str(end - start))
+        if self.sends_etag:
+            self.send_header("ETag", f'"{zlib.crc32(body)}"')
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body[start:end])
+
+
+class NoRangeHandler(RangeHandler):
+    supports_ranges = False
+
+
+class NoValidatorHandler(RangeHandler):
+    sends_etag = False
+
+
+@pytest.fixture
+def server(request, tmp_path, monkeypatch):
+    monkeypatch.setattr(httpfs.HttpResource, "block_size", 1000)
+    monkeypatch.setattr(httpfs, "block_cache_dir", str(tmp_path))
+    httpfs.resources.clear()
+    handler = getattr(request, "param", RangeHandler)
+    handler.requests = []
+    handler.head_requests = []
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    httpd.body = data
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd, f"http://127.0.0.1:{httpd.server_address[1]}/data.bin"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def requested_blocks():
+    blocks = set()
+    for r in RangeHandler.requests:
+        start, end = [int(v) for v in r[len("bytes="):].split("-")]
+        blocks.update(range(start // 1000, end // 1000 + 1))
+    return sorted(blocks)
+
+
+def test_range_requests(server):
+    httpd, url = server
+    fh = httpfs.open_http_uri(url)
+    assert fh.read(10) == data[:10]
+    fh.seek(500000)
+    assert fh.read(2500) == data[500000:502500]
+    fh.seek(-5, os.SEEK_END)
+    assert fh.read() == data[-5:]
+    # only the blocks that were read have been requested
+    assert requested_blocks() == [0, 500, 501, 502, 1023]
+    count = len(RangeHandler.requests)
+    fh.seek(500100)
+    assert fh.read(100) == data[500100:500200]
+    assert len(RangeHandler.requests) == count
+
+
+def test_consecutive_blocks(server):
+    httpd, url = server
+    resource = httpfs.get_http_resource(url)
+    assert resource.read_at(5500, 3000) == data[5500:8500]
+    assert RangeHandler.requests[-1] == "bytes=5000-8999"
+
+
+def test_disk_cache(server):
+    httpd, url = server
+    fh = httpfs.open_http_uri(url)
+    fh.seek(10000)
+    assert fh.read(10) == data[10000:10010]
+    httpfs.resources.clear()
+    RangeHandler.requests = []
+    fh = httpfs.open_http_uri(url)
+    fh.seek(10000)
+    assert fh.read(10) == data[10000:10010]
+    assert RangeHandler.requests == ["bytes=0-999"]
+
+    # blocks for a changed file are discarded
+    resource = httpfs.get_http_resource(url)
+    assert resource.is_current()
+    httpd.body = data[::-1]
+    assert not resource.is_current()
+    httpfs.resources.clear()
+    fh = httpfs.open_http_uri(url)
+    fh.seek(10000)
+    assert fh.read(10) == data[::-1][10000:10010]
+
+
+@pytest.mark.parametrize("server", [NoValidatorHandler], indirect=True)
+def test_no_disk_cache_without_validator(server):
+    httpd, url = server
+    fh = httpfs.open_http_uri(url)
+    fh.seek(10000)
+    assert fh.read(10) == data[10000:10010]
+    assert os.listdir(httpfs.block_cache_dir) == []
+
+    # a change that keeps the same size is seen the next time it's opened
+    httpd.body = data[::-1]
+    httpfs.resources.clear()
+    fh = httpfs.open_http_uri(url)
+    fh.seek(10000)
+    assert fh.read(10) == data[::-1][10000:10010]
+
+
+@pytest.mark.parametrize("server", [RangeHandler, NoRangeHandler], indirect=True)
+def test_evicted_resource_still_readable(server, monkeypatch):
+    httpd, url = server
+    monkeypatch.setattr(httpfs, "max_cached_resources", 1)
+    fh = httpfs.open_http_uri(url)
+    assert fh.read(10) == data[:10]
+    other = httpfs.open_http_uri(url + "?other")
+    assert url not in httpfs.resources
+    count = len(httpd.RequestHandlerClass.requests)
+    fh.seek(500)
+    assert fh.read(100) == data[500:600]
+    assert len(httpd.RequestHandlerClass.requests) == count
+    fh.seek(500000)
+    assert fh.read(100) == data[500000:500100]
+    assert other.read(10) == data[:10]
+
+
+@pytest.mark.parametrize("server", [NoRangeHandler], indirect=True)
+def test_no_range_support(server):
+    httpd, url = server
+    fh = httpfs.open_http_uri(url)
+    fh.seek(123456)
+    assert fh.read(10) == data[123456:123466]
+    assert fh.read(-1) == data[123466:]
+    assert len(NoRangeHandler.requests) == 1
+
+    # the downloaded copy is reused while the file is unchanged
+    fh = httpfs.open_http_uri(url)
+    assert fh.read() == data
+    assert len(NoRangeHandler.requests) == 1
+    assert len(NoRangeHandler.head_requests) == 1
+
+    httpd.body = data[::-1]
+    fh = httpfs.open_http_uri(url)
+    assert fh.read() == data[::-1]
+    assert len(NoRangeHandler.requests) == 2
+
+    # without a validator, it's kept for the rest of the session
+    resource = httpfs.get_http_resource(url)
+    resource.validator = None
+    httpd.body = data
+    assert httpfs.open_http_uri(url).read() == data[::-1]
+    assert len(NoRangeHandler.requests) == 2
+
+
+def test_not_found(server):
+    httpd, url = server
+    with pytest.raises(FileNotFoundError):
+        httpfs.open_http_uri(url + ".missing")
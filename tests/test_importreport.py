@@ -0,0 +1,25 @@
+import sys
+
+from sawx.utils.importreport import ImportTimer
+
+
+def test_import_timer(tmp_path, monkeypatch):
+    (tmp_path / "sawx_timed_outer.py").write_text("import sawx_timed_inner\n")
+    (tmp_path / "sawx_timed_inner.py").write_text("import time\ntime.sleep(0.05)\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    timer = ImportTimer()
+    timer.install()
+    try:
+        import sawx_timed_outer
+    finally:
+        timer.uninstall()
+        sys.modules.pop("sawx_timed_outer", None)
+        sys.modules.pop("sawx_timed_inner", None)
+    outer, outer_self = timer.times["sawx_timed_outer"]
+    inner, inner_self = timer.times["sawx_timed_inner"]
+    assert inner >= 0.05 and outer >= inner
+    assert outer_self < 0.05
+    timer.mark("done")
+    report = timer.get_report(1)
+    assert report.startswith("done: ")
+    assert report.splitlines()[-1].endswith("sawx_timed_outer")
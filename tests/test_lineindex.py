@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from sawx.utils.lineindex import LineIndex, LineIndexJob
+from sawx.utils.textutil import LineStats
+
+
+text = "first\r\nsecond\rthird\n\n  fifth \xe9\r\n\r\nlast"
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 5, 7, 1000])
+def test_chunks(chunk_size):
+    data = np.frombuffer(text.encode("utf-8"), dtype=np.uint8)
+    index = LineIndex(data)
+    index.chunk_size = chunk_size
+    LineIndexJob(index)._start(None)
+    assert index.is_complete
+    assert index.line_starts.tolist() == LineStats(data).line_starts.tolist()
+    assert index.num_lines == 7
+    assert index.get_lines_text(0, 10) == ["first", "second", "third", "", "  fifth \xe9", "", "last"]
+
+
+def test_partial():
+    data = np.frombuffer(b"one\ntwo\nthr", dtype=np.uint8)
+    index = LineIndex(data)
+    index.scan_next(6)
+    assert not index.is_complete
+    assert index.num_lines == 1
+    assert index.scan_next(100)
+    assert index.num_lines == 3
+    assert index.get_line_text(2) == "thr"
+    assert index.line_of_index(0) == 0
+    assert index.line_of_index(4) == 1
+    assert index.line_of_index(10) == 2
+    assert index.index_of_line(2) == 8
+
+
+def test_trailing_newline():
+    index = LineIndex(np.frombuffer(b"a\nb\n", dtype=np.uint8))
+    index.scan_all()
+    assert index.get_lines_text(0, 10) == ["a", "b", ""]
+    empty = LineIndex(np.zeros(0, dtype=np.uint8))
+    assert empty.is_complete
+    assert empty.num_lines == 1
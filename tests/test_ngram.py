@@ -0,0 +1,170 @@
+import time
+
+import numpy as np
+
+from sawx.utils.ngram import NgramIndex, NgramIndexJob, calc_fingerprint
+from sawx.utils.search import SearchEngine, ByteSearcher, TextSearcher
+
+
+def wait_for(engine, timeout=5.0):
+    end = time.time() + timeout
+    while not engine.is_finished and time.time() < end:
+        engine.poll()
+        time.sleep(.001)
+    engine.poll()
+    assert engine.is_finished
+
+
+def naive_find(data, pattern):
+    data = bytes(data)
+    found = []
+    i = data.find(pattern)
+    while i >= 0:
+        found.append(i)
+        i = data.find(pattern, i + 1)
+    return found
+
+
+class TestNgramIndex:
+    def setup_method(self):
+        rng = np.random.default_rng(1234)
+        self.data = rng.integers(0, 8, 20000, dtype=np.uint8)
+        self.index = NgramIndex.from_data(self.data, calc_fingerprint(self.data))
+
+    def test_find(self):
+        for pattern in [bytes([1, 2, 3]), bytes([0, 0, 0, 0]), bytes([7, 6, 5, 4, 3]), bytes([9, 9, 9])]:
+            assert self.index.find(self.data, pattern).tolist() == naive_find(self.data, pattern)
+
+    def test_short_pattern(self):
+        assert self.index.find(self.data, b"\x01\x02") is None
+
+    def test_save_load(self, tmp_path):
+        self.index.save(str(tmp_path))
+        index = NgramIndex.load(str(tmp_path), self.index.fingerprint)
+        assert index.size == len(self.data)
+        pattern = bytes([3, 1, 4, 1])
+        assert index.find(self.data, pattern).tolist() == naive_find(self.data, pattern)
+        assert NgramIndex.load(str(tmp_path), "0-1") is None
+
+    def test_invalidate(self):
+        pattern = bytes([9, 8, 9, 8])
+        self.data[100:104] = list(pattern)
+        self.data[5000:5002] = [9, 8]
+        self.data[4998:5000] = [9, 8]
+        self.index.invalidate(100, 104)
+        self.index.invalidate(4998, 5002)
+        assert self.index.find(self.data, pattern).tolist() == naive_find(self.data, pattern)
+
+        # removed matches are also dropped
+        self.data[100] = 0
+        self.index.invalidate(100, 101)
+        assert self.index.find(self.data, pattern).tolist() == naive_find(self.data, pattern)
+
+        self.index.invalidate(0, len(self.data))
+        assert not self.index.is_usable
+        assert self.index.find(self.data, pattern) is None
+
+
+class TestIndexedSearch:
+    def test_engine(self, tmp_path):
+        data = np.frombuffer(b"." * 5000 + b"needle" + b"." * 5000 + b"needle", dtype=np.uint8)
+        engine = SearchEngine()
+        engine.build_index(data, str(tmp_path))
+        end = time.time() + 5.0
+        while engine.index is None and time.time() < end:
+            time.sleep(.001)
+        assert engine.index is not None
+
+        # the index lookup is done in the search thread
+        engine.start(data, ByteSearcher(b"needle"))
+        assert engine.job.index is engine.index
+        wait_for(engine)
+        assert engine.matches.to_list() == [(5000, 5006), (10006, 10012)]
+
+        # case insensitive searches can't use the index
+        engine.start(data, TextSearcher("NEEDLE"))
+        assert engine.job.index is None
+        engine.cancel()
+
+        # second time loads from the cache
+        job = NgramIndexJob(data, str(tmp_path))
+        job._start(None)
+        assert isinstance(job.index.positions, np.memmap)
+
+    def test_changes_while_building(self):
+        data = np.frombuffer(b"." * 5000 + b"needle", dtype=np.uint8).copy()
+        engine = SearchEngine()
+        started = []
+        engine.run_job = lambda job, name: started.append(job)
+        engine.build_index(data)
+        job = started[0]
+
+        # the index is built from the data before the change
+        job.index = NgramIndex.from_data(data.copy())
+        data[200:206] = np.frombuffer(b"needle", dtype=np.uint8)
+        engine.data_changed(200, 206)
+        assert engine.index is None
+        engine.index_ready(job)
+        assert engine.index is job.index
+        assert engine.index.dirty.to_list() == [(200, 206)]
+
+        engine.start(data, ByteSearcher(b"needle"))
+        assert started[-1].index is engine.index
+        started[-1]._start(None)
+        engine.poll()
+        assert engine.matches.to_list() == [(200, 206), (5000, 5006)]
+
+        # a change of size while building discards the index
+        engine.build_index(data)
+        engine.data_changed()
+        assert engine.index_job is None
+        engine.index_ready(started[-1])
+        assert engine.index is None
+
+    def test_common_ngrams_scan_instead(self):
+        data = np.frombuffer(b"ab" * 3000 + b"abc" + b"ab" * 3000, dtype=np.uint8)
+        index = NgramIndex.from_data(data)
+        index.max_candidates = 100
+        assert index.find(data, b"bca").tolist() == [6001]
+        assert index.find(data, b"abab") is None
+
+        engine = SearchEngine()
+        engine.chunk_size = 1000
+        started = []
+        engine.run_job = lambda job, name: started.append(job)
+        engine.index = index
+        engine.start(data, ByteSearcher(b"babc"))
+        started[-1]._start(None)
+        engine.poll()
+        assert engine.is_finished
+        assert engine.matches.to_list() == [(5999, 6003)]
+        assert len(engine.searched) == 1
+
+        # too many candidates falls back to scanning the chunks
+        engine.start(data, ByteSearcher(b"abab"))
+        started[-1]._start(None)
+        engine.poll()
+        assert engine.num_matches == data.tobytes().count(b"abab")
+        assert engine.progress == 1.0
+
+    def test_rebuild_after_many_changes(self):
+        data = np.frombuffer(b"." * 5000 + b"needle", dtype=np.uint8).copy()
+        engine = SearchEngine()
+        started = []
+        engine.run_job = lambda job, name: started.append(job)
+        engine.build_index(data)
+        started[-1]._start(None)
+        assert engine.index is not None
+
+        engine.data_changed(0, 10)
+        assert engine.index is not None
+        assert len(started) == 1
+
+        data[0:1000] = ord("x")
+        engine.data_changed(0, 1000)
+        assert engine.index is None
+        assert len(started) == 2
+        started[-1]._start(None)
+        assert engine.index is not None
+        assert not engine.index.dirty
+        assert engine.index.find(data, b"xxxx").tolist() == naive_find(data, b"xxxx")
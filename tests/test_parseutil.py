@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from sawx.utils.parseutil import NumpyIntExpression, NumpyFloatExpression
+from sawx.utils.sortutil import RangeSet
+
+
+class TestCompiledExpression:
+    def setup_method(self):
+        self.a = np.arange(5000, dtype=np.int64)
+        self.b = self.a[::-1].copy()
+        self.arith = NumpyIntExpression({"a": self.a, "b": self.b})
+
+    def test_cached(self):
+        assert self.arith.compile("a > 3") is self.arith.compile("a > 3")
+        assert NumpyFloatExpression().compile("a > 3") is not self.arith.compile("a > 3")
+
+    def test_matches_tree_evaluation(self):
+        for text in ["a > 3 && a < 100", "((a & 7) > 3) || (b > 25)", "a * 2 + $10 - 0x3", "-a + b", "a % 7 == 2"]:
+            tree = self.arith.arith_expr.parseString(text, parseAll=True)[0]
+            expected = tree.eval({"a": self.a.copy(), "b": self.b.copy()})
+            assert (self.arith.eval(text) == expected).all()
+
+    def test_vars_unchanged(self):
+        self.arith.eval("a * 2 + 1")
+        assert (self.a == np.arange(5000)).all()
+
+    def test_scalars(self):
+        arith = NumpyIntExpression({"x": 4})
+        assert arith.eval("1 < x < 5") is True
+        assert arith.eval("1 < x < 3") is False
+        assert arith.eval("x * 3 // 2") == 6
+        with pytest.raises(ValueError):
+            arith.eval("y > 1")
+
+    @pytest.mark.parametrize("num_threads", [1, 4, None])
+    def test_chunked(self, num_threads):
+        text = "((a & 7) > 3) && (b > 25)"
+        expected = self.arith.eval(text)
+        result = self.arith.eval_chunked(text, chunk_size=512, num_threads=num_threads)
+        assert result.dtype == expected.dtype
+        assert (result == expected).all()
+
+    def test_float(self):
+        f = np.linspace(0, 1, 101, dtype=np.float32)
+        arith = NumpyFloatExpression({"f": f})
+        assert (arith.eval("f > .3 and f < 0.5") == ((f > .3) & (f < .5))).all()
+        assert (arith.eval_chunked("f * 2 > 1", chunk_size=10) == (f * 2 > 1)).all()
+
+    def test_match_ranges(self):
+        text = "(a & 7) > 3"
+        chunks = list(self.arith.compile(text).iter_match_ranges({"a": self.a}, 1000, 2))
+        assert len(chunks) == 5
+        starts = np.concatenate([r.starts for r in chunks])
+        ends = np.concatenate([r.ends for r in chunks])
+        expected = np.nonzero(self.arith.eval(text))[0]
+        assert (RangeSet.from_arrays(starts, ends).to_indexes() == expected).all()
@@ -0,0 +1,55 @@
+import os
+
+import pytest
+
+from sawx.utils.pathindex import PathIndex
+
+
+@pytest.fixture
+def dirs(tmp_path):
+    user = tmp_path / "user"
+    system = tmp_path / "system"
+    for d in [user, system / "application"]:
+        d.mkdir(parents=True)
+    (user / "shared.txt").write_text("user")
+    (system / "shared.txt").write_text("system")
+    (system / "only.txt").write_text("system")
+    (system / "application" / "octet-stream").write_text("{}")
+    return str(user), str(system)
+
+
+def test_find_first(dirs):
+    user, system = dirs
+    paths = [user, None, system]
+    index = PathIndex(paths, check_interval=0)
+    assert index.find_first("shared.txt") == os.path.join(user, "shared.txt")
+    assert index.find_first("shared.txt", [None, system]) == os.path.join(system, "shared.txt")
+    assert index.find_first("application/octet-stream") == os.path.join(system, "application", "octet-stream")
+    assert index.find_first("/abs/path") == "/abs/path"
+    with pytest.raises(OSError):
+        index.find_first("missing.txt")
+    assert list(index.iter_toplevel_files()) == [(user, "shared.txt"), (system, "only.txt"), (system, "shared.txt")]
+
+
+def test_rescan(dirs):
+    user, system = dirs
+    paths = [user]
+    index = PathIndex(paths, check_interval=0)
+    assert not index.contains(user, "new.txt")
+    generation = index.generation
+    assert not index.refresh()
+
+    with open(os.path.join(user, "new.txt"), "w") as fh:
+        fh.write("new")
+    os.utime(user, ns=(0, 0))
+    assert index.find_first("new.txt") == os.path.join(user, "new.txt")
+    assert index.generation == generation + 1
+
+    # changing the list of paths is noticed without waiting for the interval
+    index.check_interval = 1000
+    paths.append(system)
+    assert index.find_first("only.txt") == os.path.join(system, "only.txt")
+    os.remove(os.path.join(system, "only.txt"))
+    assert index.contains(system, "only.txt")
+    index.invalidate()
+    assert not index.contains(system, "only.txt")
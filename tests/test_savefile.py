@@ -0,0 +1,250 @@
+import os
+
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from sawx.utils.sessionfile import SessionFile, unserialize
+from sawx.utils.command import Command, StatusFlags, UndoStack
+from sawx.utils.sortutil import RangeSet
+from sawx.utils.savefile import SaveSnapshot, TextSaveSnapshot, SaveJob, write_atomic, PatchSnapshot, PatchSaveJob, write_journal, recover_journal, write_patches
+
+
+def test_snapshot_preserves_original():
+    data = np.arange(100, dtype=np.uint8)
+    original = data.tobytes()
+    snapshot = SaveSnapshot(data, chunk_size=16)
+    chunks = snapshot.iter_chunks()
+    output = [next(chunks)]
+    # changes after a chunk has been written don't need preserving
+    snapshot.preserve(0, 3)
+    data[0:3] = 255
+    snapshot.preserve(40, 70)
+    data[40:70] = 255
+    output.extend(chunks)
+    assert b"".join(output) == original
+    assert not snapshot.preserved
+    assert snapshot.progress == 1.0
+
+
+class ChangeCommand(Command):
+    """Sets the bytes in a range to a value, reporting the range in its flags
+    but only knowing it in advance if known_range is set
+    """
+    def __init__(self, start, end, value, known_range=False):
+        Command.__init__(self)
+        self.start = start
+        self.end = end
+        self.value = value
+        self.known_range = known_range
+
+    def calc_change_range(self, editor):
+        if self.known_range:
+            return (self.start, self.end)
+        return Command.calc_change_range(self, editor)
+
+    def do_change(self, editor, undo_info):
+        data = editor.document.raw_data
+        old_data = data[self.start:self.end].copy()
+        data[self.start:self.end] = self.value
+        undo_info.flags.byte_values_changed = True
+        undo_info.flags.index_range = (self.start, self.end)
+        return old_data
+
+    def undo_change(self, editor, old_data):
+        editor.document.raw_data[self.start:self.end] = old_data
+
+
+def make_document(data):
+    from sawx.document import SawxDocument
+
+    doc = SawxDocument.__new__(SawxDocument)
+    doc.raw_data = data
+    doc.undo_stack = UndoStack()
+    doc.modified_ranges = RangeSet()
+    doc.save_snapshots = []
+    return doc, SimpleNamespace(document=doc, calc_status_flags=StatusFlags)
+
+
+def test_commands_preserve_snapshot_data():
+    doc, editor = make_document(np.arange(100, dtype=np.uint8))
+    original = doc.raw_data.tobytes()
+    snapshot = SaveSnapshot(doc.raw_data, chunk_size=16)
+    doc.save_snapshots = [snapshot]
+    chunks = snapshot.iter_chunks()
+    output = [next(chunks)]
+
+    # only the chunks a command says it will change are preserved
+    cmd = ChangeCommand(40, 50, 255, known_range=True)
+    doc.prepare_for_command(cmd, editor)
+    doc.undo_stack.perform(cmd, editor)
+    assert sorted(snapshot.preserved) == [2, 3]
+
+    # undo changes the range reported when the command was performed
+    cmd.known_range = False
+    doc.prepare_for_command(doc.undo_stack.get_undo_command(), editor)
+    doc.undo_stack.undo(editor)
+    assert sorted(snapshot.preserved) == [2, 3]
+    doc.prepare_for_command(doc.undo_stack.get_redo_command(), editor)
+    doc.undo_stack.redo(editor)
+    output.extend(chunks)
+    assert b"".join(output) == original
+    assert not snapshot.preserved
+
+
+def test_unknown_change_waits_for_save(tmp_path):
+    doc, editor = make_document(np.arange(100, dtype=np.uint8))
+    original = doc.raw_data.tobytes()
+    path = str(tmp_path / "out.dat")
+    snapshot = SaveSnapshot(doc.raw_data, chunk_size=16)
+    doc.save_snapshots = [snapshot]
+    release = threading.Event()
+    job = SaveJob(snapshot, path, callback=lambda job: release.wait(5))
+    thread = threading.Thread(target=job._start, args=(None,))
+    thread.start()
+
+    # a command that can't say what it will change waits for the save
+    cmd = ChangeCommand(0, 100, 255)
+    assert not snapshot.wait_until_written(0.01)
+    release.set()
+    doc.prepare_for_command(cmd, editor)
+    assert snapshot.next_chunk == snapshot.num_chunks
+    assert not snapshot.preserved
+    doc.undo_stack.perform(cmd, editor)
+    thread.join()
+    assert job.success()
+    assert open(path, "rb").read() == original
+
+
+def test_save_writes_only_changed_bytes(tmp_path, monkeypatch):
+    from sawx.utils import savefile
+
+    path = str(tmp_path / "data.bin")
+    np.arange(1000, dtype=np.uint16).astype(np.uint8).tofile(path)
+    doc, editor = make_document(np.fromfile(path, dtype=np.uint8))
+    doc.file_metadata = {'uri': path}
+    doc.save_job = None
+    doc.record_saved_file_info(doc.raw_data, path)
+    written = []
+    original_write_patches = savefile.write_patches
+
+    def write_patches(path, ranges, chunks):
+        written.extend(ranges)
+        return original_write_patches(path, ranges, chunks)
+
+    monkeypatch.setattr(savefile, "write_patches", write_patches)
+    monkeypatch.setattr(savefile, "write_atomic", None)
+
+    # the same sequence of calls the editor makes
+    for cmd in [ChangeCommand(10, 12, 1), ChangeCommand(500, 510, 2)]:
+        doc.prepare_for_command(cmd, editor)
+        undo = doc.undo_stack.perform(cmd, editor)
+        doc.command_finished(undo.flags)
+    doc.prepare_for_command(doc.undo_stack.get_undo_command(), editor)
+    undo = doc.undo_stack.undo(editor)
+    doc.command_finished(undo.flags)
+    expected = doc.raw_data.tobytes()
+
+    doc.save()
+    assert written == [(10, 12), (500, 510)]
+    assert open(path, "rb").read() == expected
+    assert not doc.modified_ranges
+    assert not doc.is_dirty
+
+
+@pytest.mark.parametrize("encoding,bom", [("utf-8", None), ("utf-8", b"\xef\xbb\xbf"), ("utf-16-le", b"\xff\xfe")])
+def test_text_snapshot(encoding, bom):
+    text = "caf\xe9 ☃\n" * 10
+    snapshot = TextSaveSnapshot(text, encoding, bom, chunk_size=7)
+    assert b"".join(snapshot.iter_chunks()) == (bom or b"") + text.encode(encoding)
+
+
+def test_write_atomic(tmp_path):
+    path = tmp_path / "out.dat"
+    path.write_bytes(b"old")
+    write_atomic(str(path), [b"new ", "data"])
+    assert path.read_bytes() == b"new data"
+
+    def failing():
+        yield b"partial"
+        raise OSError("disk full")
+
+    with pytest.raises(OSError):
+        write_atomic(str(path), failing())
+    assert path.read_bytes() == b"new data"
+    assert os.listdir(tmp_path) == ["out.dat"]
+
+
+def test_save_job(tmp_path):
+    path = str(tmp_path / "out.dat")
+    progress = []
+    snapshot = SaveSnapshot(b"x" * 100, chunk_size=30)
+    job = SaveJob(snapshot, path, SessionFile(path + ".session", {"a": 1}), lambda job: progress.append(job.progress))
+    job._start(None)
+    assert job.success() and job.is_finished
+    assert progress == [0.25, 0.5, 0.75, 1.0, 1.0]
+    assert open(path, "rb").read() == b"x" * 100
+    assert unserialize(path + ".session", open(path + ".session").read()) == {"a": 1}
+
+    job = SaveJob(SaveSnapshot(b"y" * 100, chunk_size=30), path)
+    job.cancel()
+    job._start(None)
+    assert not job.success()
+    assert open(path, "rb").read() == b"x" * 100
+
+
+def test_patch_snapshot():
+    data = np.zeros(100, dtype=np.uint8)
+    snapshot = PatchSnapshot(data, [(5, 8), (20, 50)], chunk_size=16)
+    assert snapshot.ranges == [(5, 8), (20, 36), (36, 50)]
+    data[5:8] = 1
+    snapshot.preserve(30, 40)
+    data[20:50] = 2
+    patches = list(snapshot.iter_chunks())
+    assert patches == [(5, b"\x01" * 3), (20, b"\x00" * 16), (36, b"\x00" * 14)]
+
+
+def test_write_patches(tmp_path):
+    path = str(tmp_path / "out.dat")
+    with open(path, "wb") as fh:
+        fh.write(bytes(range(100)))
+    data = np.arange(100, dtype=np.uint8)
+    data[10:12] = 255
+    data[90] = 0
+    job = PatchSaveJob(PatchSnapshot(data, [(10, 12), (90, 91)]), path)
+    job._start(None)
+    assert job.success()
+    assert open(path, "rb").read() == data.tobytes()
+    assert os.listdir(tmp_path) == ["out.dat"]
+
+    def failing():
+        yield 0, b"xx"
+        raise OSError("disk full")
+
+    with pytest.raises(OSError):
+        write_patches(path, [(0, 2), (50, 52)], failing())
+    assert open(path, "rb").read() == data.tobytes()
+    assert os.listdir(tmp_path) == ["out.dat"]
+
+
+def test_recover_journal(tmp_path):
+    path = str(tmp_path / "out.dat")
+    original = bytes(range(100))
+    with open(path, "wb") as fh:
+        fh.write(original)
+    assert not recover_journal(path)
+    with open(path, "r+b") as fh:
+        write_journal(fh, [(0, 10), (40, 45)], path + ".journal")
+        fh.seek(40)
+        fh.write(b"\xff" * 5)
+    assert recover_journal(path)
+    assert open(path, "rb").read() == original
+
+    # incomplete journal means the file was never changed
+    with open(path + ".journal", "wb") as fh:
+        fh.write(b"SAWXJRNL\x00\x00")
+    assert recover_journal(path)
+    assert open(path, "rb").read() == original
+    assert os.listdir(tmp_path) == ["out.dat"]
@@ -0,0 +1,125 @@
+import time
+import threading
+
+import numpy as np
+
+from sawx.utils.search import SearchEngine, ByteSearcher, TextSearcher, RegexSearcher
+from sawx.utils.jobs import JobManager, ThreadJob
+
+
+def wait_for(engine, timeout=5.0):
+    end = time.time() + timeout
+    while not engine.is_finished and time.time() < end:
+        engine.poll()
+        time.sleep(.001)
+    engine.poll()
+    assert engine.is_finished
+
+
+class TestSearchEngine:
+    def setup_method(self):
+        data = bytearray(b"." * 100000)
+        self.positions = [5, 999, 4095, 50000, 99990]
+        for p in self.positions:
+            data[p:p + 6] = b"needle"
+        self.data = np.frombuffer(bytes(data), dtype=np.uint8)
+
+    def test_bytes_across_chunks(self):
+        engine = SearchEngine()
+        engine.chunk_size = 1000
+        engine.start(self.data, ByteSearcher(b"needle"), 50001)
+        wait_for(engine)
+        assert engine.matches.to_list() == [(p, p + 6) for p in self.positions]
+        assert engine.progress == 1.0
+        assert engine.find_next(999) == (4095, 4101)
+        assert engine.find_next(99990) == (5, 11)
+        assert engine.find_prev(5) == (99990, 99996)
+
+    def test_text_and_regex(self):
+        assert TextSearcher("NEEDLE").find(self.data, 0, 999)[0].tolist() == [5]
+        starts, ends = RegexSearcher(rb"ne+dle").find(self.data, 900, 5000)
+        assert starts.tolist() == [999, 4095]
+        assert ends.tolist() == [1005, 4101]
+
+    def test_restart(self):
+        engine = SearchEngine()
+        engine.chunk_size = 100
+        engine.start(self.data, ByteSearcher(b"needle"))
+        engine.start(self.data, ByteSearcher(b"nothing"))
+        wait_for(engine)
+        assert not engine.matches
+
+
+def test_back_to_back_matches():
+    engine = SearchEngine()
+    engine.chunk_size = 3
+    engine.start(np.frombuffer(b"xabababab", dtype=np.uint8), ByteSearcher(b"ab"))
+    wait_for(engine)
+    assert engine.num_matches == 4
+    assert engine.matches.to_list() == [(1, 9)]
+    assert engine.find_next(0) == (1, 3)
+    assert engine.find_next(1) == (3, 5)
+    assert engine.find_next(5) == (7, 9)
+    assert engine.find_next(7) == (1, 3)
+    assert engine.find_prev(7) == (5, 7)
+    assert engine.find_prev(1) == (7, 9)
+
+
+def test_collect_pending_merges_chunks():
+    engine = SearchEngine()
+    rng = np.random.default_rng(35)
+    chunks = [np.sort(rng.choice(np.arange(c * 1000, (c + 1) * 1000), 20, replace=False)) for c in range(10)]
+    order = [6, 7, 8, 9, 0, 1, 2, 3, 4, 5]
+    for k in range(0, 10, 3):
+        for c in order[k:k + 3]:
+            engine.pending.append((chunks[c], chunks[c] + 2))
+        assert engine.num_matches == 20 * min(k + 3, 10)
+    expected = np.concatenate(chunks)
+    assert engine.match_starts.tolist() == expected.tolist()
+    assert engine.match_ends.tolist() == (expected + 2).tolist()
+
+
+def test_search_str_data():
+    text = "caf\u00e9 and CAF\u00c9 and cafe"
+    engine = SearchEngine()
+    engine.chunk_size = 7
+    engine.start(text, TextSearcher("caf\u00e9"))
+    wait_for(engine)
+    assert engine.matches.to_list() == [(0, 4), (9, 13)]
+    starts, ends = RegexSearcher(r"c\w+").find(text, 0, len(text))
+    assert [text[s:e] for s, e in zip(starts.tolist(), ends.tolist())] == ["caf\u00e9", "cafe"]
+
+
+class WaitingJob(ThreadJob):
+    def __init__(self, wait_for, signal):
+        ThreadJob.__init__(self)
+        self.wait_for = wait_for
+        self.signal = signal
+        self.finished = False
+        self.daemon = False
+
+    def _start(self, dispatcher):
+        self.daemon = threading.current_thread().daemon
+        self.signal.set()
+        self.finished = self.wait_for.wait(5)
+
+
+def test_thread_jobs_run_concurrently():
+    manager = JobManager(None)
+    try:
+        first_started = threading.Event()
+        second_started = threading.Event()
+        first = WaitingJob(second_started, first_started)
+        second = WaitingJob(first_started, second_started)
+        assert manager.add_job(first)
+        assert manager.add_job(second)
+        end = time.time() + 5
+        done = set()
+        while len(done) < 2 and time.time() < end:
+            done |= manager.get_finished()
+            time.sleep(.001)
+        assert done == {first, second}
+        assert first.finished and second.finished
+        assert first.daemon and second.daemon
+    finally:
+        manager.shutdown()
@@ -0,0 +1,78 @@
+import os
+
+import numpy as np
+
+from sawx.utils import sessionfile
+from sawx.utils.sessionfile import SessionFile, unserialize, get_sidecar_dir
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "data.bin.session")
+    style = np.arange(10000, dtype=np.uint8)
+    labels = np.arange(5000, dtype=np.int32).reshape(50, 100)
+    session = {
+        "document uuid": "1234",
+        "small": np.arange(4, dtype=np.uint16),
+        "editor": {"style": style, "segments": [("first", 0, 100, labels)]},
+    }
+    session_file = SessionFile(path, session)
+    # arrays are copied when the session is captured
+    style[:] = 0
+    session_file.write()
+    assert len(open(path).read()) < 1000
+    assert len(os.listdir(get_sidecar_dir(path))) == 2
+
+    restored = unserialize(path, open(path).read())
+    assert restored["document uuid"] == "1234"
+    assert restored["small"].tolist() == [0, 1, 2, 3]
+    assert np.array_equal(restored["editor"]["style"], np.arange(10000, dtype=np.uint8))
+    name, start, end, array = restored["editor"]["segments"][0]
+    assert (name, start, end) == ("first", 0, 100)
+    assert np.array_equal(array, labels)
+    # mapped copy-on-write, so changes don't affect the saved session
+    assert isinstance(array, np.memmap)
+    array[0, 0] = 99
+    assert unserialize(path, open(path).read())["editor"]["segments"][0][3][0, 0] == 0
+
+
+def test_unused_arrays_removed(tmp_path):
+    path = str(tmp_path / "data.bin.session")
+    SessionFile(path, {"a": np.zeros(10000)}).write()
+    first = os.listdir(get_sidecar_dir(path))
+    SessionFile(path, {"a": np.ones(10000), "b": np.ones(10000)}).write()
+    names = os.listdir(get_sidecar_dir(path))
+    assert len(names) == 2 and not set(first) & set(names)
+    restored = unserialize(path, open(path).read())
+    assert restored["a"].sum() == 10000
+
+    # files still mapped by the restored arrays are kept until a later save
+    SessionFile(path, {"a": 1}).write()
+    assert sorted(os.listdir(get_sidecar_dir(path))) == sorted(names)
+    assert restored["a"].sum() == 10000
+    restored["b"][0] = 5
+    b = restored["b"][10:]
+    del restored
+    SessionFile(path, {"a": 2}).write()
+    assert len(os.listdir(get_sidecar_dir(path))) == 1
+    assert b.sum() == 9990
+    del b
+    SessionFile(path, {"a": 3}).write()
+    assert not os.path.exists(get_sidecar_dir(path))
+
+
+def test_unused_arrays_removed_on_exit(tmp_path):
+    path = str(tmp_path / "data.bin.session")
+    SessionFile(path, {"a": np.zeros(10000)}).write()
+    restored = unserialize(path, open(path).read())
+    SessionFile(path, {"a": 1}).write()
+    assert os.path.exists(get_sidecar_dir(path))
+    sessionfile.remove_unused_sidecar_files()
+    assert not os.path.exists(get_sidecar_dir(path))
+    assert not sessionfile.unused_sidecar_files
+
+
+def test_plain_json(tmp_path):
+    path = str(tmp_path / "old.session")
+    with open(path, "w") as fh:
+        fh.write('{"document uuid": "abc", "view": {"zoom": 2}}')
+    assert unserialize(path, open(path).read()) == {"document uuid": "abc", "view": {"zoom": 2}}
@@ -0,0 +1,117 @@
+import numpy as np
+
+from sawx.utils import sortutil
+from sawx.utils.sortutil import RangeSet
+
+
+class TestRangeSet:
+    def test_normalize(self):
+        r = RangeSet([(10, 20), (15, 25), (30, 30), (40, 35), (25, 28), (0, 2)])
+        assert r.to_list() == [(0, 2), (10, 28), (35, 40)]
+        assert len(r) == 3
+        assert r.num_indexes == 2 + 18 + 5
+
+    def test_matches_list_functions(self):
+        ranges = [(10, 20), (15, 25), (40, 35), (25, 28), (0, 2), (100, 101)]
+        assert RangeSet(ranges).to_list() == sortutil.collapse_overlapping_ranges(ranges)
+
+    def test_indexes(self):
+        r = RangeSet([(3, 6), (10, 12), (12, 13), (20, 21)])
+        indexes = r.to_indexes()
+        assert indexes.tolist() == [3, 4, 5, 10, 11, 12, 20]
+        assert RangeSet.from_indexes(indexes) == r
+        assert RangeSet.from_indexes(indexes[::-1]) == r
+        assert sortutil.indexes_to_ranges(indexes) == r.to_list()
+        assert sortutil.ranges_to_indexes([]).tolist() == []
+
+    def test_mask(self):
+        mask = np.zeros(20, dtype=np.bool_)
+        mask[0:3] = True
+        mask[7] = True
+        mask[18:] = True
+        assert RangeSet.from_mask(mask).to_list() == [(0, 3), (7, 8), (18, 20)]
+        assert RangeSet.from_mask(mask, 100).to_list() == [(100, 103), (107, 108), (118, 120)]
+
+    def test_membership(self):
+        r = RangeSet([(3, 6), (10, 12)])
+        assert 3 in r
+        assert 5 in r
+        assert 6 not in r
+        assert 2 not in r
+        assert 12 not in r
+        assert r.contains(np.arange(14)).tolist() == [i in (3, 4, 5, 10, 11) for i in range(14)]
+
+    def test_set_operations(self):
+        a = RangeSet([(0, 10), (20, 30)])
+        b = RangeSet([(5, 25), (40, 50)])
+        assert (a | b).to_list() == [(0, 30), (40, 50)]
+        assert (a & b).to_list() == [(5, 10), (20, 25)]
+        assert (a - b).to_list() == [(0, 5), (25, 30)]
+        assert (b - a).to_list() == [(10, 20), (40, 50)]
+        assert (a & RangeSet()).to_list() == []
+        assert (a - RangeSet()) == a
+
+    def test_invert(self):
+        r = RangeSet([(3, 6), (10, 12)])
+        assert r.invert(20).to_list() == [(0, 3), (6, 10), (12, 20)]
+        assert r.invert(11).to_list() == [(0, 3), (6, 10)]
+        assert RangeSet([(0, 20)]).invert(20).to_list() == []
+        assert sortutil.invert_ranges([(12, 10), (3, 6)], 20) == [(0, 3), (6, 10), (12, 20)]
+
+    def test_clip(self):
+        r = RangeSet([(0, 10), (20, 30), (40, 50)])
+        assert r.clip(5, 45).to_list() == [(5, 10), (20, 30), (40, 45)]
+        assert r.clip(10, 20).to_list() == []
+
+    def test_random_against_indexes(self):
+        rng = np.random.RandomState(1234)
+        for i in range(20):
+            a = rng.randint(0, 500, size=(10, 2))
+            b = rng.randint(0, 500, size=(10, 2))
+            ra, rb = RangeSet(a), RangeSet(b)
+            ia, ib = set(ra.to_indexes().tolist()), set(rb.to_indexes().tolist())
+            assert set((ra | rb).to_indexes().tolist()) == ia | ib
+            assert set((ra & rb).to_indexes().tolist()) == ia & ib
+            assert set((ra - rb).to_indexes().tolist()) == ia - ib
+
+
+def rect_area(rects, numr, numc):
+    grid = np.zeros((numr, numc), dtype=np.int32)
+    for (r1, c1), (r2, c2) in rects:
+        grid[r1:r2, c1:c2] += 1
+    return grid
+
+
+class TestRects:
+    def test_rect_ranges_to_indexes(self):
+        # rectangle from row 1, col 2 to row 3, col 4 in a 10-wide grid
+        indexes = sortutil.rect_ranges_to_indexes(10, 0, [(12, 35)])
+        assert indexes.tolist() == [12, 13, 14, 22, 23, 24, 32, 33, 34]
+
+        # corners given as upper right/lower left, and overlapping rects
+        indexes = sortutil.rect_ranges_to_indexes(10, 0, [(35, 12), (14, 26), (None, None)])
+        assert indexes.tolist() == [12, 13, 14, 15, 22, 23, 24, 25, 32, 33, 34]
+        assert len(sortutil.rect_ranges_to_indexes(10, 0, [])) == 0
+
+    def test_rects_to_range_set(self):
+        r = sortutil.rects_to_range_set([[(1, 2), (3, 5)], [(0, 0), (1, 10)]], 10)
+        assert r.to_list() == [(0, 10), (12, 15), (22, 25)]
+
+    def test_union(self):
+        rects = [[(0, 0), (4, 4)], [(2, 2), (6, 6)], [(8, 0), (9, 1)]]
+        merged = sortutil.union_rects(rects)
+        assert (rect_area(merged, 10, 10) > 0).tolist() == (rect_area(rects, 10, 10) > 0).tolist()
+        assert rect_area(merged, 10, 10).max() == 1
+
+    def test_invert(self):
+        rects = [[(1, 1), (3, 4)], [(2, 2), (6, 5)]]
+        outside = sortutil.invert_rects(rects, 8, 7)
+        expected = rect_area(rects, 8, 7) == 0
+        area = rect_area(outside, 8, 7)
+        assert area.max() == 1
+        assert (area == 1).tolist() == expected.tolist()
+        assert sortutil.invert_rects([], 3, 4) == [[(0, 0), (3, 4)]]
+
+    def test_invert_merges_neighbors(self):
+        outside = sortutil.invert_rects([[(0, 0), (1, 10)]], 10, 10)
+        assert outside == [[(1, 0), (10, 10)]]
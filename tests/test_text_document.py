@@ -0,0 +1,25 @@
+import pytest
+
+from sawx.documents.text import TextDocument
+
+
+def round_trip(raw):
+    doc = TextDocument.__new__(TextDocument)
+    doc.file_metadata = {"uri": "test.txt", "mime": "text/plain"}
+    text = doc.raw_data = doc.calc_raw_data(raw)
+    saved = b"".join(doc.create_save_snapshot().iter_chunks())
+    return doc, text, saved
+
+
+@pytest.mark.parametrize("raw,encoding", [
+    (b"a" * 70000 + b"caf\xe9\n", "latin-1"),
+    (b"a" * 70000 + "café\n".encode("utf-8"), "utf-8"),
+    (b"\xef\xbb\xbfcaf\xc3\xa9", "utf-8"),
+    (b"\xef\xbb\xbfcaf\xe9", "latin-1"),
+], ids=["latin-1 after utf-8 header", "utf-8", "utf-8 bom", "invalid after bom"])
+def test_round_trip(raw, encoding):
+    doc, text, saved = round_trip(raw)
+    assert doc.encoding == encoding
+    assert text.endswith("café\n") or text.endswith("café")
+    assert "�" not in text
+    assert saved == raw
@@ -0,0 +1,159 @@
+import io
+
+import numpy as np
+import pytest
+
+from sawx.utils.textutil import iter_line_chunks, parse_matching_lines, parse_for_matching_lines, check_for_matching_lines, LineStats, guessSpacesPerIndent, decode_text, detectBOM, detectEncoding, guessEncoding
+
+
+re_latlon = r'^\s*([-+]?(?:[1-8]?\d(?:\.\d+)?|90(?:\.0+)?))\s*[/,|\s]+\s*([-+]?(?:180(?:\.0+)?|(?:(?:1[0-7]\d)|(?:[1-9]?\d))(?:\.\d+)?))'
+
+text = """
+-62.242001\t, 12.775000, 1.000
+-28.990000  , 12.775000, 1.000
+8.990000, 30.645000, 1.000
+0.500999   36.661999, 1.000
+-137.164001 | 25.445999, 60.000
+33.2
+23.44903 -ZZZZ
+-34.911236, 29.293791, 1.000
+
+"""
+
+
+def test_line_chunks():
+    data = b"one\ntwo\r\nthree\rfour\nfive"
+    for chunk_size in [1, 3, 4, 7, 100]:
+        chunks = list(iter_line_chunks(data, chunk_size))
+        assert b"".join(chunks) == data
+        assert all(c[-1:] in (b"\n", b"\r") for c in chunks[:-1])
+        assert list(iter_line_chunks(io.BytesIO(data), chunk_size)) == chunks
+
+
+@pytest.mark.parametrize("chunk_size,num_processes", [(None, None), (20, 1), (20, 2)])
+def test_parse_matching_lines(chunk_size, num_processes):
+    expected, num_unmatched = parse_for_matching_lines(text, re_latlon, [1, 2])
+    matched, unmatched, (lat, lon) = parse_matching_lines(text, re_latlon, [1, 2], chunk_size=chunk_size, num_processes=num_processes)
+    assert matched == len(expected)
+    assert unmatched == num_unmatched
+    assert lat.dtype == np.float64
+    assert lat.tolist() == [float(row[0]) for row in expected]
+    assert lon.tolist() == [float(row[1]) for row in expected]
+
+
+def test_parse_types(tmp_path):
+    path = tmp_path / "values.txt"
+    path.write_bytes(b"a=1\nb=22\nbad\na=333\n")
+    matched, unmatched, (names, values) = parse_matching_lines(path, r"(\w)=(\d+)", [1, 2], [None, np.int32])
+    assert (matched, unmatched) == (3, 1)
+    assert names.tolist() == [b"a", b"b", b"a"]
+    assert values.dtype == np.int32
+    assert values.tolist() == [1, 22, 333]
+    assert check_for_matching_lines(path.read_text(), r"(\w)=(\d+)") == (3, 1)
+    with pytest.raises(ValueError):
+        parse_matching_lines(path, r"(\w)=(\d+)", [1, 2], [np.int32])
+
+
+def test_optional_groups():
+    text = "1,2\n3\n\n4,5\n"
+    matched, unmatched, (first, second) = parse_matching_lines(text, r"(\d+)(?:,(\d+))?", [1, 2], num_processes=1)
+    assert (matched, unmatched) == (3, 0)
+    assert first.tolist() == [1, 3, 4]
+    assert np.isnan(second[1])
+    assert second[[0, 2]].tolist() == [2, 5]
+    _, _, (values,) = parse_matching_lines(text, r"\d+(?:,(\d+))?", [1], [None], num_processes=1)
+    assert values.tolist() == [b"2", b"", b"5"]
+
+
+@pytest.mark.parametrize("num_processes", [1, 2])
+def test_missing_and_bad_values(num_processes):
+    text = "1,2\n3\n4,x\n5,99999999999\n6,7\n" * 3
+    sre = r"(\d+)(?:,(\w+))?"
+    args = dict(chunk_size=12, num_processes=num_processes)
+    matched, unmatched, (first, second) = parse_matching_lines(text, sre, [1, 2], [np.int16, np.int32], **args)
+    assert (matched, unmatched) == (15, 0)
+    assert first.tolist() == [1, 3, 4, 5, 6] * 3
+    assert second.dtype == np.int32
+    assert second.tolist() == [2, 0, 0, 0, 7] * 3
+
+    _, _, (second,) = parse_matching_lines(text, sre, [2], np.int64, fill_values=-1, **args)
+    assert second.tolist() == [2, -1, -1, 99999999999, 7] * 3
+    _, _, (second,) = parse_matching_lines(text, sre, [2], **args)
+    assert np.isnan(second[[1, 2]]).all()
+    assert second[[0, 3, 4]].tolist() == [2, 99999999999, 7]
+    _, _, (second,) = parse_matching_lines(text, sre, [2], [None], fill_values=[b"-"], **args)
+    assert second.tolist()[:5] == [b"2", b"-", b"x", b"99999999999", b"7"]
+    with pytest.raises(ValueError):
+        parse_matching_lines(text, sre, [1, 2], fill_values=[0])
+
+
+def test_check_for_matching_lines_uses_str_semantics():
+    text = "caf\u00e9=1\u2028\u00fc=2\n\nbad line\n"
+    assert check_for_matching_lines(text, r"(\w+)=(\d+)") == (2, 1)
+    assert parse_for_matching_lines(text, r"(\w+)=(\d+)", [1]) == ([["caf\u00e9"], ["\u00fc"]], 1)
+
+
+class TestLineStats:
+    @pytest.mark.parametrize("text", [
+        "h\u00e9llo w\u00f6rld\nabc\n",
+        "\u2603 snow\r\n  \u00fcber\n\t\U0001f600\n" + " " * 70 + "\u4e2d\nend",
+    ])
+    def test_non_ascii(self, text):
+        stats = LineStats(text)
+        lines = text.splitlines() + ([""] if text.endswith("\n") else [])
+        assert [text[s:e] for s, e in zip(stats.line_starts, stats.line_ends)] == lines
+        assert stats.indent.tolist() == [len(line) - len(line.lstrip(" ")) for line in lines]
+        starts = np.cumsum([0] + [len(p) for p in text.splitlines(True)])[:len(lines)].tolist()
+        for i, (start, line) in enumerate(zip(starts, lines)):
+            assert stats.index_of_line(i) == start
+            assert stats.line_of_index(start + len(line) // 2) == i
+        assert LineStats("h\u00e9llo w\u00f6rld\nabc\n").line_starts.tolist() == [0, 12, 16]
+        assert LineStats("h\u00e9llo w\u00f6rld\nabc\n").line_of_index(12) == 1
+
+    def test_lines(self):
+        text = "a\r\n  b\r\t c\n\n    "
+        stats = LineStats(np.frombuffer(text.encode(), dtype=np.uint8))
+        assert stats.num_lines == 5
+        assert [text[s:e] for s, e in zip(stats.line_starts, stats.line_ends)] == ["a", "  b", "\t c", "", "    "]
+        assert stats.indent.tolist() == [0, 2, 0, 0, 4]
+        assert stats.leading_whitespace.tolist() == [0, 2, 2, 0, 4]
+        assert stats.has_tab_indent.tolist() == [False, False, True, False, False]
+        assert stats.line_of_index(4) == 1
+        assert stats.line_of_index(6) == 1
+        assert stats.line_of_index(7) == 2
+        assert stats.index_of_line(2) == 7
+
+    def test_indent(self):
+        assert guessSpacesPerIndent("def a():\n    b\n    c\n        d\n") == 4
+        assert guessSpacesPerIndent("if x:\n  y\n  z\n") == 2
+        assert guessSpacesPerIndent("{\n\tx\n\ty\n}\n") == 0
+        assert guessSpacesPerIndent("no indent\n") == -1
+        assert guessSpacesPerIndent("") == -1
+
+    def test_long_indent(self):
+        text = " " * 100 + "x\n" + " " * 104 + "y\n"
+        stats = LineStats(text)
+        assert stats.indent.tolist() == [100, 104, 0]
+        assert stats.spaces_per_indent == 4
+
+
+class TestEncoding:
+    def test_detect(self):
+        assert detectBOM(b"\xff\xfe\x00\x00a\x00\x00\x00") == ("utf-32-le", b"\xff\xfe\x00\x00")
+        assert detectBOM(b"\xff\xfea\x00") == ("utf-16-le", b"\xff\xfe")
+        assert detectEncoding("text") == ("unicode", None)
+        assert detectEncoding(b"#!/usr/bin/python\n# -*- coding: iso-8859-15 -*-\n") == ("iso-8859-15", None)
+        assert guessEncoding("caf\xe9".encode("utf-8")) == ("utf-8", None)
+        assert guessEncoding("caf\xe9".encode("latin-1")) == ("latin-1", None)
+        # character split by the end of the header
+        assert guessEncoding("\xe9\xe9".encode("utf-8"), headersize=3) == ("utf-8", None)
+
+    @pytest.mark.parametrize("encoding,bom", [("utf-8", b"\xef\xbb\xbf"), ("utf-8", None), ("utf-16-le", b"\xff\xfe"), ("utf-32-be", b"\x00\x00\xfe\xff"), ("cp1252", None)])
+    @pytest.mark.parametrize("chunk_size", [1, 5, 1000])
+    def test_decode_text(self, encoding, bom, chunk_size):
+        text = "caf\xe9 \u20ac10\n" * 20 if encoding == "cp1252" else "caf\xe9 \u4e2d\U0001f600\n" * 20
+        data = np.frombuffer((bom or b"") + text.encode(encoding), dtype=np.uint8)
+        assert decode_text(data, encoding, bom, chunk_size=chunk_size) == text
+        with pytest.raises(UnicodeDecodeError):
+            decode_text(b"caf\xe9" * 10, "utf-8", chunk_size=chunk_size)
+        assert decode_text(b"", encoding) == ""
@@ -0,0 +1,70 @@
+import os
+import zipfile
+
+import pytest
+
+from sawx.utils import zipfs
+
+
+@pytest.fixture
+def archive(tmp_path):
+    path = str(tmp_path / "test!archive.zip")
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr("stored.bin", bytes(range(256)) * 100, compress_type=zipfile.ZIP_STORED)
+        zf.writestr("dir/deflated.txt", "line\n" * 100000, compress_type=zipfile.ZIP_DEFLATED)
+        zf.writestr("empty", b"", compress_type=zipfile.ZIP_DEFLATED)
+    return path
+
+
+def test_split(archive):
+    uri = zipfs.make_zip_uri(archive, "dir/deflated.txt")
+    assert zipfs.split_zip_path(uri[len(zipfs.uri_prefix):]) == (archive, "dir/deflated.txt")
+    with pytest.raises(FileNotFoundError):
+        zipfs.split_zip_path(archive)
+    with pytest.raises(FileNotFoundError):
+        zipfs.get_zip_index(archive).open("missing")
+
+
+@pytest.mark.parametrize("name", ["stored.bin", "dir/deflated.txt"])
+def test_random_access(archive, name):
+    with zipfile.ZipFile(archive) as zf:
+        expected = zf.read(name)
+    fh = zipfs.open_zip_uri(f"{archive}!/{name}")
+    fh.seek(1000)
+    assert fh.read(10) == expected[1000:1010]
+    fh.seek(-5, os.SEEK_END)
+    assert fh.read() == expected[-5:]
+    fh.seek(3)
+    assert fh.read(7) == expected[3:10]
+    fh.seek(0)
+    assert fh.read() == expected
+    assert fh.read(10) == b""
+    fh.close()
+
+
+def test_partial_decompression(archive, monkeypatch):
+    monkeypatch.setattr(zipfs.DecompressedMember, "block_size", 1000)
+    index = zipfs.get_zip_index(archive)
+    assert index is zipfs.get_zip_index(archive)
+    fh = index.open("dir/deflated.txt")
+    assert fh.read(10) == b"line\nline\n"
+    member = index.members["dir/deflated.txt"]
+    assert member.decompressed < member.size
+    fh.close()
+    assert index.open("empty").read() == b""
+    text = zipfs.open_zip_uri(f"{archive}!/dir/deflated.txt", "r")
+    assert text.readline() == "line\n"
+    with pytest.raises(ValueError):
+        zipfs.open_zip_uri(f"{archive}!/stored.bin", "wb")
+
+
+def test_index(archive):
+    index = zipfs.get_zip_index(archive)
+    assert "stored.bin" in index
+    assert index.contains_extension(".txt")
+    assert not index.contains_extension(".png")
+    with zipfile.ZipFile(archive, "a") as zf:
+        zf.writestr("new.png", b"png")
+    os.utime(archive, ns=(0, 0))
+    index = zipfs.get_zip_index(archive)
+    assert index.contains_extension(".png")